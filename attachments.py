@@ -0,0 +1,193 @@
+import binascii
+import hashlib
+import mimetypes
+import os
+from email.header import decode_header, make_header
+
+from mime_scan import decode_payload, walk_part_spans
+
+
+# Columns of the attachment manifests written next to the monthly outputs
+ATTACHMENT_HEADER = ["Date", "From", "Subject", "Message-ID", "Filename", "Content type", "Encoded bytes",
+                     "SHA-256", "Extracted file"]
+ATTACHMENTS_SUFFIX = "_attachments"
+# Encoded bytes hashed or decoded at a time, so an attachment is never copied whole
+ATTACHMENT_BLOCK_BYTES = 1024 * 1024
+# Whitespace and line breaks, which don't change base64 content
+_BASE64_WHITESPACE = b" \t\r\n"
+
+
+def attachment_manifest_path(output_file):
+    """Return the catalog name of the attachment manifest of a monthly output ("bob_2024-03.xlsx" -> "bob_2024-03_attachments.xlsx")."""
+    base, extension = os.path.splitext(output_file)
+    return base + ATTACHMENTS_SUFFIX + extension
+
+
+def is_attachment_manifest(file_path):
+    """Check whether a catalog output name is an attachment manifest."""
+    return os.path.splitext(file_path)[0].endswith(ATTACHMENTS_SUFFIX)
+
+
+def manifest_output_file(manifest_file):
+    """Return the monthly output an attachment manifest belongs to (the inverse of `attachment_manifest_path`)."""
+    base, extension = os.path.splitext(manifest_file)
+    return base[:-len(ATTACHMENTS_SUFFIX)] + extension
+
+
+def attachment_filename(part_headers):
+    """
+    Returns the file name of an attachment part.
+
+    Handles RFC 2231 parameters and the encoded words ("=?utf-8?...?=") many
+    mail clients use for non-ASCII names.
+
+    Returns:
+        str: The file name, or None if the part has none.
+    """
+    name = part_headers.get_filename() or part_headers.get_param("name")
+    if isinstance(name, tuple):  # RFC 2231 value that get_param leaves undecoded
+        name = name[2]
+    if not name:
+        return None
+    name = str(name)
+    if "=?" in name:
+        try:
+            name = str(make_header(decode_header(name)))
+        except (ValueError, LookupError, UnicodeDecodeError):
+            pass
+    return name.strip() or None
+
+
+def find_attachments(headers, body):
+    """
+    Yields the attachment parts of a message, without decoding them.
+
+    An attachment is any leaf part with an "attachment" disposition or a file
+    name (inline images included).
+
+    Args:
+        headers (email.message.Message): Headers of the message, from `parse_headers`.
+        body (bytes): Raw body of the message.
+
+    Yields:
+        tuple[email.message.Message, memoryview]: Headers and encoded body of each
+        attachment. The body is a view into `body`, not a copy.
+    """
+    view = memoryview(body)
+    for part_headers, start, end in walk_part_spans(headers, body):
+        if part_headers.get_content_maintype() == "multipart":
+            continue
+        disposition = str(part_headers.get("Content-Disposition", "")).lower()
+        if "attachment" in disposition or attachment_filename(part_headers) is not None:
+            yield part_headers, view[start:end]
+
+
+def _is_base64(part_headers):
+    return str(part_headers.get("Content-Transfer-Encoding", "")).strip().lower() == "base64"
+
+
+def _blocks(part_body):
+    for start in range(0, len(part_body), ATTACHMENT_BLOCK_BYTES):
+        yield part_body[start:start + ATTACHMENT_BLOCK_BYTES]
+
+
+def encoded_hash(part_headers, part_body):
+    """
+    Hashes an attachment as it is stored in the message, without decoding it.
+
+    Line breaks are left out of base64 content, so the same file sent with
+    different line lengths (or CRLF line ends) gets the same hash. The body is
+    hashed a block at a time.
+
+    Args:
+        part_headers (email.message.Message): Headers of the attachment part.
+        part_body (bytes | memoryview): Encoded body of the attachment.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    if _is_base64(part_headers):
+        for block in _blocks(part_body):
+            digest.update(bytes(block).translate(None, _BASE64_WHITESPACE))
+    else:
+        digest.update(part_body)
+    return digest.hexdigest()
+
+
+def extracted_path(store_dir, digest, content_type, filename):
+    """
+    Returns where an attachment is stored by content-addressed extraction.
+
+    Files are named by their hash, so each distinct attachment is written
+    once however many messages and mailboxes carry it. The extension comes from
+    the content type (or the file name), so the files open with the right program.
+
+    Returns:
+        str: `store_dir/ab/abcdef....pdf`
+    """
+    extension = mimetypes.guess_extension(content_type or "") or ""
+    if not extension and filename:
+        extension = os.path.splitext(filename)[1].lower()[:10]
+    return os.path.join(store_dir, digest[:2], digest + extension)
+
+
+def _write_decoded(part_headers, part_body, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Workers may extract the same attachment at once; each writes its own
+    # temporary file and the rename is atomic
+    temp_path = f"{path}.{os.getpid()}.partial"
+    with open(temp_path, 'wb') as f:
+        if _is_base64(part_headers):
+            # Decoded a block at a time, so a large attachment is never held decoded in memory.
+            # Characters past the last group of 4 are carried over to the next block
+            pending = b""
+            for block in _blocks(part_body):
+                encoded = pending + bytes(block).translate(None, _BASE64_WHITESPACE)
+                usable = len(encoded) - len(encoded) % 4
+                try:
+                    f.write(binascii.a2b_base64(encoded[:usable]))
+                except binascii.Error:
+                    pending = b""
+                    break  # Damaged content: keep what could be decoded
+                pending = encoded[usable:]
+            if pending:
+                try:
+                    f.write(binascii.a2b_base64(pending))
+                except binascii.Error:
+                    pass  # Truncated tail
+        else:
+            f.write(decode_payload(part_headers, bytes(part_body)) or b"")
+    os.replace(temp_path, path)
+
+
+def scan_attachments(headers, body, store_dir=None):
+    """
+    Lists the attachments of a message and optionally extracts them.
+
+    Only part headers are parsed and the encoded bytes hashed. Attachments are
+    decoded only when they are extracted, and only the first time their hash is seen.
+
+    Args:
+        headers (email.message.Message): Headers of the message, from `parse_headers`.
+        body (bytes): Raw body of the message (newlines already normalised to \\n).
+        store_dir (str): Directory for content-addressed extraction, or None to only list.
+
+    Returns:
+        list[dict]: "part", "filename", "content_type", "encoded_size" and "sha256" per
+        attachment, plus "extracted" (the stored file) when extracting.
+    """
+    found = []
+    for number, (part_headers, part_body) in enumerate(find_attachments(headers, body)):
+        content_type = part_headers.get_content_type()
+        filename = attachment_filename(part_headers)
+        digest = encoded_hash(part_headers, part_body)
+        attachment = {"part": number, "filename": filename, "content_type": content_type,
+                      "encoded_size": len(part_body), "sha256": digest}
+        if store_dir is not None:
+            path = extracted_path(store_dir, digest, content_type, filename)
+            if not os.path.exists(path):
+                _write_decoded(part_headers, part_body, path)
+            attachment["extracted"] = path
+        found.append(attachment)
+    return found
@@ -0,0 +1,357 @@
+"""
+Benchmark suite for the converter and chunky.py on a synthetic mailbox.
+
+Every stage is timed on its own (splitting, parsing, date bucketing, with the
+old date parsing for comparison, filtering, keyword matching, workbook writing,
+chunky) and end to end. Each case runs in a fresh
+process, so its peak memory is its own. Results are written as JSON and can
+be compared with an earlier run. Run from the repository root:
+
+    python -m benchmarks.bench_converter --messages 5000 --output results.json
+    python -m benchmarks.bench_converter --compare results.json
+"""
+import argparse
+import contextlib
+import json
+import mmap
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.synthetic_mbox import DEFAULT_SETTINGS, generate_mbox
+from instrumentation import peak_rss_mb
+
+# Benchmark configuration
+REPEATS = 1  # Runs per case; the fastest is reported
+SPLIT_CHUNK_MB = 64  # Chunk size for the split case, so mid-size mailboxes are cut more than once
+ROWS_PER_CHUNK = 5000  # chunky.py chunk size used by the chunky cases
+
+
+def _raw_messages(mbox_file):
+    from mbox_index import chunk_spans
+    with open(mbox_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [mm[start:start + length] for start, length in chunk_spans(mbox_file)]
+
+
+def _parsed_messages(raws):
+    from mime_scan import find_text_body, parse_headers, split_raw_message
+    parsed = []
+    for raw in raws:
+        header_block, body = split_raw_message(raw.replace(b"\r\n", b"\n"))
+        headers = parse_headers(header_block)
+        text = find_text_body(headers, body)
+        parsed.append((headers.get('From', '').strip().lower(), headers.get('Subject', '').strip(),
+                       text.decode(errors='ignore') if text is not None else ""))
+    return parsed
+
+
+def _kept_rows(raws):
+    import mbox_convert
+    rows = []
+    for raw in raws:
+        result = mbox_convert.process_message(raw, mbox_convert.keyword_matcher)
+        if result["status"] == "row":
+            rows.append(result["row"] + ["synthetic"])
+    return rows
+
+
+def _write_workbook(file_path, rows):
+    from sinks import XlsxSink
+    workbook = XlsxSink(file_path)
+    for row in rows:
+        workbook.append(row)
+    workbook.save()
+
+
+# Each case prepares its input (untimed) and returns (run, messages, bytes): `run`
+# is the timed work, and messages and bytes are the input it covers.
+
+def case_split(context):
+    import mbox_convert
+    chunk_dir = os.path.join(context["workdir"], "split_chunks")
+
+    def run():
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        mbox_convert.split_mbox_by_size(context["mbox"], chunk_dir, SPLIT_CHUNK_MB / 1024)
+    return run, context["messages"], context["bytes"]
+
+
+def case_parse(context):
+    raws = _raw_messages(context["mbox"])
+    return lambda: _parsed_messages(raws), len(raws), sum(len(raw) for raw in raws)
+
+
+def case_filter(context):
+    import mbox_convert
+    parsed = _parsed_messages(_raw_messages(context["mbox"]))
+
+    def run():
+        for email_from, subject, body in parsed:
+            mbox_convert.is_spam_or_advertisement(email_from, subject, mbox_convert.remove_quoted_lines(body))
+    return run, len(parsed), sum(len(body) for _, _, body in parsed)
+
+
+def case_match(context):
+    import mbox_convert
+    parsed = _parsed_messages(_raw_messages(context["mbox"]))
+
+    def run():
+        for _, subject, body in parsed:
+            mbox_convert.keyword_matcher.search(subject, body)
+    return run, len(parsed), sum(len(body) for _, _, body in parsed)
+
+
+def case_process(context):
+    import mbox_convert
+    raws = _raw_messages(context["mbox"])
+
+    def run():
+        for raw in raws:
+            mbox_convert.process_message(raw, mbox_convert.keyword_matcher)
+    return run, len(raws), sum(len(raw) for raw in raws)
+
+
+def _date_headers(raws):
+    from mime_scan import parse_headers, split_raw_message
+    return [parse_headers(split_raw_message(raw)[0]).get('Date', '') for raw in raws]
+
+
+def case_dates(context):
+    from date_buckets import DateBucketer
+    dates = _date_headers(_raw_messages(context["mbox"]))
+
+    def run():
+        bucketer = DateBucketer()  # Cold cache on every run
+        for date in dates:
+            bucketer.bucket(date)
+    return run, len(dates), sum(len(date) for date in dates)
+
+
+def case_dates_legacy(context):
+    from email.utils import parsedate_to_datetime
+    dates = _date_headers(_raw_messages(context["mbox"]))
+
+    def run():
+        # Date parsing as the converter did it before date_buckets.py
+        for date in dates:
+            try:
+                formatted = parsedate_to_datetime(date).strftime('%Y-%m-%d %H:%M:%S')
+            except Exception:
+                formatted = "Unknown"
+            year, month = formatted.split('-')[0], formatted.split('-')[1] if formatted != "Unknown" else ("Unknown", "Unknown")
+    return run, len(dates), sum(len(date) for date in dates)
+
+
+def case_write_xlsx(context):
+    rows = _kept_rows(_raw_messages(context["mbox"]))
+    file_path = os.path.join(context["workdir"], "write.xlsx")
+    return lambda: _write_workbook(file_path, rows), len(rows), sum(len(row[3]) for row in rows)
+
+
+def _chunky_case(context, streaming):
+    import chunky
+    rows = _kept_rows(_raw_messages(context["mbox"]))
+    chunky.FILE_PATH = os.path.join(context["workdir"], "chunky_input.xlsx")
+    chunky.OUTPUT_DIR = os.path.join(context["workdir"], "chunky_output")
+    chunky.ROWS_PER_CHUNK = ROWS_PER_CHUNK
+    _write_workbook(chunky.FILE_PATH, rows)
+
+    def run():
+        shutil.rmtree(chunky.OUTPUT_DIR, ignore_errors=True)
+        chunky.emails_filtered_out = 0
+        chunky.split_excel_streaming() if streaming else chunky.split_excel()
+    return run, len(rows), os.path.getsize(chunky.FILE_PATH)
+
+
+def case_chunky_split_excel(context):
+    return _chunky_case(context, streaming=False)
+
+
+def case_chunky_streaming(context):
+    return _chunky_case(context, streaming=True)
+
+
+def case_end_to_end(context):
+    import mbox_convert
+    root = os.path.join(context["workdir"], "end_to_end")
+    mbox_convert.set_data_directory(root)
+
+    def run():
+        shutil.rmtree(root, ignore_errors=True)
+        mail_dir = os.path.join(root, "synthetic", "Takeout", "Mail")
+        os.makedirs(mail_dir)
+        shutil.copyfile(context["mbox"], os.path.join(mail_dir, "All mail.mbox"))
+        mbox_convert.find_and_convert_mbox_files(root, workers=context["workers"])
+    return run, context["messages"], context["bytes"]
+
+
+CASES = {
+    "split": case_split,
+    "parse": case_parse,
+    "filter": case_filter,
+    "match": case_match,
+    "dates": case_dates,
+    "dates_legacy": case_dates_legacy,
+    "process_message": case_process,
+    "write_xlsx": case_write_xlsx,
+    "chunky_split_excel": case_chunky_split_excel,
+    "chunky_streaming": case_chunky_streaming,
+    "end_to_end": case_end_to_end,
+}
+
+
+def _run_case(name, context, connection):
+    # Runs in a fresh process; the converter's progress output is not part of the result
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            run, messages, size = CASES[name](context)
+            setup_peak = peak_rss_mb()
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            run()
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        connection.send({
+            "case": name,
+            "seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "messages": messages,
+            "bytes": size,
+            "messages_per_second": round(messages / wall, 1) if wall else None,
+            "mb_per_second": round(size / (1024 * 1024) / wall, 2) if wall else None,
+            "setup_peak_rss_mb": setup_peak,
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(children=True),
+        })
+    except Exception as e:
+        connection.send({"case": name, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        connection.close()
+
+
+def run_case(name, context):
+    """Runs one case in a fresh process and returns its result dict."""
+    spawn = multiprocessing.get_context("spawn")
+    receiver, sender = spawn.Pipe(duplex=False)
+    process = spawn.Process(target=_run_case, args=(name, context, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"case": name, "error": f"Benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(case_names, settings, workers=1, repeats=REPEATS, workdir=None):
+    """
+    Generates the synthetic mailbox and runs the selected cases on it.
+
+    Args:
+        case_names (list[str]): Keys of CASES to run, in order.
+        settings (dict): Mailbox settings, see `synthetic_mbox.DEFAULT_SETTINGS`.
+        workers (int): Worker processes for the end-to-end case.
+        repeats (int): Runs per case; the fastest is kept.
+        workdir (str): Directory for the mailbox and outputs. A temporary one by default.
+
+    Returns:
+        dict: The report, ready to be written as JSON.
+    """
+    with tempfile.TemporaryDirectory(prefix="mbox_bench_", dir=workdir) as tmp:
+        mbox_file = os.path.join(tmp, "synthetic.mbox")
+        mailbox = generate_mbox(mbox_file, **settings)
+        context = {"mbox": mbox_file, "workdir": tmp, "messages": mailbox["messages"],
+                   "bytes": mailbox["bytes"], "workers": workers}
+        print(f"Synthetic mailbox: {mailbox['messages']} messages, {mailbox['bytes'] / (1024 * 1024):.1f} MB")
+
+        results = []
+        for name in case_names:
+            runs = [run_case(name, context) for _ in range(repeats)]
+            ok = [result for result in runs if "error" not in result]
+            result = min(ok, key=lambda result: result["seconds"]) if ok else runs[0]
+            results.append(result)
+            if "error" in result:
+                print(f"{name:<20} ERROR: {result['error']}")
+            else:
+                print(f"{name:<20} {result['seconds']:8.3f} s  {result['messages_per_second']:10.1f} msg/s  "
+                      f"{result['mb_per_second']:8.2f} MB/s  peak {result['peak_rss_mb']} MB")
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "repeats": repeats,
+        "mailbox": {key: list(value) if isinstance(value, tuple) else value for key, value in mailbox.items()},
+        "cases": results,
+    }
+
+
+def compare(report, baseline):
+    """Prints the change in time and peak memory of each case against an earlier report."""
+    previous = {result["case"]: result for result in baseline.get("cases", []) if "error" not in result}
+    if report["mailbox"] != baseline.get("mailbox"):
+        print("WARNING: The baseline was run on a different mailbox; the numbers are not comparable.")
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('created')}):")
+    for result in report["cases"]:
+        before = previous.get(result["case"])
+        if before is None or "error" in result:
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        memory = ""
+        if result.get("peak_rss_mb") is not None and before.get("peak_rss_mb") is not None:
+            memory = f"  peak {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB"
+        print(f"{result['case']:<20} {before['seconds']:8.3f} s -> {result['seconds']:8.3f} s ({change:+6.1f}%){memory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the converter and chunky.py on a synthetic mailbox.")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES),
+                        help="Cases to run. Default: all")
+    parser.add_argument("--messages", type=int, default=DEFAULT_SETTINGS["messages"],
+                        help=f"Messages in the synthetic mailbox. Default: {DEFAULT_SETTINGS['messages']}")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SETTINGS["seed"], help="Generator seed")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a mailbox setting, e.g. attachment_ratio=0.5 or body_words=50,500 (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the end-to-end case. Default: 1")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help=f"Runs per case. Default: {REPEATS}")
+    parser.add_argument("--workdir", help="Directory for temporary files. Default: the system temp directory")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results in this JSON file")
+    args = parser.parse_args()
+
+    settings = {"messages": args.messages, "seed": args.seed}
+    for setting in args.setting:
+        name, _, value = setting.partition("=")
+        if name not in DEFAULT_SETTINGS:
+            parser.error(f"unknown setting {name!r}")
+        default = DEFAULT_SETTINGS[name]
+        if isinstance(default, tuple):
+            settings[name] = tuple(int(part) for part in value.split(","))
+        elif isinstance(default, str):
+            settings[name] = value
+        else:
+            settings[name] = type(default)(value)
+
+    report = run_suite(args.cases, settings, workers=args.workers, repeats=args.repeats, workdir=args.workdir)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
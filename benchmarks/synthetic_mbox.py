@@ -0,0 +1,160 @@
+"""
+Deterministic synthetic mbox generator for the benchmarks.
+
+The same settings and seed always produce byte-identical mailboxes, so runs on
+different machines or commits measure the same input. Run from the repository root:
+
+    python -m benchmarks.synthetic_mbox out.mbox --messages 20000 --attachment-ratio 0.3
+"""
+import argparse
+import base64
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from mbox_convert import keywords, spam_keywords
+
+# Default mailbox shape
+DEFAULT_SETTINGS = {
+    "messages": 5000,
+    "multipart_ratio": 0.4,  # Share of messages with a text/plain and a text/html alternative
+    "attachment_ratio": 0.15,  # Share of messages with a base64 attachment
+    "attachment_kb": (10, 150),  # Attachment size range
+    "body_words": (20, 400),  # Body length range
+    "quoted_ratio": 0.35,  # Share of messages that quote an earlier message
+    "spam_ratio": 0.1,  # Share of messages with spam terms or a blocked sender
+    "keyword_ratio": 0.2,  # Share of messages that mention one of the converter's keywords
+    "duplicate_ratio": 0.05,  # Share of messages that repeat an earlier Message-ID
+    "bad_date_ratio": 0.02,  # Share of messages whose Date header can't be parsed
+    "date_start": "2022-01-01",
+    "date_days": 730,  # Dates are spread evenly over this many days
+    "seed": 182,
+}
+
+WORDS = ["the", "order", "cabinet", "maple", "finish", "shipping", "tomorrow", "already", "freeze",
+         "address", "thanks", "please", "invoice", "drawer", "quote", "install", "hinge", "delay",
+         "measure", "sample", "crew", "site", "kitchen", "panel", "stain", "pickup", "week", "schedule"]
+SENDERS = ["anna@millwork.example", "ben@cabinets.example", "carla@builder.example", "dev@supply.example",
+           "eli@design.example", "fay@install.example"]
+SPAM_SENDERS = ["deals@shop.promo", "news@marketing.com", "noreply@homesteadcabinet.net"]
+
+
+def _words(rng, count, extra=()):
+    words = [rng.choice(WORDS) for _ in range(count)]
+    for term in extra:
+        words[rng.randrange(len(words))] = term
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return "\n".join(lines)
+
+
+def _base64_lines(data):
+    encoded = base64.b64encode(data).decode("ascii")
+    return "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+
+def generate_message(rng, number, settings, start_date, message_ids):
+    """
+    Builds the raw text of one message (without the mbox "From " line).
+
+    Args:
+        rng (random.Random): Generator that decides everything about the message.
+        number (int): Position of the message in the mailbox.
+        settings (dict): Mailbox shape, see DEFAULT_SETTINGS.
+        start_date (datetime): Date of the oldest message.
+        message_ids (list[str]): Message-IDs generated so far; duplicates reuse one.
+
+    Returns:
+        str: The message.
+    """
+    is_spam = rng.random() < settings["spam_ratio"]
+    sender = rng.choice(SPAM_SENDERS) if is_spam and rng.random() < 0.5 else rng.choice(SENDERS)
+    extra_terms = []
+    if is_spam:
+        extra_terms.append(rng.choice(spam_keywords))
+    if rng.random() < settings["keyword_ratio"]:
+        extra_terms.append(rng.choice(keywords))
+
+    body = _words(rng, rng.randint(*settings["body_words"]), extra_terms)
+    if rng.random() < settings["quoted_ratio"]:
+        quoted = _words(rng, rng.randint(10, 80))
+        body += f"\n\nOn Mon, 3 Jan 2022 at 09:00, {rng.choice(SENDERS)} wrote:\n" + \
+                "\n".join("> " + line for line in quoted.splitlines())
+
+    if rng.random() < settings["bad_date_ratio"]:
+        date = "sometime last week"
+    else:
+        seconds = rng.randrange(max(1, settings["date_days"]) * 86400)
+        date = format_datetime(start_date + timedelta(seconds=seconds))
+
+    if message_ids and rng.random() < settings["duplicate_ratio"]:
+        message_id = rng.choice(message_ids)
+    else:
+        message_id = f"<{number}.{rng.getrandbits(32):08x}@synthetic.example>"
+        message_ids.append(message_id)
+
+    subject = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 7)))
+    if is_spam and rng.random() < 0.5:
+        subject += " " + rng.choice(spam_keywords)
+    headers = (f"From: {sender}\nTo: office@cabinets.example\nSubject: {subject}\nDate: {date}\n"
+               f"Message-ID: {message_id}\nMIME-Version: 1.0\n")
+
+    text_part = f"Content-Type: text/plain; charset=utf-8\nContent-Transfer-Encoding: 8bit\n\n{body}\n"
+    if rng.random() < settings["multipart_ratio"]:
+        html = "<html><body><p>" + body.replace("\n", "<br>\n") + "</p></body></html>"
+        content = (f"Content-Type: multipart/alternative; boundary=\"alt-{number}\"\n\n"
+                   f"--alt-{number}\n{text_part}--alt-{number}\n"
+                   f"Content-Type: text/html; charset=utf-8\n\n{html}\n--alt-{number}--\n")
+    else:
+        content = text_part
+
+    if rng.random() < settings["attachment_ratio"]:
+        size = rng.randint(*settings["attachment_kb"]) * 1024
+        attachment = _base64_lines(rng.randbytes(size))
+        content = (f"Content-Type: multipart/mixed; boundary=\"mix-{number}\"\n\n"
+                   f"--mix-{number}\n{content}--mix-{number}\n"
+                   f"Content-Type: application/pdf; name=\"drawing-{number}.pdf\"\n"
+                   f"Content-Disposition: attachment; filename=\"drawing-{number}.pdf\"\n"
+                   f"Content-Transfer-Encoding: base64\n\n{attachment}\n--mix-{number}--\n")
+
+    return headers + content
+
+
+def generate_mbox(path, **settings):
+    """
+    Writes a synthetic mbox file.
+
+    Args:
+        path (str): Where to write the mailbox.
+        **settings: Overrides for DEFAULT_SETTINGS.
+
+    Returns:
+        dict: The settings used and the "bytes" written.
+    """
+    settings = dict(DEFAULT_SETTINGS, **settings)
+    rng = random.Random(settings["seed"])
+    start_date = datetime.fromisoformat(settings["date_start"]).replace(tzinfo=timezone.utc)
+    message_ids = []
+    written = 0
+    with open(path, 'wb') as f:
+        for number in range(settings["messages"]):
+            message = generate_message(rng, number, settings, start_date, message_ids)
+            data = f"From sender@synthetic.example Mon Jan  3 09:00:00 2022\n{message}\n".encode("utf-8")
+            f.write(data)
+            written += len(data)
+    return dict(settings, bytes=written)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic mbox file.")
+    parser.add_argument("path", help="Output mbox file")
+    for name, default in DEFAULT_SETTINGS.items():
+        if isinstance(default, tuple):
+            parser.add_argument("--" + name.replace("_", "-"), type=int, nargs=2, default=default,
+                                metavar=("MIN", "MAX"), help=f"Default: {default[0]} {default[1]}")
+        else:
+            parser.add_argument("--" + name.replace("_", "-"), type=type(default), default=default,
+                                help=f"Default: {default}")
+    args = parser.parse_args()
+
+    result = generate_mbox(args.path, **{name: getattr(args, name) for name in DEFAULT_SETTINGS})
+    print(f"Wrote {result['messages']} messages ({result['bytes'] / (1024 * 1024):.1f} MB) to {args.path}")
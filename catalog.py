@@ -0,0 +1,568 @@
+import hashlib
+import os
+import sqlite3
+
+
+# Bytes hashed from each end of a source mbox for its fingerprint
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+# SQLite limits the number of parameters in one statement
+QUERY_BATCH_SIZE = 500
+# Setting that holds the highest message id the full-text index has caught up with
+FULL_TEXT_INDEXED = "full_text_indexed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    root_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    source_id INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    PRIMARY KEY (source_id, chunk)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    root_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    message_id TEXT,
+    source_id INTEGER,
+    chunk INTEGER,
+    byte_offset INTEGER,
+    length INTEGER,
+    dedup_key TEXT,
+    status TEXT NOT NULL,
+    output_file TEXT,
+    is_door INTEGER NOT NULL DEFAULT 0,
+    email_from TEXT,
+    subject TEXT,
+    date TEXT,
+    body TEXT,
+    parent_ids TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_content_hash ON messages (root_name, content_hash);
+CREATE INDEX IF NOT EXISTS messages_output_file ON messages (output_file);
+CREATE INDEX IF NOT EXISTS messages_dedup_key ON messages (dedup_key);
+CREATE TABLE IF NOT EXISTS message_mailboxes (
+    dedup_key TEXT NOT NULL,
+    root_name TEXT NOT NULL,
+    PRIMARY KEY (dedup_key, root_name)
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    message INTEGER NOT NULL,
+    part INTEGER NOT NULL,
+    filename TEXT,
+    content_type TEXT,
+    encoded_size INTEGER,
+    sha256 TEXT,
+    extracted TEXT,
+    PRIMARY KEY (message, part)
+);
+CREATE INDEX IF NOT EXISTS attachments_sha256 ON attachments (sha256);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    dirty INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Full-text index over the subject and body of every kept row. The text lives in
+# `messages` (external content) and the rowid is the message id, which carries the
+# storage location. New rows are indexed in bulk (`index_new_rows`); the trigger
+# indexes failed messages that a replay turns into rows.
+FULL_TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, body, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+DROP TRIGGER IF EXISTS messages_fts_insert;
+CREATE TRIGGER IF NOT EXISTS messages_fts_resolve AFTER UPDATE OF status ON messages
+WHEN new.status = 'row' AND old.status != 'row' BEGIN
+    INSERT INTO messages_fts (rowid, subject, body) VALUES (new.id, new.subject, new.body);
+END;
+"""
+
+# Output row with the sorted list of mailboxes each message was found in
+ROW_QUERY = """
+SELECT m.email_from, m.subject, m.date, m.body,
+       COALESCE((SELECT group_concat(root_name, ', ') FROM
+                 (SELECT root_name FROM message_mailboxes WHERE dedup_key = m.dedup_key ORDER BY root_name)),
+                m.root_name)
+FROM messages m
+"""
+
+
+def content_hash(raw):
+    """Return the catalog key for the raw bytes of one message."""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def source_fingerprint(path):
+    """
+    Fingerprints a source mbox file without reading all of it.
+
+    Args:
+        path (str): Path to the mbox file.
+
+    Returns:
+        tuple: (size, mtime, hash) where the hash covers the size and the first
+        and last `FINGERPRINT_SAMPLE_BYTES` of the file.
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(str(stat.st_size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if stat.st_size > FINGERPRINT_SAMPLE_BYTES:
+            f.seek(max(FINGERPRINT_SAMPLE_BYTES, stat.st_size - FINGERPRINT_SAMPLE_BYTES))
+            digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    return stat.st_size, stat.st_mtime, digest.hexdigest()
+
+
+class ProcessingCatalog:
+    """
+    On-disk SQLite record of what has already been converted.
+
+    It tracks each source mbox (size, mtime, hash), each completed chunk and each
+    processed message, together with the row that message produced. The
+    spreadsheets are exported from the catalog, so a crashed or repeated run
+    only has to process the messages it has not seen yet.
+
+    Kept rows are also added to a full-text index (in bulk, once per chunk), so
+    the converted mail can be searched without rerunning the conversion.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Created if missing.
+
+    Attributes:
+        full_text (bool): False when this SQLite build has no FTS5 support.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._add_missing_columns()
+        self.connection.executescript(SCHEMA)
+        self.full_text = self._create_full_text_index()
+        self.connection.commit()
+
+    def _add_missing_columns(self):
+        # Catalogs created by older versions lack some columns
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(messages)")}
+        if columns and "dedup_key" not in columns:
+            self.connection.execute("ALTER TABLE messages ADD COLUMN dedup_key TEXT")
+        if columns and "parent_ids" not in columns:
+            self.connection.execute("ALTER TABLE messages ADD COLUMN parent_ids TEXT")
+
+    def _create_full_text_index(self):
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+        try:
+            self.connection.executescript(FULL_TEXT_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"WARNING: Full-text search is not available in this SQLite build ({e}).")
+            return False
+        if not exists:
+            # Catalogs created by older versions: index the rows recorded so far
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO messages_fts (rowid, subject, body) "
+                    "SELECT id, subject, body FROM messages WHERE status = 'row'")
+                self._set_indexed_up_to(self._last_message_id())
+        elif self.setting(FULL_TEXT_INDEXED) is None:
+            # Catalogs created by older versions indexed every row as it was recorded
+            with self.connection:
+                self._set_indexed_up_to(self._last_message_id())
+        return True
+
+    def _last_message_id(self):
+        return self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def _set_indexed_up_to(self, message_id):
+        self.connection.execute(
+            "INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (FULL_TEXT_INDEXED, str(message_id)))
+
+    def index_new_rows(self):
+        """
+        Adds the kept rows recorded since the last call to the full-text index, in one statement.
+
+        Returns:
+            int: The number of rows indexed.
+        """
+        if not self.full_text:
+            return 0
+        indexed_up_to = int(self.setting(FULL_TEXT_INDEXED) or 0)
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO messages_fts (rowid, subject, body) "
+                "SELECT id, subject, body FROM messages WHERE id > ? AND status = 'row'", (indexed_up_to,))
+            self._set_indexed_up_to(max(indexed_up_to, self._last_message_id()))
+        return cursor.rowcount
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def source_is_complete(self, path, fingerprint):
+        """Check whether a source mbox was fully processed and has not changed since."""
+        row = self.connection.execute(
+            "SELECT size, mtime, hash, complete FROM sources WHERE path = ?", (path,)).fetchone()
+        return row is not None and tuple(row[:3]) == tuple(fingerprint) and bool(row[3])
+
+    def begin_source(self, path, root_name, fingerprint):
+        """
+        Registers a source mbox before it is processed.
+
+        If the file changed since the last run, its completed chunks are forgotten
+        (the chunks will be cut again), but its processed messages are kept so
+        only new messages are converted.
+
+        Returns:
+            int: The source id.
+        """
+        size, mtime, file_hash = fingerprint
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT id, size, mtime, hash FROM sources WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                cursor = self.connection.execute(
+                    "INSERT INTO sources (path, root_name, size, mtime, hash) VALUES (?, ?, ?, ?, ?)",
+                    (path, root_name, size, mtime, file_hash))
+                return cursor.lastrowid
+
+            source_id = row[0]
+            if tuple(row[1:]) != tuple(fingerprint):
+                self.connection.execute(
+                    "UPDATE sources SET size = ?, mtime = ?, hash = ?, complete = 0 WHERE id = ?",
+                    (size, mtime, file_hash, source_id))
+                self.connection.execute("DELETE FROM chunks WHERE source_id = ?", (source_id,))
+            return source_id
+
+    def complete_source(self, source_id):
+        """Mark a source mbox as fully processed."""
+        with self.connection:
+            self.connection.execute("UPDATE sources SET complete = 1 WHERE id = ?", (source_id,))
+
+    def chunk_is_complete(self, source_id, chunk):
+        """Check whether every message of a chunk has been recorded."""
+        return self.connection.execute(
+            "SELECT 1 FROM chunks WHERE source_id = ? AND chunk = ?", (source_id, chunk)).fetchone() is not None
+
+    def complete_chunk(self, source_id, chunk):
+        """Mark a chunk as fully processed."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO chunks (source_id, chunk) VALUES (?, ?)", (source_id, chunk))
+
+    def known_hashes(self, root_name, hashes):
+        """Return the subset of message content hashes already processed for a root directory."""
+        known = set()
+        hashes = list(hashes)
+        for i in range(0, len(hashes), QUERY_BATCH_SIZE):
+            batch = hashes[i:i + QUERY_BATCH_SIZE]
+            known.update(value for (value,) in self.connection.execute(
+                f"SELECT content_hash FROM messages WHERE root_name = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                [root_name] + batch))
+        return known
+
+    def known_dedup_keys(self, dedup_keys):
+        """Return the subset of deduplication keys of messages already processed (not only noted as a copy) in any mailbox."""
+        known = set()
+        dedup_keys = list(dedup_keys)
+        for i in range(0, len(dedup_keys), QUERY_BATCH_SIZE):
+            batch = dedup_keys[i:i + QUERY_BATCH_SIZE]
+            known.update(value for (value,) in self.connection.execute(
+                f"SELECT DISTINCT dedup_key FROM messages WHERE dedup_key IN ({','.join('?' * len(batch))}) "
+                f"AND status != 'duplicate'", batch))
+        return known
+
+    def dedup_keys(self):
+        """Iterate over the deduplication keys of every processed message."""
+        return (key for (key,) in self.connection.execute(
+            "SELECT DISTINCT dedup_key FROM messages WHERE dedup_key IS NOT NULL"))
+
+    def record_messages(self, records):
+        """
+        Records a batch of processed messages in one transaction.
+
+        Args:
+            records (list[dict]): One dict per message with the `messages` columns
+                (root_name, content_hash, message_id, source_id, chunk, byte_offset,
+                length, dedup_key, status, output_file, is_door, email_from, subject,
+                date, body, parent_ids). Missing columns are stored as NULL. Kept rows
+                may also carry their "attachments" (see `attachments.scan_attachments`). Records with status
+                "duplicate" add their root directory to the mailboxes of the kept copy.
+
+        Returns:
+            list[tuple[str, bool]]: (output_file, is_door) of kept rows that were found
+            in a new mailbox, so their outputs can be marked dirty.
+        """
+        columns = ("root_name", "content_hash", "message_id", "source_id", "chunk", "byte_offset", "length",
+                   "dedup_key", "status", "output_file", "is_door", "email_from", "subject", "date", "body", "parent_ids")
+        rows = [tuple(record.get(column) if column != "is_door" else int(bool(record.get(column)))
+                      for column in columns) for record in records]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO messages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows)
+
+            found_again = []
+            for record in records:
+                if record.get("dedup_key"):
+                    cursor = self.connection.execute(
+                        "INSERT OR IGNORE INTO message_mailboxes (dedup_key, root_name) VALUES (?, ?)",
+                        (record["dedup_key"], record["root_name"]))
+                    if cursor.rowcount and record["status"] == "duplicate":
+                        found_again.append(record["dedup_key"])
+
+            self._record_attachments(records)
+
+            affected = []
+            for i in range(0, len(found_again), QUERY_BATCH_SIZE):
+                batch = found_again[i:i + QUERY_BATCH_SIZE]
+                affected.extend((output_file, bool(is_door)) for output_file, is_door in self.connection.execute(
+                    f"SELECT output_file, is_door FROM messages WHERE status = 'row' "
+                    f"AND dedup_key IN ({','.join('?' * len(batch))})", batch))
+        return affected
+
+    def resolve_failures(self, records):
+        """
+        Replaces failed messages with the outcome of processing them again.
+
+        Args:
+            records (list[dict]): Records as for `record_messages`, identified by
+                root_name and content_hash. Only messages still marked "failed" are changed.
+
+        Returns:
+            int: The number of messages updated.
+        """
+        columns = ("message_id", "status", "output_file", "is_door", "email_from", "subject", "date", "body", "parent_ids")
+        rows = [tuple(record.get(column) if column != "is_door" else int(bool(record.get(column)))
+                      for column in columns) + (record["root_name"], record["content_hash"]) for record in records]
+        # Rows recorded before are indexed first, so the trigger never indexes a row twice
+        self.index_new_rows()
+        with self.connection:
+            cursor = self.connection.executemany(
+                f"UPDATE messages SET {', '.join(column + ' = ?' for column in columns)} "
+                f"WHERE root_name = ? AND content_hash = ? AND status = 'failed'", rows)
+            self._record_attachments(records)
+        return cursor.rowcount
+
+    def _record_attachments(self, records):
+        # Attachments are listed against the catalog id of their message
+        for record in records:
+            if record.get("attachments"):
+                row = self.connection.execute("SELECT id FROM messages WHERE root_name = ? AND content_hash = ?",
+                                              (record["root_name"], record["content_hash"])).fetchone()
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO attachments (message, part, filename, content_type, encoded_size, sha256, "
+                    "extracted) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(row[0], attachment["part"], attachment["filename"], attachment["content_type"],
+                      attachment["encoded_size"], attachment["sha256"], attachment.get("extracted"))
+                     for attachment in record["attachments"]])
+
+    def setting(self, name):
+        """Return the value stored for a setting, or None if it was never stored."""
+        row = self.connection.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def store_setting(self, name, value):
+        """Store the value of a setting (text)."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                (name, value))
+
+    def recompute_doors(self, is_door):
+        """
+        Works out again which kept rows belong in the doors workbook, from their stored subject and body.
+
+        Args:
+            is_door (callable): (subject, body) -> bool, e.g. `TermMatcher.search` of the keywords.
+
+        Returns:
+            int: The number of rows whose flag changed.
+        """
+        changed = []
+        for row_id, subject, body, was_door in self.connection.execute(
+                "SELECT id, subject, body, is_door FROM messages WHERE status = 'row'"):
+            now_door = bool(is_door(subject, body))
+            if now_door != bool(was_door):
+                changed.append((int(now_door), row_id))
+        with self.connection:
+            self.connection.executemany("UPDATE messages SET is_door = ? WHERE id = ?", changed)
+        return len(changed)
+
+    def forget_messages(self, root_name):
+        """
+        Forgets the messages processed for a root directory, so its sources are processed again.
+
+        Copies that were only noted as duplicates of a message kept from another
+        mailbox are not forgotten, so the link to the kept copy stays.
+
+        Args:
+            root_name (str): The root directory.
+
+        Returns:
+            list[str]: The monthly output files the forgotten messages were in.
+        """
+        # Only indexed rows can be taken out of the index
+        self.index_new_rows()
+        with self.connection:
+            outputs = [path for (path,) in self.connection.execute(
+                "SELECT DISTINCT output_file FROM messages WHERE root_name = ? AND status != 'duplicate' "
+                "AND output_file IS NOT NULL", (root_name,))]
+            if self.full_text:
+                self.connection.execute(
+                    "INSERT INTO messages_fts (messages_fts, rowid, subject, body) "
+                    "SELECT 'delete', id, subject, body FROM messages WHERE root_name = ? AND status = 'row'", (root_name,))
+            self.connection.execute(
+                "DELETE FROM attachments WHERE message IN "
+                "(SELECT id FROM messages WHERE root_name = ? AND status != 'duplicate')", (root_name,))
+            self.connection.execute("DELETE FROM messages WHERE root_name = ? AND status != 'duplicate'", (root_name,))
+            # New rows may reuse the ids of forgotten ones
+            self._set_indexed_up_to(self._last_message_id())
+            self.connection.execute(
+                "DELETE FROM chunks WHERE source_id IN (SELECT id FROM sources WHERE root_name = ?)", (root_name,))
+            self.connection.execute("UPDATE sources SET complete = 0 WHERE root_name = ?", (root_name,))
+        return outputs
+
+    def mark_dirty(self, paths):
+        """Flag output files that need to be exported again."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO outputs (path, dirty) VALUES (?, 1) ON CONFLICT (path) DO UPDATE SET dirty = 1",
+                [(path,) for path in paths])
+
+    def mark_clean(self, path):
+        """Flag an output file as up to date."""
+        with self.connection:
+            self.connection.execute("UPDATE outputs SET dirty = 0 WHERE path = ?", (path,))
+
+    def outputs(self, dirty_only=False):
+        """Return the paths of the output files the catalog knows about."""
+        query = "SELECT path FROM outputs" + (" WHERE dirty = 1" if dirty_only else "") + " ORDER BY path"
+        return [path for (path,) in self.connection.execute(query)]
+
+    def has_rows_from(self, path, root_name):
+        """Check whether a monthly output file holds messages processed in a root directory."""
+        return self.connection.execute(
+            "SELECT 1 FROM messages WHERE output_file = ? AND root_name = ? LIMIT 1", (path, root_name)).fetchone() is not None
+
+    def output_rows(self, path):
+        """Iterate over the (From, Subject, Date, Body, Mailboxes) rows of a monthly output file, in processing order."""
+        return self.connection.execute(ROW_QUERY + "WHERE m.output_file = ? AND m.status = 'row' ORDER BY m.id", (path,))
+
+    def attachment_rows(self, path):
+        """
+        Iterate over the attachments of the emails in a monthly output file, in processing order.
+
+        Emails without a text body (status "attachments") are included, though
+        they have no row in the monthly file itself.
+
+        Rows are (Date, From, Subject, Message-ID, Filename, Content type, Encoded bytes,
+        SHA-256, Extracted file).
+        """
+        return self.connection.execute(
+            "SELECT m.date, m.email_from, m.subject, m.message_id, a.filename, a.content_type, a.encoded_size, "
+            "a.sha256, a.extracted FROM attachments a JOIN messages m ON m.id = a.message "
+            "WHERE m.output_file = ? AND m.status IN ('row', 'attachments') ORDER BY m.id, a.part", (path,))
+
+    def door_rows(self):
+        """Iterate over the (From, Subject, Date, Body, Mailboxes) rows that matched a keyword, in processing order."""
+        return self.connection.execute(ROW_QUERY + "WHERE m.is_door = 1 AND m.status = 'row' ORDER BY m.id")
+
+    def search(self, query, since=None, until=None, sender=None, mailbox=None, limit=None, door_only=False):
+        """
+        Finds kept rows with the full-text index.
+
+        Args:
+            query (str): FTS5 query over subject and body: words, "quoted phrases",
+                AND / OR / NOT, parentheses, prefixes (deliver*) and column filters
+                (subject:hinge). None matches every row.
+            since (str): Earliest date, or date prefix such as "2024" or "2024-03" (inclusive).
+            until (str): Latest date, or date prefix (inclusive).
+            sender (str): Text the From address must contain, e.g. "@example.com".
+            mailbox (str): Root directory the message must have been found in.
+            limit (int): Maximum number of rows.
+            door_only (bool): Only rows that matched a keyword (the doors workbook).
+
+        Returns:
+            sqlite3.Cursor: (From, Subject, Date, Body, Mailboxes) rows, oldest first.
+        """
+        conditions, parameters = self._row_conditions(query, since, until, sender, mailbox)
+        if door_only:
+            conditions.append("m.is_door = 1")
+        sql = ROW_QUERY + "WHERE " + " AND ".join(conditions) + " ORDER BY m.date, m.id"
+        if limit:
+            sql += " LIMIT ?"
+            parameters.append(int(limit))
+        return self.connection.execute(sql, parameters)
+
+    def search_ids(self, query=None, since=None, until=None, sender=None, mailbox=None, door_only=False):
+        """
+        Finds the ids of kept rows, with the same filters as `search`.
+
+        Args:
+            door_only (bool): Only rows that matched a keyword (the doors workbook).
+
+        Returns:
+            set[int]: Message ids.
+        """
+        conditions, parameters = self._row_conditions(query, since, until, sender, mailbox)
+        if door_only:
+            conditions.append("m.is_door = 1")
+        return {row_id for (row_id,) in self.connection.execute(
+            "SELECT m.id FROM messages m WHERE " + " AND ".join(conditions), parameters)}
+
+    def thread_links(self):
+        """Iterate over (id, message_id, parent_ids) of every kept row, in processing order."""
+        return self.connection.execute(
+            "SELECT id, message_id, parent_ids FROM messages WHERE status = 'row' ORDER BY id")
+
+    def rows_by_id(self, ids):
+        """
+        Fetches kept rows by message id.
+
+        Returns:
+            dict[int, tuple]: id -> (From, Subject, Date, Body, Mailboxes).
+        """
+        rows = {}
+        ids = list(ids)
+        for i in range(0, len(ids), QUERY_BATCH_SIZE):
+            batch = ids[i:i + QUERY_BATCH_SIZE]
+            cursor = self.connection.execute(
+                ROW_QUERY.replace("SELECT ", "SELECT m.id, ", 1) +
+                f"WHERE m.status = 'row' AND m.id IN ({','.join('?' * len(batch))})", batch)
+            rows.update((row[0], row[1:]) for row in cursor)
+        return rows
+
+    def _row_conditions(self, query, since, until, sender, mailbox):
+        conditions, parameters = ["m.status = 'row'"], []
+        if query:
+            if not self.full_text:
+                raise RuntimeError("This catalog has no full-text index")
+            conditions.append("m.id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            parameters.append(query)
+        if since:
+            conditions.append("m.date != 'Unknown' AND substr(m.date, 1, length(?)) >= ?")
+            parameters += [since, since]
+        if until:
+            conditions.append("m.date != 'Unknown' AND substr(m.date, 1, length(?)) <= ?")
+            parameters += [until, until]
+        if sender:
+            conditions.append("instr(m.email_from, ?) > 0")
+            parameters.append(sender.lower())
+        if mailbox:
+            conditions.append("(m.root_name = ? OR EXISTS (SELECT 1 FROM message_mailboxes mb "
+                              "WHERE mb.dedup_key = m.dedup_key AND mb.root_name = ?))")
+            parameters += [mailbox, mailbox]
+        return conditions, parameters
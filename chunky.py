@@ -1,18 +1,36 @@
 import pandas as pd
 import os
+import argparse
+from openpyxl import load_workbook
 from tqdm import tqdm  # Progress bar library
+from matcher import SenderMatcher, TermMatcher
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed to read Parquet input
+    pq = None
 
 # Global Variables
-FILE_PATH = 'data/emails_about_doors.xlsx'  # Path to the input Excel file
+FILE_PATH = 'data/emails_about_doors.xlsx'  # Path to the input file (.xlsx, .parquet or .csv.gz)
 OUTPUT_DIR = 'emails_chunks_output'  # Directory to save the split files
 ROWS_PER_CHUNK = 5000  # Number of rows per chunk
+READ_BATCH_ROWS = 20000  # Rows read and filtered at a time in streaming mode
 IGNORED_EMAILS = ['noreply@homesteadcabinet.net']  # List of known spam/advertisement email addresses
 SPAM_KEYWORDS = ['promotion', 'sale', 'offer', 'unsubscribe', 'free', 'discount', 'advertisement', 'marketing']
 SPAM_DOMAINS = ['.promo', '.info', 'marketing.com']  # Example domains often used for spam
+MATCH_WHOLE_WORDS = True  # Only match whole words, so 'free' doesn't match 'freeze' (about half the speed of substring checks)
+MATCH_PLURALS = True  # With MATCH_WHOLE_WORDS, 'offers' and 'sales' still match 'offer' and 'sale'
+
+SPAM_MATCHER = TermMatcher(SPAM_KEYWORDS, whole_words=MATCH_WHOLE_WORDS, plurals=MATCH_PLURALS)
+SPAM_SENDERS = SenderMatcher(domains=SPAM_DOMAINS)
 
 # Global counter for filtered emails
 emails_filtered_out = 0
 
+# Line breaks recognised by str.splitlines, and quoted lines (first non-blank character is '>')
+LINE_BREAKS = '\r\n|[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]'
+QUOTED_LINE = r'(?m)^[^\S\n]*>[^\n]*(?:\n|$)'
+
 
 def clean_body(body):
     """
@@ -38,17 +56,11 @@ def is_spam(row):
     Determines if a row is spam based on known patterns and keywords.
     Handles non-string values gracefully.
     """
-    from_email = str(row.get('From', '')).lower()  # Convert to string and lower case
-    if any(from_email.endswith(domain) for domain in SPAM_DOMAINS):
-        return True
-
-    # Check subject and body for spam keywords
-    subject = str(row.get('Subject', '')).lower()  # Convert to string and lower case
-    body = str(row.get('Body', '')).lower()  # Convert to string and lower case
-    if any(keyword in subject for keyword in SPAM_KEYWORDS) or any(keyword in body for keyword in SPAM_KEYWORDS):
+    if SPAM_SENDERS.matches(str(row.get('From', ''))):
         return True
 
-    return False
+    # Check subject and body for spam keywords in one pass over each
+    return SPAM_MATCHER.search(str(row.get('Subject', '')), str(row.get('Body', '')))
 
 
 def split_excel():
@@ -107,6 +119,219 @@ def split_excel():
     print(f"Total emails filtered out: {emails_filtered_out}")
 
 
+def iter_sheet_batches(file_path, batch_rows):
+    """
+    Streams the rows of every sheet in an Excel file as DataFrames of `batch_rows` rows.
+
+    The workbook is opened read-only, so only one batch is in memory at a time.
+    The first row of each sheet is the header; blank rows are skipped, as
+    `pd.ExcelFile.parse` does.
+
+    Yields:
+        tuple: (sheet_name, DataFrame) for each batch. Every sheet yields at least
+        one (possibly empty) batch.
+    """
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                yield sheet.title, pd.DataFrame()
+                continue
+            columns = [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+            batch = []
+            yielded = False
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_rows:
+                    yield sheet.title, pd.DataFrame(batch, columns=columns)
+                    batch = []
+                    yielded = True
+            if batch or not yielded:
+                yield sheet.title, pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_columnar_batches(file_path, batch_rows):
+    """
+    Streams the rows of a Parquet or gzipped CSV output of mbox_convert.py as DataFrames.
+
+    These files have no sheets; their rows are reported as the "Emails" sheet, the
+    name the converter gives the sheet of its Excel outputs. Only one batch is in
+    memory at a time, and no XML has to be parsed.
+
+    Yields:
+        tuple: ("Emails", DataFrame) for each batch, at least one (possibly empty).
+    """
+    if file_path.lower().endswith('.parquet'):
+        if pq is None:
+            raise ImportError("Reading Parquet files requires pyarrow (pip install pyarrow)")
+        parquet_file = pq.ParquetFile(file_path)
+        batches = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=batch_rows))
+        empty = parquet_file.schema_arrow.empty_table().to_pandas()
+    else:
+        batches = pd.read_csv(file_path, compression='infer', dtype=str, keep_default_na=False,
+                              chunksize=batch_rows)
+        empty = None
+
+    yielded = False
+    for batch_df in batches:
+        yielded = True
+        yield 'Emails', batch_df
+    if not yielded:
+        yield 'Emails', empty if empty is not None else pd.DataFrame()
+
+
+def iter_file_batches(file_path, batch_rows):
+    """Streams an Excel, Parquet or gzipped CSV file as (sheet_name, DataFrame) batches."""
+    if file_path.lower().endswith(('.parquet', '.csv.gz', '.csv')):
+        return iter_columnar_batches(file_path, batch_rows)
+    return iter_sheet_batches(file_path, batch_rows)
+
+
+def spam_mask(sheet_df):
+    """
+    Vectorized version of `is_spam`: flags every spam row of a DataFrame at once.
+
+    Sender checks run once per distinct sender; keyword checks are a single
+    regex pass over the lower-cased Subject and Body columns.
+    """
+    mask = pd.Series(False, index=sheet_df.index)
+
+    if 'From' in sheet_df.columns:
+        senders = sheet_df['From'].astype(str)
+        blocked = [sender for sender in senders.unique() if SPAM_SENDERS.matches(sender)]
+        mask |= senders.isin(blocked)
+
+    if SPAM_MATCHER.pattern is not None:
+        for column in ('Subject', 'Body'):
+            if column in sheet_df.columns:
+                mask |= sheet_df[column].astype(str).str.lower().str.contains(SPAM_MATCHER.pattern)
+
+    return mask
+
+
+def clean_bodies(bodies):
+    """
+    Vectorized version of `clean_body` for a whole column.
+
+    Quoted lines are removed with one regex pass over the column; values that
+    are not strings are left as they are.
+    """
+    is_text = bodies.map(type).eq(str)
+    cleaned = (bodies[is_text]
+               .str.replace(LINE_BREAKS, '\n', regex=True)
+               .str.replace(QUOTED_LINE, '', regex=True)
+               .str.strip())
+    result = bodies.copy()
+    result[is_text] = cleaned
+    return result
+
+
+def filter_batch(sheet_df):
+    """
+    Applies the same filtering as `split_excel` to one DataFrame, with column operations.
+
+    Returns:
+        DataFrame: The rows that are kept, with cleaned bodies.
+    """
+    # Remove rows where the 'From' column contains any email in IGNORED_EMAILS
+    if 'From' in sheet_df.columns:
+        sheet_df = sheet_df[~sheet_df['From'].isin(IGNORED_EMAILS)]
+
+    # Filter out rows considered spam
+    sheet_df = sheet_df[~spam_mask(sheet_df)]
+
+    # Clean email bodies
+    if 'Body' in sheet_df.columns:
+        sheet_df = sheet_df.assign(Body=clean_bodies(sheet_df['Body']))
+
+    return sheet_df
+
+
+def split_excel_streaming():
+    """
+    Streaming version of `split_excel` that produces the same chunks and filtered count.
+
+    Sheets are read in batches of READ_BATCH_ROWS rows, filtered with vectorized
+    column operations, and each chunk is written as soon as it has ROWS_PER_CHUNK
+    rows, so the whole sheet is never held in memory. Parquet and gzipped CSV
+    outputs of the converter are read directly, without an XML parse.
+    """
+    global emails_filtered_out
+
+    # Create the output directory if it doesn't exist
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    sheet_name = None
+    pending = []
+    pending_rows = chunk_count = 0
+    pbar = None
+
+    def write_chunks(final=False):
+        nonlocal pending, pending_rows, chunk_count
+        if not pending:
+            return
+        buffered = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+        start_row = 0
+        while buffered.shape[0] - start_row >= ROWS_PER_CHUNK or (final and start_row < buffered.shape[0]):
+            chunk_df = buffered.iloc[start_row:start_row + ROWS_PER_CHUNK]
+            output_file = os.path.join(OUTPUT_DIR, f"{sheet_name}_chunk_{chunk_count + 1}.xlsx")
+            chunk_df.to_excel(output_file, index=False, sheet_name=sheet_name)
+            chunk_count += 1
+            start_row += chunk_df.shape[0]
+            pbar.update(chunk_df.shape[0])
+        pending = [buffered.iloc[start_row:]] if start_row < buffered.shape[0] else []
+        pending_rows = buffered.shape[0] - start_row
+
+    def finish_sheet():
+        write_chunks(final=True)
+        pbar.close()
+        print(f"Sheet '{sheet_name}' split into {chunk_count} chunks.")
+
+    for batch_sheet, batch_df in iter_file_batches(FILE_PATH, READ_BATCH_ROWS):
+        if batch_sheet != sheet_name:
+            if pbar is not None:
+                finish_sheet()
+            sheet_name = batch_sheet
+            pending, pending_rows, chunk_count = [], 0, 0
+            pbar = tqdm(desc=f"Processing '{sheet_name}'", unit="rows")
+
+        kept_df = filter_batch(batch_df)
+        emails_filtered_out += len(batch_df) - len(kept_df)
+        if len(kept_df):
+            pending.append(kept_df)
+            pending_rows += len(kept_df)
+        if pending_rows >= ROWS_PER_CHUNK:
+            write_chunks()
+
+    if pbar is not None:
+        finish_sheet()
+
+    print(f"Files saved in: {OUTPUT_DIR}")
+    print(f"Total emails filtered out: {emails_filtered_out}")
+
+
 # Run the script
 if __name__ == "__main__":
-    split_excel()
+    parser = argparse.ArgumentParser(description="Split a file of emails into filtered Excel chunks.")
+    parser.add_argument("--input", default=FILE_PATH,
+                        help=f"Excel, Parquet or gzipped CSV file to split. Default: {FILE_PATH}")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Load each sheet fully instead of streaming it in batches (Excel input only)")
+    args = parser.parse_args()
+
+    FILE_PATH = args.input
+    if args.in_memory and not FILE_PATH.lower().endswith('.xlsx'):
+        parser.error("--in-memory only reads Excel files")
+
+    if args.in_memory:
+        split_excel()
+    else:
+        split_excel_streaming()
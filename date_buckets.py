@@ -0,0 +1,192 @@
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_tz
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9: only "UTC" and fixed offsets are available
+    ZoneInfo = ZoneInfoNotFoundError = None
+
+
+# Distinct header values remembered per process (about 150 bytes each)
+DATE_CACHE_SIZE = 65_536
+UNKNOWN_DATE = "Unknown"
+
+MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+# Month names as they usually appear ("Jan", "JAN", "jan") -> two-digit month
+MONTH_DIGITS = {variant: f"{number:02d}" for name, number in MONTHS.items()
+                for variant in (name, name.upper(), name.capitalize())}
+# Zone names allowed by RFC 2822 (obsolete syntax), in hours from UTC
+ZONE_HOURS = {"ut": 0, "gmt": 0, "z": 0, "est": -5, "edt": -4, "cst": -6, "cdt": -5,
+              "mst": -7, "mdt": -6, "pst": -8, "pdt": -7}
+
+# The usual RFC 2822 form: "Mon, 3 Jan 2022 09:00:00 +0000", optionally without the
+# weekday or seconds, with a zone name, or with a "(comment)" after the zone
+RFC2822_RE = re.compile(
+    r"\s*(?:[A-Za-z]{3},?\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?"
+    r"\s*(?:([+-])(\d{2})(\d{2})|([A-Za-z]{1,3}))?\s*(?:\([^()]*\)\s*)?$")
+# Timestamp of an mbox "From " line, in asctime form with an optional offset (Takeout
+# writes "From 1234@xxx Mon Jan 03 09:00:00 +0000 2022")
+FROM_LINE_RE = re.compile(
+    r"^From \S+\s+[A-Za-z]{3}\s+([A-Za-z]{3})\s+(\d{1,2})\s+(\d{1,2}):(\d{2}):(\d{2})\s+(?:([+-]\d{4})\s+)?(\d{4})")
+
+
+def resolve_timezone(name):
+    """
+    Looks up the timezone dates are converted to.
+
+    Args:
+        name (str): "UTC", a fixed offset such as "+02:00", an IANA name such as
+            "America/Chicago", or None to keep each date in the sender's own zone.
+
+    Returns:
+        datetime.tzinfo: The timezone, or None.
+
+    Raises:
+        ValueError: If the name is not a known timezone.
+    """
+    if name is None:
+        return None
+    if name.upper() in ("UTC", "GMT", "Z"):
+        return timezone.utc
+    offset = re.fullmatch(r"([+-])(\d{2}):?(\d{2})", name)
+    if offset:
+        sign = -1 if offset.group(1) == "-" else 1
+        return timezone(sign * timedelta(hours=int(offset.group(2)), minutes=int(offset.group(3))))
+    if ZoneInfo is None:
+        raise ValueError(f"Timezone names need Python 3.9 or newer; use UTC or an offset such as +02:00, not {name}")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name} (on Windows, install the tzdata package)") from None
+
+
+def _fast_parse(match):
+    day, month_name, year, hour, minute, second, sign, offset_hours, offset_minutes, zone = match.groups()
+    month = MONTHS.get(month_name.lower())
+    if month is None:
+        return None
+    if sign:
+        offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+        offset = -offset if sign == "-" else offset
+    elif zone:
+        if zone.lower() not in ZONE_HOURS:
+            return None  # Leave unusual zones to the full parser
+        offset = ZONE_HOURS[zone.lower()] * 3600
+    else:
+        offset = None
+    year = int(year)
+    if year < 100:
+        # Same rule as parsedate_tz for "0022"-style years
+        year += 1900 if year > 68 else 2000
+    return year, month, int(day), int(hour), int(minute), int(second or 0), offset
+
+
+def _slow_parse(value):
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    year, month, day, hour, minute, second, _, _, _, offset = parsed
+    return year, month, day, hour, minute, second, offset
+
+
+class DateBucketer:
+    """
+    Turns Date headers into the output date and the year-month bucket of a message.
+
+    The usual RFC 2822 forms are read with one regular expression; anything else
+    goes through `email.utils.parsedate_tz`. Results are cached per header value
+    in a bounded LRU cache, so repeated values (duplicates, Received headers of
+    the same relay) are only parsed once.
+
+    Without a timezone, dates keep the wall-clock time of the sender's zone,
+    as `parsedate_to_datetime(...).strftime(...)` did. With one, every date is
+    converted to it; dates without a zone are taken as UTC.
+
+    Args:
+        tz (str): Timezone to convert to (see `resolve_timezone`), or None.
+        cache_size (int): Most header values kept in the cache.
+    """
+
+    def __init__(self, tz=None, cache_size=DATE_CACHE_SIZE):
+        self.tz = resolve_timezone(tz)
+        self.format_date = lru_cache(maxsize=cache_size)(self._format_date)
+
+    def _format(self, year, month, day, hour, minute, second, offset):
+        if self.tz is not None:
+            zone = timezone(timedelta(seconds=offset)) if offset is not None else timezone.utc
+            moment = datetime(year, month, day, hour, minute, second, tzinfo=zone).astimezone(self.tz)
+            year, month, day, hour, minute, second = (moment.year, moment.month, moment.day,
+                                                      moment.hour, moment.minute, moment.second)
+        else:
+            datetime(year, month, day, hour, minute, second)  # Rejects impossible dates such as 31 Feb
+            if offset is not None:
+                timezone(timedelta(seconds=offset))  # and offsets of a day or more, such as +2400
+        return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}"
+
+    def _format_date(self, value):
+        """Return a date value as "YYYY-MM-DD HH:MM:SS", or None if it can't be read (cached)."""
+        match = RFC2822_RE.match(value)
+        if match is not None and self.tz is None:
+            # Without a timezone the fields are copied as written, so the common case
+            # needs no conversion; days past the 28th and offsets near a day are checked
+            # by the full path
+            day, month_name, year, hour, minute, second, _, offset_hours = match.groups()[:8]
+            month = MONTH_DIGITS.get(month_name)
+            day = day.zfill(2)
+            hour = hour.zfill(2)
+            second = second or "00"
+            if (month is not None and year[0] != "0" and "01" <= day <= "28" and hour <= "23"
+                    and minute <= "59" and second <= "59" and (offset_hours or "00") <= "22"):
+                return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+        try:
+            parsed = (_fast_parse(match) if match is not None else None) or _slow_parse(value)
+            return self._format(*parsed) if parsed is not None else None
+        except (ValueError, OverflowError, TypeError):
+            return None
+
+    def format_from_line(self, from_line):
+        """Return the timestamp of an mbox "From " line as "YYYY-MM-DD HH:MM:SS", or None."""
+        match = FROM_LINE_RE.match(from_line)
+        if match is None:
+            return None
+        month_name, day, hour, minute, second, offset, year = match.groups()
+        month = MONTHS.get(month_name.lower())
+        if month is None:
+            return None
+        if offset is not None:
+            offset = (-1 if offset[0] == "-" else 1) * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+        try:
+            return self._format(int(year), month, int(day), int(hour), int(minute), int(second), offset)
+        except (ValueError, OverflowError):
+            return None
+
+    def bucket(self, date_header, received=None, from_line=None):
+        """
+        Works out the output date and year-month bucket of a message.
+
+        When the Date header is missing or broken, the time the message was
+        received is used instead: the date of the newest Received header, then
+        the timestamp of the mbox "From " line.
+
+        Args:
+            date_header (str): The Date header.
+            received (list[str]): Received headers, newest first.
+            from_line (str): The mbox "From " line of the message.
+
+        Returns:
+            tuple[str, str]: ("YYYY-MM-DD HH:MM:SS", "YYYY-MM"), or ("Unknown", "Unknown").
+        """
+        formatted = self.format_date(date_header.strip()) if date_header else None
+        for value in received or ():
+            if formatted is not None:
+                break
+            # The date follows the last semicolon: "from a by b; Mon, 3 Jan 2022 09:00:00 +0000"
+            formatted = self.format_date(str(value).rpartition(";")[2].strip())
+        if formatted is None and from_line:
+            formatted = self.format_from_line(from_line)
+        if formatted is None:
+            return UNKNOWN_DATE, UNKNOWN_DATE
+        return formatted, formatted[:7]
@@ -0,0 +1,92 @@
+import hashlib
+import math
+import re
+
+from mime_scan import split_raw_message
+
+
+# Headers used to identify a message that has no Message-ID
+FALLBACK_HEADERS = (b"from", b"to", b"date", b"subject")
+
+HEADER_RE = re.compile(rb"^([!-9;-~]+):[ \t]*(.*(?:\r?\n[ \t].*)*)", re.MULTILINE)
+
+
+def raw_headers(header_block):
+    """
+    Reads the raw header values from a header block without decoding them.
+
+    Args:
+        header_block (bytes): Header bytes as returned by `split_raw_message`.
+
+    Returns:
+        dict: Lower-case header name -> first raw value (bytes, unfolded).
+    """
+    headers = {}
+    for match in HEADER_RE.finditer(header_block):
+        name = match.group(1).lower()
+        if name not in headers:
+            headers[name] = b" ".join(match.group(2).split())
+    return headers
+
+
+def message_dedup_key(raw):
+    """
+    Works out the deduplication key of one raw mbox message.
+
+    The key is the Message-ID when there is one. Otherwise it is a hash of the
+    From, To, Date and Subject headers and the body with whitespace collapsed,
+    so copies that only differ in line endings or Gmail labels still match.
+    The body is never decoded.
+
+    Args:
+        raw (bytes | memoryview): The message bytes as stored in the mbox file.
+
+    Returns:
+        str: A 32 character hex key.
+    """
+    header_block, body = split_raw_message(raw)
+    headers = raw_headers(header_block)
+    message_id = b"".join(headers.get(b"message-id", b"").split())
+    if message_id:
+        return hashlib.blake2b(b"mid:" + message_id, digest_size=16).hexdigest()
+
+    digest = hashlib.blake2b(b"hdr:", digest_size=16)
+    for name in FALLBACK_HEADERS:
+        digest.update(headers.get(name, b"") + b"\0")
+    digest.update(b" ".join(body.split()))
+    return digest.hexdigest()
+
+
+class SeenSet:
+    """
+    Memory-bounded set of message keys, implemented as a Bloom filter.
+
+    Memory is fixed when the set is created. A negative answer is always right;
+    a positive answer may be wrong at roughly `error_rate`, so callers confirm
+    positives against the processing catalog before dropping a message.
+
+    Args:
+        capacity (int): Number of keys the filter is sized for.
+        error_rate (float): Acceptable false positive rate at `capacity` keys.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.bit_count = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing over the two halves of a 128-bit key digest
+        value = int(key, 16) if len(key) == 32 else int(hashlib.blake2b(key.encode(), digest_size=16).hexdigest(), 16)
+        first, second = value >> 64, (value & 0xFFFFFFFFFFFFFFFF) | 1
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, key):
+        """Add a key to the set."""
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
@@ -0,0 +1,197 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+import mbox_convert
+from catalog import ProcessingCatalog
+from sinks import ShardedOutput, XlsxSink, sink_for_path
+
+
+# Configuration
+threads_file = os.path.join(mbox_convert.current_directory, "email_threads.xlsx")
+# Reply and forward prefixes ("Re:", "RE[2]:", "Fwd:", "AW:", "[External] Re:") removed to get a thread's subject
+SUBJECT_PREFIX_RE = re.compile(r"^(?:\s*(?:\[[^\]]*\]\s*)?(?:re|fw|fwd|aw|wg|sv|vs)(?:\[\d+\])?\s*:)+\s*", re.IGNORECASE)
+# Paragraphs of a body are separated by blank lines
+PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+# Excel stores at most this many characters in a cell
+EXCEL_CELL_MAX_CHARS = 32_767
+TRUNCATED_MARKER = "\n[... thread truncated]"
+
+
+class ThreadIndex:
+    """
+    Groups message ids into threads with a union-find over Message-ID, In-Reply-To and References.
+
+    Every message is linked to the ids it refers to, so replies join their
+    thread even when earlier messages are missing or their References header
+    was trimmed by the mail client.
+    """
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        """Return the representative id of the thread a key belongs to."""
+        parent = self.parent
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            # Path halving keeps the chains short
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def link(self, key, *others):
+        """Put a key and the other keys in the same thread."""
+        root = self.find(key)
+        for other in others:
+            other_root = self.find(other)
+            if other_root != root:
+                self.parent[other_root] = root
+
+
+def group_threads(links):
+    """
+    Groups messages into threads.
+
+    Args:
+        links (iterable): (row id, Message-ID, parent ids) per message, as from
+            `ProcessingCatalog.thread_links`. Parent ids are space-separated.
+
+    Returns:
+        list[list[int]]: Row ids per thread, in processing order, threads ordered by their first row.
+    """
+    index = ThreadIndex()
+    messages = []
+    for row_id, message_id, parent_ids in links:
+        own_id = mbox_convert.message_ids(message_id or "")
+        # Messages without a Message-ID can still be reached through their own parents
+        key = own_id[0] if own_id else ("row", row_id)
+        index.link(key, *(parent_ids.split() if parent_ids else ()))
+        messages.append((row_id, key))
+
+    threads = {}
+    for row_id, key in messages:
+        threads.setdefault(index.find(key), []).append(row_id)
+    return list(threads.values())
+
+
+def thread_subject(subject):
+    """Return a subject without its reply and forward prefixes."""
+    return SUBJECT_PREFIX_RE.sub("", subject or "").strip()
+
+
+def consolidate_thread(rows):
+    """
+    Builds one row for a thread.
+
+    Messages are listed oldest first under a "[date] sender" line. Paragraphs
+    that an earlier message of the thread already contained (repeated quoted
+    history, signatures, disclaimers) are left out.
+
+    Args:
+        rows (list[tuple]): (From, Subject, Date, Body, Mailboxes) of each message of the thread.
+
+    Returns:
+        list: [Participants, Subject, Date of the first message, Body, Mailboxes].
+    """
+    rows = sorted(rows, key=lambda row: (not row[2] or row[2] == "Unknown", row[2] or ""))
+    senders = list(dict.fromkeys(row[0] for row in rows if row[0]))
+    subject = next((thread_subject(row[1]) for row in rows if thread_subject(row[1])), "")
+    first_date = next((row[2] for row in rows if row[2] and row[2] != "Unknown"), "Unknown")
+    mailboxes = sorted({mailbox for row in rows if row[4] for mailbox in row[4].split(", ")})
+
+    seen = set()
+    parts = []
+    for email_from, _, date, body, _ in rows:
+        new_paragraphs = []
+        for paragraph in PARAGRAPH_BREAK_RE.split(body or ""):
+            key = " ".join(paragraph.split()).lower()
+            if key and key not in seen:
+                seen.add(key)
+                new_paragraphs.append(paragraph.strip("\n"))
+        parts.append(f"[{date}] {email_from}" + ("\n" + "\n\n".join(new_paragraphs) if new_paragraphs else ""))
+    return [", ".join(senders), subject, first_date, "\n\n".join(parts), ", ".join(mailboxes)]
+
+
+def export_threads(catalog, output_file, selected_ids=None, batch_messages=500):
+    """
+    Writes one consolidated row per thread.
+
+    Args:
+        catalog (ProcessingCatalog): The processing catalog built by mbox_convert.py.
+        output_file (str): Path of the output. Its extension picks the format
+            (.xlsx, .csv.gz or .parquet).
+        selected_ids (set[int]): Only threads with at least one of these messages.
+            All threads by default.
+        batch_messages (int): Messages fetched from the catalog at once.
+
+    Returns:
+        tuple[int, int]: The number of threads and of messages written.
+    """
+    start_time = time.perf_counter()
+    sink = sink_for_path(output_file)
+    threads = group_threads(catalog.thread_links())
+    if selected_ids is not None:
+        threads = [thread for thread in threads if any(row_id in selected_ids for row_id in thread)]
+
+    writer = ShardedOutput(output_file, sink, max_rows=mbox_convert.max_rows_per_file,
+                           max_bytes=mbox_convert.max_bytes_per_file)
+    message_count = original_chars = written_chars = 0
+    position = 0
+    while position < len(threads):
+        # Fetch whole threads, about batch_messages messages at a time
+        batch = [threads[position]]
+        position += 1
+        while position < len(threads) and sum(map(len, batch)) + len(threads[position]) <= batch_messages:
+            batch.append(threads[position])
+            position += 1
+        rows = catalog.rows_by_id([row_id for thread in batch for row_id in thread])
+
+        for thread in batch:
+            thread_rows = [rows[row_id] for row_id in thread if row_id in rows]
+            row = consolidate_thread(thread_rows)
+            if sink is XlsxSink and len(row[3]) > EXCEL_CELL_MAX_CHARS:
+                row[3] = row[3][:EXCEL_CELL_MAX_CHARS - len(TRUNCATED_MARKER)] + TRUNCATED_MARKER
+            writer.append(row)
+            message_count += len(thread_rows)
+            original_chars += sum(len(thread_row[3] or "") for thread_row in thread_rows)
+            written_chars += len(row[3])
+
+    shards = writer.save()
+    elapsed = time.perf_counter() - start_time
+    print(f"Saved {writer.row_count} threads ({message_count} emails) to {', '.join(shards)} in {elapsed:.1f} s.")
+    if original_chars:
+        print(f"Body text: {original_chars / (1024 * 1024):.1f} MB in separate emails, "
+              f"{written_chars / (1024 * 1024):.1f} MB consolidated ({100 * written_chars / original_chars:.0f}%).")
+    return writer.row_count, message_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write one row per email thread (grouped by Message-ID, In-Reply-To and References), "
+                    "with the text each message added to the conversation.")
+    parser.add_argument("--output", default=threads_file,
+                        help=f"Output file (.xlsx, .csv.gz or .parquet). Default: {threads_file}")
+    parser.add_argument("--query", help="Only threads with an email matching this full-text query (see search.py)")
+    parser.add_argument("--doors", action="store_true", help="Only threads with an email about doors and issues")
+    parser.add_argument("--since", help="Only threads with an email on or after this date or date prefix, e.g. 2024-03")
+    parser.add_argument("--until", help="Only threads with an email on or before this date or date prefix")
+    parser.add_argument("--sender", help="Only threads with an email whose From address contains this text")
+    parser.add_argument("--mailbox", help="Only threads with an email found in this root directory")
+    parser.add_argument("--catalog", default=mbox_convert.catalog_db,
+                        help=f"Processing catalog to read (default: {mbox_convert.catalog_db})")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.catalog):
+        parser.error(f"Catalog {args.catalog} does not exist. Run mbox_convert.py first.")
+
+    catalog = ProcessingCatalog(args.catalog)
+    try:
+        filters = dict(query=args.query, since=args.since, until=args.until, sender=args.sender, mailbox=args.mailbox)
+        selected = catalog.search_ids(door_only=args.doors, **filters) if args.doors or any(filters.values()) else None
+        export_threads(catalog, args.output, selected)
+    except (sqlite3.OperationalError, ValueError, RuntimeError) as e:
+        print(f"ERROR: {e}")
+    finally:
+        catalog.close()
@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime
+
+
+# Failures kept in memory before they are appended to the journal file
+JOURNAL_BUFFER_RECORDS = 1000
+# Headers of a failed message copied into its journal record (when they could be parsed)
+JOURNAL_HEADERS = ("From", "To", "Subject", "Date", "Message-ID")
+
+
+def journal_entry(record, result):
+    """
+    Builds the journal record of a failed message.
+
+    Args:
+        record (dict): The catalog record of the message (root_name, content_hash,
+            source_id, chunk, byte_offset, length) plus its "source" file.
+        result (dict): The failed `process_message` result ("message_id", "stage",
+            "error_type", "error" and "headers").
+
+    Returns:
+        dict: The journal record.
+    """
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "root_name": record.get("root_name"),
+        "source": record.get("source"),
+        "source_id": record.get("source_id"),
+        "chunk": record.get("chunk"),
+        "offset": record.get("byte_offset"),
+        "length": record.get("length"),
+        "content_hash": record.get("content_hash"),
+        "message_id": result.get("message_id"),
+        "stage": result.get("stage"),
+        "error_type": result.get("error_type"),
+        "error": result.get("error"),
+        "headers": result.get("headers") or {},
+    }
+
+
+def read_journal(journal_path):
+    """
+    Reads the failure records of a journal.
+
+    Lines that can't be parsed (e.g. the last line of a run that was killed while
+    writing) are skipped with a warning.
+
+    Returns:
+        list[dict]: The records, in the order they were written.
+    """
+    if not os.path.exists(journal_path):
+        return []
+    entries = []
+    with open(journal_path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"WARNING: Skipping unreadable line {line_number} of {journal_path}.")
+    return entries
+
+
+def write_journal(journal_path, entries):
+    """Replaces the journal with the given records (written to a temporary file and renamed)."""
+    temp_path = journal_path + ".partial"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(temp_path, journal_path)
+
+
+class FailureJournal:
+    """
+    Buffered journal of the messages that could not be converted, one JSON record per line.
+
+    Each record says where the message is stored (source file, byte offset and
+    length) and why it failed (pipeline stage, exception type and message, and
+    whichever headers were parsed before the failure), so the failed messages can
+    be replayed on their own without reprocessing their chunks. Records are
+    appended in batches; the journal is only opened when a batch is written.
+
+    Attributes:
+        journal_path (str): The JSON Lines file records are appended to.
+        count (int): Records added since the journal was opened.
+    """
+
+    def __init__(self, journal_path, buffer_records=JOURNAL_BUFFER_RECORDS):
+        self.journal_path = journal_path
+        self.buffer_records = buffer_records
+        self.buffer = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+        return False
+
+    def add(self, record, result):
+        """Adds a failed message (see `journal_entry`)."""
+        self.buffer.append(journal_entry(record, result))
+        self.count += 1
+        if len(self.buffer) >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered records to the journal file."""
+        if not self.buffer:
+            return
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.buffer))
+        except OSError as e:
+            print(f"ERROR: Failed to write {len(self.buffer)} records to the failure journal {self.journal_path}: {e}")
+        self.buffer = []
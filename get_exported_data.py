@@ -1,37 +1,357 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Dumps the Google Takeout data into the data folder
 
-def run_shell_command(command):
-    try:
-        result = subprocess.run(command, shell=True, check=True)
-        if result.stdout:
-            print("Output:", result.stdout.decode())
+# Configuration
+EXPORT_URL = "gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z"
+DATA_DIR = "data"
+USERS = [
+    # 'jamie@homesteadcabinet.net',     # Jamie
+    # 'jason@homesteadcabinet.net',     # Jason
+    # 'klay@homesteadcabinet.net',      # Klay
+    # 'mark@homesteadcabinet.net',      # Mark
+    # 'shaela@homesteadcabinet.net',    # Shaela
+    # 'tex@homesteadcabinet.net',       # Tex
+    'alex@homesteadcabinet.net',      # Alex
+    'bart@homesteadcabinet.net',      # Bart
+    'bill@homesteadcabinet.net',      # Bill
+    'bjardine@homesteadcabinet.net',  # Bjardine
+    'cameron@homesteadcabinet.net',   # Cameron
+    'derek@homesteadcabinet.net',     # Derek
+    'nick@homesteadcabinet.net',      # Nick
+]
+MAX_CONCURRENT_DOWNLOADS = 4
+MAX_RETRIES = 3
+RETRY_DELAY_SECONDS = 30  # Doubled after every failed attempt
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class RemoteArchive:
+    """
+    One export archive as listed by a transport.
+
+    Args:
+        user (str): Mailbox the archive belongs to.
+        name (str): File name of the archive.
+        size (int): Size in bytes.
+        md5 (str): Base64 MD5 of the archive, as reported by Cloud Storage. None if unknown.
+        location: Transport-specific handle used to download the archive.
+    """
+
+    def __init__(self, user, name, size, md5=None, location=None):
+        self.user = user
+        self.name = name
+        self.size = size
+        self.md5 = md5
+        self.location = location
+
+
+def file_md5(path):
+    """Return the base64 MD5 of a file, in the form Cloud Storage reports it."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+class GcloudTransport:
+    """
+    Lists and downloads export archives with the `gcloud storage` CLI.
+
+    Args:
+        export_url (str): gs:// URL of the Takeout export (one folder per user below it).
+        gcloud (str): Path of the gcloud executable. Looked up on PATH by default.
+    """
+
+    def __init__(self, export_url, gcloud=None):
+        self.export_url = export_url.rstrip("/")
+        self.gcloud = gcloud or shutil.which("gcloud") or "gcloud"
+
+    def _run(self, args):
+        # No shell: arguments are passed as a list, so user names can't break the command
+        result = subprocess.run([self.gcloud] + args, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"gcloud {' '.join(args)} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def list_archives(self, user):
+        """Return the RemoteArchives exported for a user."""
+        output = self._run(["storage", "objects", "list", f"{self.export_url}/{user}/*.zip", "--format=json"])
+        archives = []
+        for item in json.loads(output or "[]"):
+            url = item.get("storage_url") or item.get("url") or f"{self.export_url}/{user}/{item['name'].rsplit('/', 1)[-1]}"
+            archives.append(RemoteArchive(
+                user, url.rsplit("/", 1)[-1], int(item.get("size", 0)),
+                md5=item.get("md5_hash") or item.get("md5Hash"), location=url))
+        return archives
+
+    def download(self, archive, dest_path):
+        """Download an archive. gcloud resumes interrupted downloads of the same destination."""
+        self._run(["storage", "cp", archive.location, dest_path])
+
+
+class LocalTransport:
+    """
+    Reads export archives from a local directory laid out like the bucket.
+
+    Useful for testing the download pipeline and for exports that were copied
+    by other means: `<source_dir>/<user>/*.zip`.
+
+    Args:
+        source_dir (str): Directory with one folder per user.
+    """
+
+    def __init__(self, source_dir):
+        self.source_dir = source_dir
+
+    def list_archives(self, user):
+        """Return the RemoteArchives in the user's folder."""
+        user_dir = os.path.join(self.source_dir, user)
+        if not os.path.isdir(user_dir):
+            return []
+        archives = []
+        for name in sorted(os.listdir(user_dir)):
+            path = os.path.join(user_dir, name)
+            if name.lower().endswith(".zip") and os.path.isfile(path):
+                archives.append(RemoteArchive(user, name, os.path.getsize(path), md5=file_md5(path), location=path))
+        return archives
+
+    def download(self, archive, dest_path):
+        """Copy an archive to its destination."""
+        with open(archive.location, 'rb') as src, open(dest_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, HASH_BLOCK_SIZE)
+
+
+class DownloadManager:
+    """
+    Downloads export archives with a bounded pool of concurrent transfers.
+
+    Each archive is downloaded to a `.part` file, verified (size and MD5 when
+    the transport reports one) and then renamed into place, with a small
+    `.verified` sidecar recording what was checked. Archives whose sidecar
+    matches the remote listing are skipped, so an interrupted run can simply
+    be started again.
+
+    Args:
+        transport: Object with `list_archives(user)` and `download(archive, dest_path)`.
+        dest_root (str): Directory that gets one folder per user.
+        max_workers (int): Number of concurrent downloads.
+        max_retries (int): Attempts per archive after the first one fails.
+        retry_delay (float): Seconds to wait before the first retry.
+        on_archive_ready (callable): Called as `on_archive_ready(user, path)` when an
+            archive is on disk and verified.
+        on_user_complete (callable): Called as `on_user_complete(user, ok)` once every
+            archive of a user has been handled.
+    """
 
-        if result.stderr:
-            print("Error:", result.stderr.decode())
+    def __init__(self, transport, dest_root, max_workers=MAX_CONCURRENT_DOWNLOADS, max_retries=MAX_RETRIES,
+                 retry_delay=RETRY_DELAY_SECONDS, on_archive_ready=None, on_user_complete=None):
+        self.transport = transport
+        self.dest_root = dest_root
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.on_archive_ready = on_archive_ready
+        self.on_user_complete = on_user_complete
+        self._lock = threading.Lock()
+        self.progress = {}
 
-    except subprocess.CalledProcessError as e:
-        print(f"Command '{command}' failed with error: {e}")
+    def _report(self, user, archive, status):
+        with self._lock:
+            state = self.progress[user]
+            state[status] += 1
+            if status != "failed":
+                state["bytes"] += archive.size
+            handled = state["done"] + state["skipped"] + state["failed"]
+            print(f"[{user}] {archive.name}: {status}. {handled}/{state['total']} archives, "
+                  f"{state['bytes'] / 1024 ** 3:.1f}/{state['total_bytes'] / 1024 ** 3:.1f} GB")
+            finished = handled == state["total"]
+        if finished and self.on_user_complete:
+            self.on_user_complete(user, state["failed"] == 0)
+
+    @staticmethod
+    def _sidecar(archive):
+        return {"name": archive.name, "size": archive.size, "md5": archive.md5}
+
+    def is_complete(self, archive, dest_path):
+        """Check whether an archive is already downloaded and verified."""
+        sidecar_path = dest_path + ".verified"
+        if not (os.path.exists(dest_path) and os.path.exists(sidecar_path)):
+            return False
+        if os.path.getsize(dest_path) != archive.size:
+            return False
+        with open(sidecar_path, encoding='utf-8') as f:
+            return json.load(f) == self._sidecar(archive)
+
+    def verify(self, archive, path):
+        """Check a downloaded file against the remote size and MD5."""
+        if os.path.getsize(path) != archive.size:
+            raise ValueError(f"size {os.path.getsize(path)} does not match {archive.size}")
+        if archive.md5 and file_md5(path) != archive.md5:
+            raise ValueError("MD5 checksum does not match")
+
+    def fetch(self, archive):
+        """
+        Downloads, verifies and installs one archive, retrying on failure.
+
+        Returns:
+            str: "done", "skipped" or "failed".
+        """
+        dest_dir = os.path.join(self.dest_root, archive.user)
+        os.makedirs(dest_dir, exist_ok=True)
+        dest_path = os.path.join(dest_dir, archive.name)
+
+        if self.is_complete(archive, dest_path):
+            status = "skipped"
+        else:
+            status = "failed"
+            part_path = dest_path + ".part"
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.transport.download(archive, part_path)
+                    self.verify(archive, part_path)
+                    os.replace(part_path, dest_path)
+                    with open(dest_path + ".verified", 'w', encoding='utf-8') as f:
+                        json.dump(self._sidecar(archive), f)
+                    status = "done"
+                    break
+                except Exception as e:
+                    print(f"[{archive.user}] {archive.name}: attempt {attempt + 1} failed: {e}")
+                    if attempt < self.max_retries:
+                        time.sleep(self.retry_delay * 2 ** attempt)
+
+        if status != "failed" and self.on_archive_ready:
+            self.on_archive_ready(archive.user, dest_path)
+        self._report(archive.user, archive, status)
+        return status
+
+    def run(self, users):
+        """
+        Downloads every archive of every user.
+
+        Returns:
+            dict: Per-user progress counters. "list_error" holds why a user's archives
+            could not be listed (None if they were).
+        """
+        archives = []
+        for user in users:
+            list_error = None
+            try:
+                user_archives = self.transport.list_archives(user)
+            except Exception as e:
+                print(f"[{user}] Could not list archives: {e}")
+                list_error = str(e)
+                user_archives = []
+            self.progress[user] = {"total": len(user_archives), "done": 0, "skipped": 0, "failed": 0,
+                                   "bytes": 0, "total_bytes": sum(a.size for a in user_archives),
+                                   "list_error": list_error}
+            print(f"[{user}] {len(user_archives)} archives to fetch")
+            archives.extend(user_archives)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self.fetch, archives))
+        return self.progress
+
+
+class ConversionStage:
+    """
+    Converts each user's mailbox as soon as all of their archives have landed.
+
+    Runs on its own thread, so conversion overlaps with the remaining downloads.
+
+    Args:
+        data_dir (str): Directory with one folder per user (the converter's start directory).
+        workers (int): Worker processes for the converter.
+        output_format (str): Output sink for the converter (see sinks.SINKS). None keeps its default.
+    """
+
+    def __init__(self, data_dir, workers=1, output_format=None):
+        self.data_dir = data_dir
+        self.workers = workers
+        self.output_format = output_format
+        self.ready = queue.Queue()
+        self.failed = {}  # User -> why their conversion failed
+        self.thread = threading.Thread(target=self._run, name="conversion", daemon=True)
+
+    def user_complete(self, user, ok):
+        """Download callback: queue a user for conversion once their archives are in place."""
+        if ok:
+            self.ready.put(user)
+        else:
+            print(f"[{user}] Not converting: some archives failed to download.")
+
+    def _run(self):
+        import mbox_convert  # Only needed when conversion is pipelined with the download
+        # The catalog, doors workbook, failure journal and run report go next to the converted mailboxes
+        mbox_convert.set_data_directory(os.path.abspath(self.data_dir))
+        if self.output_format:
+            mbox_convert.output_format = self.output_format
+
+        while True:
+            user = self.ready.get()
+            if user is None:
+                break
+            print(f"[{user}] Converting...")
+            try:
+                mbox_convert.find_and_convert_mbox_files(self.data_dir, workers=self.workers, root_names=[user])
+            except Exception as e:
+                print(f"[{user}] Conversion failed: {e}")
+                self.failed[user] = str(e)
+
+    def start(self):
+        self.thread.start()
+
+    def finish(self):
+        """Wait for every queued conversion to finish."""
+        self.ready.put(None)
+        self.thread.join()
 
 
 if __name__ == "__main__":
-    commands = [
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/jamie@homesteadcabinet.net/*.zip data/jamie@homesteadcabinet.net/',   # Jamie
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/jason@homesteadcabinet.net/*.zip data/jason@homesteadcabinet.net/',   # Jason
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/klay@homesteadcabinet.net/*.zip data/klay@homesteadcabinet.net/',    # Klay
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/mark@homesteadcabinet.net/*.zip data/mark@homesteadcabinet.net/',    # Mark
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/shaela@homesteadcabinet.net/*.zip data/shaela@homesteadcabinet.net/',  # Shaela
-        # 'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/tex@homesteadcabinet.net/*.zip data/tex@homesteadcabinet.net/',       # Tex
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/alex@homesteadcabinet.net/*.zip data/alex@homesteadcabinet.net/',  # Alex
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/bart@homesteadcabinet.net/*.zip data/bart@homesteadcabinet.net/',  # Bart
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/bill@homesteadcabinet.net/*.zip data/bill@homesteadcabinet.net/',  # Bill
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/bjardine@homesteadcabinet.net/*.zip data/bjardine@homesteadcabinet.net/',  # Bjardine
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/cameron@homesteadcabinet.net/*.zip data/cameron@homesteadcabinet.net/',  # Cameron
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/derek@homesteadcabinet.net/*.zip data/derek@homesteadcabinet.net/',  # Derek
-        'gcloud storage cp gs://takeout-export-7e419057-182d-41f3-b198-59966856c80b/20241203T172855Z/nick@homesteadcabinet.net/*.zip data/nick@homesteadcabinet.net/',  # Nick
-    ]
-
-    for command in commands:
-        run_shell_command(command)
+    parser = argparse.ArgumentParser(description="Download Google Takeout exports, optionally converting them as they land.")
+    parser.add_argument("--dest", default=DATA_DIR, help=f"Download directory. Default: {DATA_DIR}")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_DOWNLOADS,
+                        help=f"Concurrent downloads. Default: {MAX_CONCURRENT_DOWNLOADS}")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help=f"Retries per archive. Default: {MAX_RETRIES}")
+    parser.add_argument("--source-dir", help="Copy archives from this local directory instead of Cloud Storage")
+    parser.add_argument("--convert", action="store_true", help="Convert each user's mailbox once their archives land")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for conversion. Default: 1")
+    parser.add_argument("--format", help="Output format for conversion: xlsx, csv.gz or parquet. Default: xlsx")
+    args = parser.parse_args()
+
+    transport = LocalTransport(args.source_dir) if args.source_dir else GcloudTransport(EXPORT_URL)
+    conversion = ConversionStage(args.dest, workers=args.workers or os.cpu_count(),
+                                 output_format=args.format) if args.convert else None
+    if conversion:
+        conversion.start()
+
+    manager = DownloadManager(transport, args.dest, max_workers=args.concurrency, max_retries=args.retries,
+                              on_user_complete=conversion.user_complete if conversion else None)
+    try:
+        progress = manager.run(USERS)
+    finally:
+        if conversion:
+            conversion.finish()
+
+    not_listed = {user: state["list_error"] for user, state in progress.items() if state["list_error"]}
+    if not_listed:
+        print(f"Could not list archives for: {not_listed}")
+    failed = {user: state["failed"] for user, state in progress.items() if state["failed"]}
+    if failed:
+        print(f"Downloads failed for: {failed}")
+    if conversion and conversion.failed:
+        print(f"Conversion failed for: {conversion.failed}")
+    if not_listed or failed or (conversion and conversion.failed):
+        raise SystemExit(1)
@@ -0,0 +1,246 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory comes from GetProcessMemoryInfo instead
+    resource = None
+
+
+def _windows_peak_bytes():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+    get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not get_process_memory_info(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def peak_rss_mb(children=False):
+    """
+    Returns the peak resident memory of this process (or of its finished child processes).
+
+    On Windows the peak working set is reported; finished child processes are
+    not tracked there.
+
+    Returns:
+        float: Megabytes, or None where the platform doesn't report it.
+    """
+    if resource is None:
+        if sys.platform != "win32" or children:
+            return None
+        try:
+            peak = _windows_peak_bytes()
+        except (OSError, AttributeError):
+            return None
+        return round(peak / (1024 * 1024), 1) if peak is not None else None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class _Stage:
+    __slots__ = ("totals", "name", "messages", "size", "wall", "cpu")
+
+    def __init__(self, totals, name, messages, size, cpu):
+        self.totals, self.name, self.messages, self.size = totals, name, messages, size
+        self.cpu = 0.0 if cpu else None
+
+    def __enter__(self):
+        if self.cpu is not None:
+            self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu if self.cpu is not None else 0.0
+        totals = self.totals.get(self.name)
+        if totals is None:
+            totals = self.totals[self.name] = [0.0, 0.0, 0, 0, 0]
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += 1
+        totals[3] += self.messages
+        totals[4] += self.size
+        return False
+
+
+class StageClock:
+    """
+    Adds up wall time, CPU time, calls, messages and bytes per stage.
+
+    A clock is not shared between threads or processes: each worker fills its
+    own and sends `totals` back to be merged into the run's `RunStats`. Reading
+    the CPU clock is a system call, so per-message clocks can leave it out and
+    time wall clock only (a couple of microseconds per stage).
+
+    Attributes:
+        totals (dict): Stage name -> [wall seconds, CPU seconds, calls, messages, bytes].
+    """
+
+    def __init__(self, cpu=True):
+        self.totals = {}
+        self.cpu = cpu
+
+    def stage(self, name, messages=0, size=0):
+        """Time a block: `with clock.stage("parse_headers"):`."""
+        return _Stage(self.totals, name, messages, size, self.cpu)
+
+
+def _stage_dict(totals):
+    wall, cpu, calls, messages, size = totals
+    return {
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4) if cpu else None,
+        "calls": calls,
+        "messages": messages,
+        "bytes": size,
+        "messages_per_second": round(messages / wall, 1) if wall and messages else None,
+        "mb_per_second": round(size / (1024 * 1024) / wall, 2) if wall and size else None,
+    }
+
+
+class RunStats:
+    """
+    Collects the instrumentation of one conversion run and writes it as a JSON report.
+
+    Stage times and counters are kept per chunk and in total. Chunk-level data
+    is merged on the writer thread; the lock only guards against the reader
+    thread of the pipeline adding its own timings.
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.drops = {}
+        self.chunks = {}
+        self.worker_peak_rss_mb = None
+        self.profiles = []
+
+    def _chunk(self, chunk):
+        entry = self.chunks.get(chunk)
+        if entry is None:
+            entry = self.chunks[chunk] = {"stages": {}, "drops": {}}
+        return entry
+
+    @contextmanager
+    def stage(self, name, chunk=None, messages=0, size=0):
+        """
+        Times a block of work on the calling thread and adds it to the run (and chunk) totals.
+
+        Yields the running stage, so counts only known at the end can still be set
+        (`timed.messages = n`).
+        """
+        clock = StageClock()
+        with clock.stage(name, messages, size) as timed:
+            yield timed
+        self.add_stages(clock.totals, chunk)
+
+    def add_stages(self, totals, chunk=None):
+        """Merge the totals of a StageClock into the run (and chunk) totals."""
+        with self.lock:
+            targets = [self.stages] + ([self._chunk(chunk)["stages"]] if chunk is not None else [])
+            for target in targets:
+                for name, values in totals.items():
+                    current = target.setdefault(name, [0.0, 0.0, 0, 0, 0])
+                    for i, value in enumerate(values):
+                        current[i] += value
+
+    def count_drop(self, reason, chunk=None, count=1):
+        """Count messages dropped by a filter (or skipped) for a reason."""
+        with self.lock:
+            self.drops[reason] = self.drops.get(reason, 0) + count
+            if chunk is not None:
+                drops = self._chunk(chunk)["drops"]
+                drops[reason] = drops.get(reason, 0) + count
+
+    def note_worker_rss(self, peak):
+        """Keep the highest peak memory reported by a worker."""
+        if peak is not None:
+            with self.lock:
+                self.worker_peak_rss_mb = max(self.worker_peak_rss_mb or 0, peak)
+
+    def finish_chunk(self, chunk):
+        """Record the peak memory of the run so far against a finished chunk."""
+        with self.lock:
+            self._chunk(chunk)["peak_rss_mb"] = peak_rss_mb()
+
+    def profile(self, chunk, function, *args, **kwargs):
+        """
+        Runs `function` under cProfile and keeps the hottest functions for the report.
+
+        `write_report` saves the full profile next to the report as a .prof file,
+        which can be opened with pstats or snakeviz.
+        """
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            profile_stats = pstats.Stats(profiler)
+            top = []
+            for (file_name, line, function_name), (_, calls, own, cumulative, _) in sorted(
+                    profile_stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:25]:
+                top.append({"function": f"{os.path.basename(file_name)}:{line}({function_name})", "calls": calls,
+                            "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+            self.profiles.append({"chunk": chunk, "profiler": profiler, "top": top})
+
+    def report(self):
+        """
+        Returns the run summary.
+
+        Returns:
+            dict: Run totals, per-stage and per-chunk timings, filter drops and peak memory.
+        """
+        wall = time.perf_counter() - self.start_wall
+        with self.lock:
+            return {
+                "started": self.started.isoformat(timespec="seconds"),
+                "finished": datetime.now().isoformat(timespec="seconds"),
+                "wall_seconds": round(wall, 3),
+                "cpu_seconds": round(time.process_time() - self.start_cpu, 3),
+                "peak_rss_mb": peak_rss_mb(),
+                "worker_peak_rss_mb": self.worker_peak_rss_mb,
+                "stages": {name: _stage_dict(totals) for name, totals in self.stages.items()},
+                "drops": dict(self.drops),
+                "chunks": [{"chunk": chunk, "stages": {name: _stage_dict(totals) for name, totals in entry["stages"].items()},
+                            "drops": entry["drops"], "peak_rss_mb": entry.get("peak_rss_mb")}
+                           for chunk, entry in self.chunks.items()],
+                "profiles": [{"chunk": profile["chunk"], "file": profile.get("file"), "top": profile["top"]}
+                             for profile in self.profiles],
+            }
+
+    def write_report(self, report_path):
+        """
+        Writes the run summary as JSON, and any chunk profiles as .prof files beside it.
+
+        Args:
+            report_path (str): Path of the JSON report.
+        """
+        for number, profile in enumerate(self.profiles, start=1):
+            profile["file"] = f"{os.path.splitext(report_path)[0]}_profile_{number}.prof"
+            profile["profiler"].dump_stats(profile["file"])
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,205 @@
+import re
+from email.utils import parseaddr
+
+
+def _trie_pattern(terms):
+    """
+    Builds a regular expression from a prefix tree of the terms.
+
+    Terms that share a prefix share a branch ("door", "door shop", "door-style"
+    become `door(?:\ shop|\-style)?`), so the regex engine reads each character
+    of the text once per position instead of once per term.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a term
+
+    def build(node):
+        optional = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if optional else group
+
+    return build(trie)
+
+
+class TermMatcher:
+    """
+    Finds keywords or spam terms in text with a single compiled pattern.
+
+    Every term is folded into one prefix-tree regex. The regex is only tried
+    where the first word of a term occurs, found with plain `str.find` scans,
+    instead of at every position of the text.
+
+    Whole-word matching costs about twice as much as a substring check that
+    stops at the first hit: a text is only rejected once it has been scanned
+    for every term, and fragments such as "ad" in "already" must each be checked
+    (see benchmarks/bench_matcher.py).
+
+    Args:
+        terms (list[str]): Terms to look for. Matching is case-insensitive.
+        whole_words (bool): Only match terms that start and end on a word boundary,
+            so "ad" no longer matches "already" and "free" no longer matches "freeze".
+            With False, terms match anywhere, like a plain substring check.
+        plurals (bool): With whole_words, also match the plural of each term ("doors",
+            "issues", "offers"); an "s" or "es" may come before the closing boundary.
+
+    Attributes:
+        pattern (re.Pattern): The compiled pattern, for use on lower-cased text (e.g. with
+            pandas `Series.str.contains`). None when there are no terms.
+    """
+
+    def __init__(self, terms, whole_words=True, plurals=True):
+        self.terms = [" ".join(term.lower().split()) for term in terms if term.strip()]
+        self.whole_words = whole_words
+        self.plurals = plurals
+        self._lookup = {term: term for term in self.terms}
+
+        # Each space in a phrase matches any run of whitespace, so "click here"
+        # still matches when the phrase is wrapped onto the next line
+        pattern = _trie_pattern(self.terms).replace(r"\ ", r"\s+")
+        if whole_words:
+            pattern = r"(?<!\w)(?:" + pattern + ")" + ("(?:e?s)?" if plurals else "") + r"(?!\w)"
+        self.pattern = re.compile(pattern) if self.terms else None
+        # Every match starts with the first word of a term, so the regex is only tried where
+        # one occurs. Words that start with another first word are covered by the shorter one
+        first_words = sorted({term.split(" ")[0] for term in self.terms}, key=len)
+        self._first_words = [word for i, word in enumerate(first_words)
+                             if not any(word.startswith(shorter) for shorter in first_words[:i])]
+
+    def _match_starts(self, text):
+        # Positions of `text` (lower case) where a term could start, in no particular order
+        for word in self._first_words:
+            start = text.find(word)
+            while start != -1:
+                yield start
+                start = text.find(word, start + 1)
+
+    def search(self, *texts):
+        """
+        Checks whether any term appears in any of the texts.
+
+        Args:
+            *texts (str): Texts to check. None and empty values are skipped.
+
+        Returns:
+            bool: True as soon as one term is found.
+        """
+        if self.pattern is None:
+            return False
+        for text in texts:
+            if text:
+                text = text.lower()
+                if any(self.pattern.match(text, start) for start in self._match_starts(text)):
+                    return True
+        return False
+
+    def find_all(self, *texts):
+        """
+        Finds every term that appears in any of the texts.
+
+        Where several terms start at the same position (e.g. "door" and
+        "door shop"), the longest one is reported.
+
+        Args:
+            *texts (str): Texts to check. None and empty values are skipped.
+
+        Returns:
+            set[str]: The matched terms, as given to the constructor (lower case).
+        """
+        if self.pattern is None:
+            return set()
+        matched = set()
+        for text in texts:
+            if text:
+                text = text.lower()
+                for start in set(self._match_starts(text)):
+                    match = self.pattern.match(text, start)
+                    if match is not None:
+                        matched.add(self._term(" ".join(match.group().split())))
+        return matched
+
+    def _term(self, found):
+        # Plurals are reported as the term they matched ("doors" -> "door")
+        for key in (found, found[:-1], found[:-2]):
+            if key in self._lookup:
+                return self._lookup[key]
+        return found
+
+
+class SenderMatcher:
+    """
+    Checks sender addresses against a blocklist of addresses and domains.
+
+    Args:
+        addresses (list[str]): Exact email addresses to block.
+        domains (list[str]): Address suffixes to block, e.g. ".promo" or "marketing.com".
+    """
+
+    def __init__(self, addresses=(), domains=()):
+        self.addresses = frozenset(address.strip().lower() for address in addresses)
+        self.domains = tuple(domain.strip().lower() for domain in domains)
+
+    def matches(self, sender):
+        """
+        Checks whether a sender is blocked.
+
+        Args:
+            sender (str): A bare address or a full From header such as "Name <user@example.com>".
+
+        Returns:
+            bool: True if the address or its domain is on the blocklist.
+        """
+        if not sender:
+            return False
+        sender = str(sender).lower()
+        address = parseaddr(sender)[1] or sender.strip()
+        if address in self.addresses or sender in self.addresses:
+            return True
+        return bool(self.domains) and address.endswith(self.domains)
+
+
+# Lines that start the quoted history of earlier messages in a reply or forward.
+# All markers are alternatives of one pattern, so a body is scanned once.
+QUOTED_HISTORY_RE = re.compile(
+    r"^[ \t]*(?:"
+    r"On\s[^\n]{0,300}\swrote:[ \t]*$"  # Gmail / Apple Mail attribution
+    r"|On\s[^\n]{0,300}\n[ \t]*[^\n]{0,300}\swrote:[ \t]*$"  # ... wrapped onto a second line
+    r"|-{2,}[ \t]*(?i:original message|forwarded message)[ \t]*-{2,}"  # Outlook replies, Gmail forwards
+    r"|(?i:begin forwarded message):"  # Apple Mail forwards
+    r"|_{10,}[ \t]*\n[ \t]*From:"  # Outlook separator line above the header block
+    r"|From:[^\n]*\n[ \t]*(?:Sent|Date):"  # Outlook header block
+    r")",
+    re.MULTILINE)
+
+
+def quoted_history_start(body):
+    """
+    Finds where the quoted history of earlier messages starts in a reply or forward.
+
+    Markers that come before any text of the message itself (a plain forward,
+    whose content is the forwarded message) are skipped.
+
+    Args:
+        body (str): Plain text body.
+
+    Returns:
+        int: Offset of the first history marker after the message's own text, or
+        None when the body has no quoted history.
+    """
+    has_text = False
+    position = 0
+    for match in QUOTED_HISTORY_RE.finditer(body):
+        has_text = has_text or any(line.strip() and not line.lstrip().startswith('>')
+                                   for line in body[position:match.start()].splitlines())
+        if has_text:
+            return match.start()
+        position = match.end()
+    return None
@@ -1,11 +1,25 @@
 import os
-import mailbox
-import csv
-from email.utils import parsedate_to_datetime
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font
+import re
+import json
+import argparse
+import mmap
+import multiprocessing
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from datetime import datetime
 from tqdm import tqdm  # For progress bar
+from attachments import (ATTACHMENT_HEADER, attachment_manifest_path, is_attachment_manifest, manifest_output_file,
+                         scan_attachments)
+from catalog import ProcessingCatalog, content_hash, source_fingerprint
+from date_buckets import DATE_CACHE_SIZE, UNKNOWN_DATE, DateBucketer
+from failure_journal import JOURNAL_HEADERS, FailureJournal, journal_entry, read_journal, write_journal
+from dedup import SeenSet, message_dedup_key
+from matcher import SenderMatcher, TermMatcher, quoted_history_start
+from instrumentation import RunStats, StageClock, peak_rss_mb
+from pipeline import run_pipeline
+from mime_scan import find_text_body, parse_headers, split_raw_message
+from sinks import SINKS, ShardedOutput, dataset_path, get_sink, output_is_current
+from mbox_index import FROM_SEPARATOR, chunk_path, chunk_spans, chunk_sizes, message_spans, read_index, scan_message_starts, write_index
+from takeout_zip import MemberStream, find_mbox_members, group_archive_parts, member_fingerprint, member_size
 
 
 # Configuration
@@ -17,8 +31,34 @@ keywords = ['door', 'door-style', 'door shop', 'door procedure', 'problem', 'iss
             'hiccup', 'setback', 'disadvantage', 'weakness', 'shortcoming', 'deficiency',
             'failing', 'imperfection', 'blemish']
 chunk_size_gb = 2  # Size of each chunk in GB
-failed_items_csv = os.path.join(current_directory, "failed_messages.csv")
+copy_block_size = 64 * 1024 * 1024  # Bytes copied per write when splitting
+batch_size_mb = 8  # Size of each batch of messages handed to a worker process
+# Batches queued between the reader, the workers and the writer (about 2 x depth x batch_size_mb in flight).
+# Raised to twice the number of workers, so a large pool is never left waiting for batches
+pipeline_depth = 4
 door_emails_file = os.path.join(current_directory, "emails_about_doors_and_issues.xlsx")
+catalog_db = os.path.join(current_directory, "processing_catalog.sqlite3")  # Record of what has been converted
+failure_journal_file = os.path.join(current_directory, "failed_messages.jsonl")  # Where and why messages failed, for --replay-failures
+run_report_file = os.path.join(current_directory, "run_report.json")  # Stage timings, filter drops and memory of the last run
+dedup_capacity = 5_000_000  # Messages the in-memory deduplication filter is sized for (~9 MB)
+output_format = "xlsx"  # Output sink: "xlsx", "csv.gz" or "parquet" (needs pyarrow)
+# With "parquet": the monthly files of every root directory go into this one dataset, partitioned
+# as root_name=<root>/year_month=<YYYY-MM>/ (read it with pyarrow.dataset, partitioning="hive")
+dataset_dir = os.path.join(current_directory, "emails_dataset")
+max_rows_per_file = 100_000  # Rows per output file before it rolls over to a new numbered shard
+max_bytes_per_file = None  # Text per output file (characters, before compression) before it rolls over; None for no cap
+date_timezone = None  # Timezone output dates are converted to, e.g. "UTC" or "America/Chicago"; None keeps each sender's own
+list_attachments = False  # Write an attachment manifest next to each monthly output
+attachments_dir = None  # With list_attachments: extract each distinct attachment once into this directory; None to only list them
+# Settings the worker processes need, handed to them when the pool starts
+WORKER_SETTINGS = ("date_timezone", "strip_quoted_history", "list_attachments", "attachments_dir")
+# Settings that decide which emails are kept and what their rows hold. The catalog stores them per
+# root directory, and a root directory processed with other values is processed again
+ROW_SETTINGS = ("date_timezone", "strip_quoted_history", "list_attachments", "attachments_dir", "spam_keywords",
+                "ignored_senders", "match_whole_words", "match_plurals")
+# Settings that only decide which kept rows go to the doors workbook. When one changes, the
+# rows are matched again from the subject and body stored in the catalog
+DOOR_SETTINGS = ("keywords", "match_whole_words", "match_plurals")
 
 # Spam filtering configuration
 spam_keywords = [
@@ -31,16 +71,81 @@ ignored_senders = [
     "mailer-daemon@googlemail.com",
 ]
 
+# Cut replies at the quoted history of earlier messages ("On ... wrote:", forwarded and
+# Outlook "Original Message" blocks), not only at lines starting with ">"
+strip_quoted_history = True
+
+# Only match whole words and phrases, so "ad" doesn't match "already" and "free" doesn't match "freeze".
+# This trades speed for precision: matching runs at about half the speed of plain substring checks
+# (python -m benchmarks.bench_matcher). Set to False for substring matching
+match_whole_words = True
+match_plurals = True  # With match_whole_words, "doors", "issues" and "offers" still match "door", "issue" and "offer"
+keyword_matcher = TermMatcher(keywords, whole_words=match_whole_words, plurals=match_plurals)
+spam_matcher = TermMatcher(spam_keywords, whole_words=match_whole_words, plurals=match_plurals)
+sender_matcher = SenderMatcher(ignored_senders)
+date_bucketer = DateBucketer(date_timezone, DATE_CACHE_SIZE)
+MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+
 
 def parse_email_date(email_date):
-    """Parse the email date to extract year, month, and reformat it for Excel."""
-    try:
-        # Handle common date parsing using email.utils
-        parsed_date = parsedate_to_datetime(email_date)
-        # Return the date in Excel-compatible format (YYYY-MM-DD HH:MM:SS)
-        return parsed_date.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        return "Unknown"
+    """Parse the email date and reformat it for Excel (YYYY-MM-DD HH:MM:SS), or "Unknown"."""
+    return date_bucketer.bucket(email_date)[0]
+
+
+def set_data_directory(path):
+    """
+    Points the converter at another data directory.
+
+    The doors workbook, processing catalog, failure journal, run report and
+    Parquet dataset move along with it (keeping their file names), so everything a run writes ends
+    up in the same tree as the monthly outputs.
+
+    Args:
+        path (str): Directory with one folder per mailbox owner.
+    """
+    global current_directory, door_emails_file, catalog_db, failure_journal_file, run_report_file, dataset_dir
+    current_directory = path
+    door_emails_file = os.path.join(path, os.path.basename(door_emails_file))
+    catalog_db = os.path.join(path, os.path.basename(catalog_db))
+    failure_journal_file = os.path.join(path, os.path.basename(failure_journal_file))
+    run_report_file = os.path.join(path, os.path.basename(run_report_file))
+    dataset_dir = os.path.join(path, os.path.basename(dataset_dir))
+
+
+def set_date_timezone(name):
+    """
+    Sets the timezone output dates are converted to.
+
+    Args:
+        name (str): See `date_buckets.resolve_timezone`. None keeps each sender's own zone.
+
+    Raises:
+        ValueError: If the name is not a known timezone.
+    """
+    global date_timezone, date_bucketer
+    date_bucketer = DateBucketer(name, DATE_CACHE_SIZE)
+    date_timezone = name
+
+
+def configure_worker(settings):
+    """
+    Worker pool initializer: applies the main process's WORKER_SETTINGS.
+
+    Worker processes that import this module afresh (Windows) would otherwise
+    run with the defaults instead of the settings given on the command line.
+    """
+    globals().update(settings)
+    set_date_timezone(settings["date_timezone"])
+
+
+def message_ids(header_value):
+    """
+    Extracts the message ids from a References or In-Reply-To header.
+
+    Returns:
+        list[str]: The "<id@host>" values, in header order, without repeats.
+    """
+    return list(dict.fromkeys(MESSAGE_ID_RE.findall(header_value)))
 
 
 def is_spam_or_advertisement(email_from, subject, body):
@@ -56,23 +161,21 @@ def is_spam_or_advertisement(email_from, subject, body):
         bool: True if the email is spam or an advertisement; False otherwise.
     """
     # Check if the sender is blocked
-    if email_from.lower() in blocked_senders:
+    if sender_matcher.matches(email_from):
         return True
 
-    # Check for spam keywords in subject or body
-    subject_lower = subject.lower() if subject else ""
-    body_lower = body.lower() if body else ""
-    for keyword in spam_keywords:
-        if keyword in subject_lower or keyword in body_lower:
-            return True
-
-    return False
+    # Check for spam keywords in subject or body, in one pass over each
+    return spam_matcher.search(subject, body)
 
 
 def remove_quoted_lines(body):
     """
     Remove quoted lines from the email body (lines that start with '>').
 
+    With `strip_quoted_history`, everything from the first attribution line
+    ("On ... wrote:") or forwarded / original message block after the message's
+    own text is removed too.
+
     Args:
         body (str): The email body.
 
@@ -82,54 +185,180 @@ def remove_quoted_lines(body):
     if not body:
         return body
 
+    if strip_quoted_history:
+        history_start = quoted_history_start(body)
+        if history_start is not None:
+            body = body[:history_start].rstrip()
+
     lines = body.splitlines()
     filtered_lines = [line for line in lines if not line.strip().startswith('>')]
     return "\n".join(filtered_lines)
 
 
-def get_or_create_workbook(file_path, workbooks):
-    """Get or create an openpyxl Workbook for .xlsx files."""
-    if file_path not in workbooks:
-        wb = Workbook()
-        sheet = wb.active
-        sheet.title = "Emails"
-        # Append header row with bold formatting
-        header = ["From", "Subject", "Date", "Body"]
-        sheet.append(header)
-        for col in sheet[1]:
-            col.font = Font(bold=True)  # Make the header bold
-            col.alignment = Alignment(horizontal="left", vertical="top")  # Align to top-left
-        workbooks[file_path] = {"workbook": wb, "sheet": sheet}
-    return workbooks[file_path]
+def contains_keywords(text, keywords):
+    """
+    Check if the text contains any of the keywords.
 
+    Args:
+        text (str): Text to search.
+        keywords (TermMatcher | list): Compiled matcher, or a list of keywords to compile.
 
-def contains_keywords(text, keywords):
-    """Check if the text contains any of the keywords."""
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in keywords)
+    Returns:
+        bool: True if any keyword is found.
+    """
+    if not isinstance(keywords, TermMatcher):
+        keywords = TermMatcher(keywords, whole_words=match_whole_words, plurals=match_plurals)
+    return keywords.search(text)
 
 
-def save_workbooks(workbooks):
-    """Save all open workbooks and adjust row heights."""
-    for file_path, data in workbooks.items():
-        sheet = data["sheet"]
-        for row in sheet.iter_rows():
-            # Set each row height to 0.22
-            sheet.row_dimensions[row[0].row].height = 0.22 * 72  # Approximate height in points
-            for cell in row:
-                # Ensure all text is aligned top-left
-                cell.alignment = Alignment(horizontal="left", vertical="top")
-        data["workbook"].save(file_path)
+def output_location(file_path, sink):
+    """
+    Returns where a sink writes an output file, or None to write it next to its catalog name.
+
+    Sinks that write datasets (Parquet) put the monthly files into `dataset_dir`,
+    partitioned by root name and year-month. The doors workbook and the
+    attachment manifests have other columns, so they stay single files.
+    """
+    if not sink.dataset or file_path == door_emails_file or is_attachment_manifest(file_path):
+        return None
+    # Monthly outputs are named <root_name>_<YYYY-MM>.xlsx (see `complete_record`)
+    root_name, year_month = os.path.splitext(os.path.basename(file_path))[0].rsplit("_", 1)
+    return dataset_path(dataset_dir, [("root_name", root_name), ("year_month", year_month)], file_path, sink)
+
+
+def export_outputs(catalog, root_name=None, stats=None):
+    """
+    Writes every output file the catalog has marked dirty, one file at a time.
+
+    Each file is streamed straight from the catalog into the `output_format`
+    sink and saved once, so memory stays flat however many rows a month has.
+    Outputs larger than `max_rows_per_file` or `max_bytes_per_file` are split
+    into numbered shards listed in a manifest next to them. Parquet monthly
+    files are written into the partitioned dataset (see `output_location`).
+
+    Args:
+        catalog (ProcessingCatalog): The processing catalog.
+        root_name (str): Only write the files of this root directory's messages. The
+            doors workbook and other root directories' files (dirty only because this
+            root found copies of their messages) are left for a later export.
+        stats (RunStats): Optional run instrumentation.
+    """
+    stats = stats or RunStats()
+    sink = get_sink(output_format)
+    for file_path in catalog.outputs(dirty_only=True):
+        rows_file = manifest_output_file(file_path) if is_attachment_manifest(file_path) else file_path
+        if root_name is not None and not catalog.has_rows_from(rows_file, root_name):
+            continue
+        if is_attachment_manifest(file_path):
+            writer = ShardedOutput(file_path, sink, max_rows=max_rows_per_file, max_bytes=max_bytes_per_file,
+                                   header=ATTACHMENT_HEADER)
+            rows = catalog.attachment_rows(rows_file)
+            kind = "attachments"
+        else:
+            writer = ShardedOutput(file_path, sink, max_rows=max_rows_per_file, max_bytes=max_bytes_per_file,
+                                   path=output_location(file_path, sink))
+            rows = catalog.door_rows() if file_path == door_emails_file else catalog.output_rows(file_path)
+            kind = "emails"
+        with stats.stage("export_rows") as timed:
+            for row in rows:
+                writer.append(row)
+            timed.messages = writer.row_count
+        with stats.stage("export_save"):
+            shards = writer.save()
+        catalog.mark_clean(file_path)
+        if len(shards) == 1:
+            print(f"Saved {writer.row_count} {kind} to {shards[0]}")
+        else:
+            print(f"Saved {writer.row_count} {kind} to {len(shards)} files: {', '.join(os.path.basename(shard) for shard in shards)}")
+
+
+def restore_missing_outputs(catalog):
+    """Mark output files that were deleted since they were exported (or written in another format or with other shard caps), so they are written again."""
+    sink = get_sink(output_format)
+    missing = [file_path for file_path in catalog.outputs()
+               if not output_is_current(file_path, sink, max_rows_per_file, max_bytes_per_file)]
+    if missing:
+        catalog.mark_dirty(missing)
+
+
+def apply_setting_changes(catalog, root_names, rebuild=False):
+    """
+    Brings the catalog in line with the current ROW_SETTINGS and DOOR_SETTINGS.
+
+    The row settings are stored per root directory. If one changed since a root
+    directory was processed (or with `rebuild`), its messages are forgotten, so
+    its sources are processed again and its outputs written again. If only the
+    keywords changed, the doors workbook is worked out again from the subjects
+    and bodies in the catalog, without reading any mail. A catalog that has no
+    settings stored yet is taken to match the current ones.
+
+    Args:
+        catalog (ProcessingCatalog): The processing catalog.
+        root_names (list[str]): Root directories about to be processed.
+        rebuild (bool): Process these root directories again, whatever the settings.
+    """
+    row_settings = json.dumps({name: globals()[name] for name in ROW_SETTINGS}, sort_keys=True)
+    door_settings = json.dumps({name: globals()[name] for name in DOOR_SETTINGS}, sort_keys=True)
+
+    stored_door_settings = catalog.setting("door_settings")
+    if stored_door_settings not in (None, door_settings):
+        changed = catalog.recompute_doors(keyword_matcher.search)
+        print(f"The keywords changed since the last run: {changed} emails moved in or out of {door_emails_file}.")
+        catalog.mark_dirty([door_emails_file])
+    catalog.store_setting("door_settings", door_settings)
+
+    known_outputs = set(catalog.outputs())
+    for root_name in root_names:
+        stored_row_settings = catalog.setting(f"row_settings:{root_name}")
+        if rebuild or stored_row_settings not in (None, row_settings):
+            print(f"Reprocessing {root_name}" + (" (the row settings changed since it was processed)." if not rebuild else "."))
+            outputs = set(catalog.forget_messages(root_name))
+            outputs |= {attachment_manifest_path(output_file) for output_file in outputs} & known_outputs
+            catalog.mark_dirty(outputs | {door_emails_file})
+        catalog.store_setting(f"row_settings:{root_name}", row_settings)
+
+
+def _copy_range(infile, view, outfile, start, end, pbar):
+    """
+    Copies a byte range of the input mbox into a chunk file.
+
+    Uses zero-copy `os.sendfile` where the platform supports it and falls back to
+    large writes straight out of the memory map everywhere else.
+    """
+    pos = start
+    if hasattr(os, "sendfile"):
+        try:
+            while pos < end:
+                sent = os.sendfile(outfile.fileno(), infile.fileno(), pos, min(copy_block_size, end - pos))
+                if sent == 0:
+                    break
+                pos += sent
+                pbar.update(sent)
+        except OSError:
+            pass  # Not supported for this pair of files, finish with buffered writes
+
+    while pos < end:
+        block_end = min(pos + copy_block_size, end)
+        outfile.write(view[pos:block_end])
+        pbar.update(block_end - pos)
+        pos = block_end
 
 
 def split_mbox_by_size(input_mbox, output_dir, max_size_gb):
     """
     Splits a large mbox file into smaller chunks based on file size.
 
+    Chunks are only ever cut on a "From " separator, so no message is split across
+    two chunk files. An offset index (start, length per message) is written next
+    to the chunks for `validate_chunks` and the converter to use.
+
     Args:
         input_mbox (str): Path to the input mbox file.
         output_dir (str): Directory to save the output chunked mbox files.
         max_size_gb (int): Maximum size of each chunk in GB.
+
+    Returns:
+        list[str]: Paths of the chunk files that were created.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -137,223 +366,834 @@ def split_mbox_by_size(input_mbox, output_dir, max_size_gb):
     print("BLOWING CHUNKS.... PLEASE WAIT....")
 
     max_chunk_size = max_size_gb * 1024 * 1024 * 1024  # Convert GB to bytes
-    chunk_index = 0
-    current_chunk_size = 0
-    chunk_file = None
+    total_size = os.path.getsize(input_mbox)
+    if total_size == 0:
+        write_index(output_dir, [])
+        print(f"{input_mbox} is empty. No chunks created.")
+        return []
+
+    with open(input_mbox, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Find every message boundary with bulk scans, then group whole messages into chunks
+        spans = message_spans(scan_message_starts(mm), total_size)
+        chunk_bounds = []
+        chunk_start = 0
+        for start, length in spans:
+            if start > chunk_start and start + length - chunk_start > max_chunk_size:
+                chunk_bounds.append((chunk_start, start))
+                chunk_start = start
+        chunk_bounds.append((chunk_start, total_size))
+
+        index_rows = []
+        span_iter = iter(spans)
+        span = next(span_iter, None)
+        with memoryview(mm) as view:
+            for chunk_index, (start, end) in enumerate(chunk_bounds):
+                chunk_file_path = chunk_path(output_dir, chunk_index)
+                print(f"Creating chunk: {chunk_file_path}")
+                with open(chunk_file_path, 'wb') as chunk_file, \
+                        tqdm(total=end - start, desc=f"Chunk {chunk_index}", unit="B", unit_scale=True, unit_divisor=1024) as pbar:
+                    _copy_range(infile, view, chunk_file, start, end, pbar)
+
+                while span is not None and span[0] < end:
+                    index_rows.append((chunk_index, span[0] - start, span[1]))
+                    span = next(span_iter, None)
+
+    write_index(output_dir, index_rows)
+
+    print(f"Splitting complete. Created {len(chunk_bounds)} chunks with {len(spans)} messages in {output_dir}")
+    return [chunk_path(output_dir, i) for i in range(len(chunk_bounds))]
+
+
+def split_mbox_stream(stream, output_dir, max_size_gb, desc="Splitting", total_size=None):
+    """
+    Splits an mbox read from a stream (e.g. a member of a zip archive) into chunks.
 
-    with open(input_mbox, 'rb') as infile:
-        while True:
-            chunk_path = os.path.join(output_dir, f"chunk_{chunk_index}.mbox")
-            chunk_file = open(chunk_path, 'wb')
-            print(f"Creating chunk: {chunk_path}")
+    Works like `split_mbox_by_size` for data that can't be memory-mapped: the
+    stream is read in `copy_block_size` blocks, message boundaries are found
+    with bulk scans, and chunks are only cut between messages. Only the message
+    currently being read is held in memory.
 
-            # Progress bar for each chunk
-            with tqdm(total=max_chunk_size, desc=f"Chunk {chunk_index}", unit="B", unit_scale=True, unit_divisor=1024) as pbar:
-                current_chunk_size = 0
-                while current_chunk_size < max_chunk_size:
-                    line = infile.readline()
-                    if not line:  # End of file
-                        break
-                    chunk_file.write(line)
-                    current_chunk_size += len(line)
-                    pbar.update(len(line))
+    Args:
+        stream: Readable binary stream with the mbox data.
+        output_dir (str): Directory to save the output chunked mbox files.
+        max_size_gb (int): Maximum size of each chunk in GB.
+        desc (str): Label for the progress bar.
+        total_size (int): Uncompressed size of the mbox, if known, for the progress bar.
 
-            chunk_file.close()
-            chunk_index += 1
+    Returns:
+        list[str]: Paths of the chunk files that were created.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-            # Stop if we've reached the end of the file
-            if not line:  # No more data to read
-                break
+    print("BLOWING CHUNKS.... PLEASE WAIT....")
 
-    print(f"Splitting complete. Created {chunk_index} chunks in {output_dir}")
-    return [os.path.join(output_dir, f"chunk_{i}.mbox") for i in range(chunk_index)]
+    max_chunk_size = max_size_gb * 1024 * 1024 * 1024  # Convert GB to bytes
+    state = {"chunk_index": -1, "chunk_file": None, "chunk_size": 0}
+    index_rows = []
+    needle = b"\n" + FROM_SEPARATOR
+
+    def write_piece(piece):
+        # Start a new chunk when this message would push the current one over the limit
+        if state["chunk_file"] is None or (state["chunk_size"] > 0 and state["chunk_size"] + len(piece) > max_chunk_size):
+            if state["chunk_file"] is not None:
+                state["chunk_file"].close()
+            state["chunk_index"] += 1
+            state["chunk_size"] = 0
+            print(f"Creating chunk: {chunk_path(output_dir, state['chunk_index'])}")
+            state["chunk_file"] = open(chunk_path(output_dir, state["chunk_index"]), 'wb', buffering=copy_block_size)
+        if piece[:len(FROM_SEPARATOR)] == FROM_SEPARATOR:
+            index_rows.append((state["chunk_index"], state["chunk_size"], len(piece)))
+        state["chunk_file"].write(piece)
+        state["chunk_size"] += len(piece)
+
+    buf = bytearray()
+    start = 0  # Start of the message currently being read, within buf
+    scan_from = 0
+    try:
+        with tqdm(total=total_size, desc=desc, unit="B", unit_scale=True, unit_divisor=1024) as pbar:
+            while True:
+                block = stream.read(copy_block_size)
+                if not block:
+                    break
+                pbar.update(len(block))
+                del buf[:start]
+                scan_from -= start
+                start = 0
+                buf += block
+
+                with memoryview(buf) as view:
+                    pos = buf.find(needle, max(scan_from, 0))
+                    while pos != -1:
+                        write_piece(view[start:pos + 1])
+                        start = pos + 1
+                        pos = buf.find(needle, start)
+                scan_from = max(start, len(buf) - len(needle) + 1)
+
+            if len(buf) > start:
+                with memoryview(buf) as view:
+                    write_piece(view[start:])
+    finally:
+        if state["chunk_file"] is not None:
+            state["chunk_file"].close()
+
+    write_index(output_dir, index_rows)
+
+    chunk_count = state["chunk_index"] + 1
+    print(f"Splitting complete. Created {chunk_count} chunks with {len(index_rows)} messages in {output_dir}")
+    return [chunk_path(output_dir, i) for i in range(chunk_count)]
+
+
+def validate_chunks(chunk_dir, source_size):
+    """
+    Validates the chunk files in a directory against their offset index.
 
+    Args:
+        chunk_dir (str): Directory containing chunked mbox files.
+        source_size (int): Size in bytes of the mbox file the chunks were cut from.
 
-def validate_chunks(chunk_dir, expected_chunk_count):
+    Returns:
+        list[str]: Paths of the chunk files if they all match the index, None otherwise.
     """
-    Validates that all expected chunks exist in the chunk directory.
+    index = read_index(chunk_dir)
+    if index is None:
+        print(f"No offset index found in {chunk_dir}. Re-creating chunks.")
+        return None
+
+    sizes = chunk_sizes(index)
+    if source_size == 0 and not sizes:
+        return []
+    if sorted(sizes) != list(range(len(sizes))) or sum(sizes.values()) != source_size:
+        print(f"Offset index in {chunk_dir} does not match the source mbox. Re-creating chunks.")
+        return None
+
+    for chunk_index, size in sizes.items():
+        path = chunk_path(chunk_dir, chunk_index)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            print(f"Missing or truncated chunk detected in {chunk_dir}. Re-creating chunks.")
+            return None
+    return [chunk_path(chunk_dir, i) for i in range(len(sizes))]
+
+
+def complete_record(record, result, output_dir):
+    """
+    Fills in the catalog record of a message from its `process_message` result.
+
+    Rows with characters Excel can't store are turned into failures. Such characters
+    are removed from attachment file names instead.
 
     Args:
-        chunk_dir (str): Directory containing chunked mbox files.
-        expected_chunk_count (int): Number of expected chunks.
+        record (dict): Catalog record with the root_name and storage location of the message.
+        result (dict): The `process_message` result.
+        output_dir (str): Directory of the monthly output files.
 
     Returns:
-        bool: True if all expected chunks exist, False otherwise.
+        tuple[dict, dict]: The completed record and the (possibly changed) result.
     """
-    chunk_files = [f for f in os.listdir(chunk_dir) if f.startswith("chunk_") and f.endswith(".mbox")]
-    if len(chunk_files) == expected_chunk_count:
-        return True
-    print(f"Missing chunks detected in {chunk_dir}. Re-creating chunks.")
-    return False
+    record = dict(record, message_id=result["message_id"], status=result["status"])
+    if result["status"] in ("row", "attachments"):
+        row = result["row"]
+        if any(isinstance(value, str) and ILLEGAL_CHARACTERS_RE.search(value) for value in row):
+            # Rows with characters Excel can't store are journaled as failures
+            email_from, subject, formatted_date, _ = row
+            result = {"status": "failed", "message_id": result["message_id"], "stage": "check_row",
+                      "error_type": "IllegalCharacterError", "error": "Row contains characters Excel cannot store",
+                      "headers": {"From": email_from, "Subject": subject, "Date": formatted_date}}
+            record["status"] = "failed"
+        else:
+            # Define the output file path based on year and month
+            email_from, subject, formatted_date, body = row
+            record.update(output_file=os.path.join(output_dir, f"{record['root_name']}_{result['key']}.xlsx"),
+                          is_door=result["is_door"], email_from=email_from, subject=subject,
+                          date=formatted_date, body=body, parent_ids=" ".join(result["parent_ids"]) or None,
+                          attachments=[dict(attachment, filename=ILLEGAL_CHARACTERS_RE.sub("", attachment["filename"]))
+                                       if attachment["filename"] else attachment
+                                       for attachment in result.get("attachments") or ()])
+    return record, result
+
+
+def record_outputs(record):
+    """Return the output files a kept email appears in (its monthly file, the doors workbook, its attachment manifest)."""
+    if record["status"] == "attachments":
+        return {attachment_manifest_path(record["output_file"])}
+    outputs = {record["output_file"]}
+    if record["is_door"]:
+        outputs.add(door_emails_file)
+    if record.get("attachments"):
+        outputs.add(attachment_manifest_path(record["output_file"]))
+    return outputs
+
+
+def process_message(raw, keywords, clock=None):
+    """
+    Parses, filters and matches a single raw mbox message.
+
+    Headers are parsed first, so ignored senders are dropped without touching the
+    body. Only the plain text part is then decoded; attachments are never decoded.
 
+    This is the per-email work of the converter. It only depends on its arguments,
+    so it runs the same way in the main process and in worker processes.
 
-def save_to_csv(csv_path, data_row):
-    """Safely save a row of data to the CSV file."""
+    Args:
+        raw (bytes): The message bytes as stored in the mbox file.
+        keywords (TermMatcher): Matcher for the keywords that select an email for the doors workbook.
+        clock (StageClock): Optional clock that the time of each step is added to.
+
+    Returns:
+        dict: "status" is "row" for a kept email (with "key", "row", "is_door", the
+        "parent_ids" of the earlier messages it replies to and, with `list_attachments`,
+        its "attachments"), "attachments" for an email without a text body that is
+        only listed in the attachment manifest (with the same keys and no body),
+        "skip" for a filtered email (with the "reason"), or "failed" (with the "stage"
+        that failed, the "error_type" and "error", and the "headers" parsed before the
+        failure). "message_id" holds the Message-ID header when it could be read.
+    """
+    if clock is None:
+        clock = StageClock(cpu=False)
+    message_id = None
+    parsed_headers = {}
+    stage = "parse_headers"
     try:
-        with open(csv_path, mode='a', newline='', encoding='utf-8') as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow(data_row)
-    except Exception as csv_error:
-        print(f"ERROR: Failed to save row to CSV {csv_path}. Data: {data_row}. Error: {csv_error}")
+        with clock.stage(stage, 1, len(raw)):
+            # Only the headers are parsed up front; the body stays raw bytes
+            raw = bytes(raw)
+            header_block, raw_body = split_raw_message(raw.replace(b"\r\n", b"\n"))
+            headers = parse_headers(header_block)
+            parsed_headers = {name: str(headers[name]) for name in JOURNAL_HEADERS if headers[name] is not None}
+
+            # Extract essential headers
+            email_from = headers.get('From', '').strip().lower()
+            subject = headers.get('Subject', '').strip()
+            date = headers.get('Date', '').strip()
+            message_id = headers.get('Message-ID', '').strip() or None
+            # Earlier messages of the same conversation, for grouping into threads
+            parent_ids = message_ids(f"{headers.get('References', '')} {headers.get('In-Reply-To', '')}")
+
+        # Ignored senders are dropped before the body is looked at
+        if sender_matcher.matches(email_from):
+            return {"status": "skip", "reason": "ignored_sender", "message_id": message_id}
+
+        stage = "parse_date"
+        with clock.stage(stage, 1):
+            # Convert date to Excel-compatible format and get the year-month for grouping
+            formatted_date, key = date_bucketer.bucket(date)
+            if formatted_date == UNKNOWN_DATE:
+                # Broken or missing Date header: use when the message was received instead
+                from_line = raw.partition(b"\n")[0] if raw.startswith(b"From ") else b""
+                formatted_date, key = date_bucketer.bucket(None, headers.get_all('Received'),
+                                                           from_line.decode('ascii', 'replace'))
+
+        stage = "decode_body"
+        with clock.stage(stage, 1, len(raw_body)):
+            # Extract plain text body only: the first text/plain part that is not an
+            # attachment is located by its boundaries and is the only part decoded
+            body = find_text_body(headers, raw_body)
+            body = body.decode(errors='ignore') if body is not None else None
+
+        # If no body is found, skip this email (unless its attachments are listed)
+        if not body and not list_attachments:
+            return {"status": "skip", "reason": "no_body", "message_id": message_id}
+
+        if body:
+            stage = "remove_quotes"
+            with clock.stage(stage, 1, len(body)):
+                # Remove quoted lines from the email body
+                body = remove_quoted_lines(body)
+
+        stage = "spam_filter"
+        with clock.stage(stage, 1, len(body or "")):
+            # Filter out spam/advertisement emails
+            is_spam = is_spam_or_advertisement(email_from, subject, body)
+        if is_spam:
+            return {"status": "skip", "reason": "spam", "message_id": message_id}
+
+        found_attachments = None
+        if list_attachments:
+            stage = "attachments"
+            with clock.stage(stage, 1, len(raw_body)):
+                # Part headers are scanned and the encoded bytes hashed; nothing is decoded unless extracted
+                found_attachments = scan_attachments(headers, raw_body, attachments_dir)
+        if not body:
+            if not found_attachments:
+                return {"status": "skip", "reason": "no_body", "message_id": message_id}
+            # Emails with only attachments (scans, drawings, HTML-only mail) go to the manifest, not the text rows
+            return {"status": "attachments", "message_id": message_id, "key": key, "parent_ids": parent_ids,
+                    "row": [email_from, subject, formatted_date, None], "is_door": False,
+                    "attachments": found_attachments}
+
+        stage = "keyword_match"
+        with clock.stage(stage, 1, len(body)):
+            # Check for keywords in the email's subject or body
+            is_door = keywords.search(subject, body)
+        return {"status": "row", "message_id": message_id, "key": key, "parent_ids": parent_ids,
+                "row": [email_from, subject, formatted_date, body], "is_door": is_door,
+                "attachments": found_attachments}
+
+    except Exception as e:
+        return {"status": "failed", "message_id": message_id, "stage": stage, "error_type": type(e).__name__,
+                "error": str(e), "headers": parsed_headers}
 
 
-def clear_workbooks(workbooks, preserve_file=None):
+def message_batches(mbox_file, spans, keywords):
     """
-    Clears all workbooks from memory except the one to preserve.
+    Groups the messages of an mbox file into contiguous batches of roughly `batch_size_mb`.
 
     Args:
-        workbooks (dict): Dictionary of workbooks.
-        preserve_file (str): File path of the workbook to preserve.
+        mbox_file (str): Path to the mbox (chunk) file.
+        spans (list): (start, length) pairs of the messages in the file.
+        keywords (TermMatcher): Keyword matcher passed through to `process_message`.
+
+    Returns:
+        list[tuple]: (mbox_file, spans, keywords) work items for `process_batch`.
     """
-    files_to_clear = list(workbooks.keys())
-    for file_path in files_to_clear:
-        if file_path != preserve_file:
-            del workbooks[file_path]
-    print("Cleared all workbooks except:", preserve_file)
+    max_batch_bytes = batch_size_mb * 1024 * 1024
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for span in spans:
+        batch.append(span)
+        batch_bytes += span[1]
+        if batch_bytes >= max_batch_bytes:
+            batches.append((mbox_file, batch, keywords))
+            batch = []
+            batch_bytes = 0
+    if batch:
+        batches.append((mbox_file, batch, keywords))
+    return batches
+
+
+def read_batch(work_item):
+    """
+    Reads the raw bytes of one contiguous batch of messages from disk (the reader stage).
 
+    Args:
+        work_item (tuple): (mbox_file, spans, keywords) as built by `message_batches`.
 
-def mbox_to_excel_stream_grouped(mbox_file, root_name, keywords, workbooks, failed_csv_path):
-    """Convert a single mbox file to multiple Excel files grouped by year and month."""
-    try:
-        # Open the mbox file
-        mbox = mailbox.mbox(mbox_file)
-        total_messages = max(mbox.keys()) + 1  # Faster way to determine total messages
+    Returns:
+        tuple: (data, spans, keywords) for `process_batch`; spans are relative to the start of data.
+    """
+    mbox_file, spans, keywords = work_item
+    batch_start = spans[0][0]
+    with open(mbox_file, 'rb') as f:
+        f.seek(batch_start)
+        data = f.read(spans[-1][0] + spans[-1][1] - batch_start)
+    return data, [(start - batch_start, length) for start, length in spans], keywords
 
-        # Determine output directory (same as mbox file)
-        output_dir = os.path.dirname(mbox_file)
 
-        # Initialize progress bar
-        with tqdm(total=total_messages, desc=f"Processing {os.path.basename(mbox_file)}", unit="email") as pbar:
-            # Process emails
-            for i, message in enumerate(mbox):
-                try:
-                    # Extract essential headers
-                    email_from = message.get('From', '').strip().lower()
-                    subject = message.get('Subject', '').strip()
-                    date = message.get('Date', '').strip()
-
-                    # Convert date to Excel-compatible format
-                    formatted_date = parse_email_date(date)
-
-                    # Parse year and month for grouping
-                    year, month = formatted_date.split('-')[0], formatted_date.split('-')[1] if formatted_date != "Unknown" else ("Unknown", "Unknown")
-
-                    # Handle "Unknown" year/month
-                    if year == "Unknown" or month == "Unknown":
-                        key = "Unknown"
-                    else:
-                        key = f"{year}-{month}"
-
-                    # Extract plain text body only
-                    body = None
-                    if message.is_multipart():
-                        for part in message.walk():
-                            content_type = part.get_content_type()
-                            content_disposition = str(part.get("Content-Disposition", ""))
-                            # Only process plain text parts, skip attachments
-                            if content_type == "text/plain" and "attachment" not in content_disposition:
-                                body = part.get_payload(decode=True).decode(errors='ignore')
-                                break
-                    else:
-                        body = message.get_payload(decode=True).decode(errors='ignore')
+def process_batch(batch):
+    """
+    Processes each message of a batch read by `read_batch` (the worker stage).
 
-                    # If no body is found, skip this email
-                    if not body:
-                        pbar.update(1)
-                        continue
+    Returns:
+        tuple: (results, stage totals, peak RSS in MB) where results holds one
+        `process_message` result per message, in file order, and the stage totals
+        are the worker's `StageClock.totals` for the batch. The per-message steps
+        are timed by wall clock only; CPU time is taken once for the whole batch.
+    """
+    data, spans, keywords = batch
+    clock = StageClock(cpu=False)
+    batch_clock = StageClock()
+    with batch_clock.stage("process", len(spans), len(data)):
+        results = [process_message(data[start:start + length], keywords, clock) for start, length in spans]
+    clock.totals.update(batch_clock.totals)
+    return results, clock.totals, peak_rss_mb()
 
-                    # Remove quoted lines from the email body
-                    body = remove_quoted_lines(body)
 
-                    # Filter out spam/advertisement emails
-                    if is_spam_or_advertisement(email_from, subject, body):
-                        pbar.update(1)
-                        continue
+def fingerprint_batch(batch):
+    """
+    Works out the catalog content hash and deduplication key of each message of a batch read by `read_batch`.
 
-                    # Check for keywords in the email's subject or body
-                    if contains_keywords(subject, keywords) or contains_keywords(body, keywords):
-                        door_data = get_or_create_workbook(door_emails_file, workbooks)
-                        sheet = door_data["sheet"]
-                        sheet.append([email_from, subject, formatted_date, body])
+    Only the raw bytes are hashed and the headers scanned; nothing is decoded.
 
-                    # Define the output file path based on year and month
-                    output_file = os.path.join(output_dir, f"{root_name}_{key}.xlsx")
+    Returns:
+        list[tuple[str, str]]: (content_hash, dedup_key) per message, in file order.
+    """
+    data, spans, _ = batch
+    fingerprints = []
+    for start, length in spans:
+        raw = data[start:start + length]
+        fingerprints.append((content_hash(raw), message_dedup_key(raw)))
+    return fingerprints
 
-                    # Get or create workbook
-                    data = get_or_create_workbook(output_file, workbooks)
-                    sheet = data["sheet"]
-                    sheet.append([email_from, subject, formatted_date, body])
 
-                    # Update progress bar
-                    pbar.update(1)
+def fingerprint_messages(mbox_file, spans, pool=None, depth=None):
+    """
+    Works out the catalog content hash and deduplication key of every message.
 
-                except Exception as e:
-                    # Handle errors by saving to the CSV file
-                    save_to_csv(failed_csv_path, [email_from, subject, formatted_date, body])
-                    print(f"Failed to process message {i} in {mbox_file}. Error saved to CSV. Error: {e}")
+    The batches are read on a reader thread and hashed in the worker pool (or on
+    a worker thread), the same way `mbox_to_excel_stream_grouped` processes them,
+    so the calling thread only collects the results.
 
-        # Final save for all workbooks
-        save_workbooks(workbooks)
+    Args:
+        mbox_file (str): Path to the mbox (chunk) file.
+        spans (list): (start, length) pairs of the messages in the file.
+        pool (multiprocessing.pool.Pool): Optional worker pool.
+        depth (int): Batches queued between the stages. Defaults to pipeline_depth.
+
+    Returns:
+        list[tuple[str, str]]: (content_hash, dedup_key) per message.
+    """
+    batches = message_batches(mbox_file, spans, None)
+    return [fingerprint for batch_fingerprints in run_pipeline(batches, read_batch, fingerprint_batch, pool=pool,
+                                                               depth=depth or pipeline_depth)
+            for fingerprint in batch_fingerprints]
+
+
+def mbox_to_excel_stream_grouped(mbox_file, root_name, keywords, catalog, failure_journal, pool=None,
+                                 source_id=None, chunk_number=0, seen_messages=None, stats=None, profile=False,
+                                 depth=None):
+    """
+    Convert a single mbox file to rows grouped by year and month.
+
+    Rows are recorded in the processing catalog, one batch per transaction, and
+    the monthly Excel files are exported from it once the root directory is done.
+    Messages the catalog already has are skipped, so an interrupted chunk resumes
+    where it stopped. Copies of a message already seen in any mailbox are only
+    noted against the kept copy and are never decoded.
+
+    Args:
+        mbox_file (str): Path to the mbox (chunk) file.
+        root_name (str): Name used as the prefix of the monthly output files.
+        keywords (list | TermMatcher): Keywords that select an email for the doors workbook.
+        catalog (ProcessingCatalog): Catalog that records processed messages and their rows.
+        failure_journal (FailureJournal): Journal that failed messages are recorded in.
+        pool (multiprocessing.pool.Pool): Optional worker pool. Messages are processed
+            in the pool and merged back in file order, so the output is identical to a
+            serial run. Without a pool they are processed on a worker thread.
+        source_id (int): Catalog id of the source mbox the chunk was cut from.
+        chunk_number (int): Number of the chunk within its source.
+        seen_messages (SeenSet): Deduplication keys seen so far in this run, across all
+            root directories. Positives are confirmed against the catalog.
+        stats (RunStats): Run instrumentation that the chunk's stage timings, filter
+            drops and peak memory are added to.
+        profile (bool): Process the chunk in this thread under cProfile and add the
+            hottest functions to `stats`.
+        depth (int): Batches queued between the pipeline stages, which is also the most
+            batches in the pool at once. Defaults to pipeline_depth.
 
+    Returns:
+        bool: True if every message of the file was recorded.
+    """
+    if not isinstance(keywords, TermMatcher):
+        keywords = TermMatcher(keywords, whole_words=match_whole_words, plurals=match_plurals)
+    stats = stats or RunStats()
+
+    try:
+        # Message boundaries come from the offset index written by the splitter
+        spans = chunk_spans(mbox_file)
+        total_messages = len(spans)
+        total_bytes = sum(length for _, length in spans)
+
+        # Determine output directory (same as mbox file)
+        output_dir = os.path.dirname(mbox_file)
+
+        # Skip messages an earlier (possibly interrupted) run already recorded
+        with stats.stage("fingerprint", mbox_file, total_messages, total_bytes):
+            fingerprints = fingerprint_messages(mbox_file, spans, pool, depth)
+            known = catalog.known_hashes(root_name, [message_hash for message_hash, _ in fingerprints])
+        if known:
+            print(f"Skipping {len(known)} messages already in the catalog.")
+            stats.count_drop("already_in_catalog", mbox_file, len(known))
+
+        # Drop copies of messages already kept from this or another mailbox before they are parsed.
+        # Keys the seen-set may have are confirmed against the catalog in batches
+        maybe_seen = [dedup_key for message_hash, dedup_key in fingerprints
+                      if message_hash not in known and seen_messages is not None and dedup_key in seen_messages]
+        seen_before = catalog.known_dedup_keys(maybe_seen) if maybe_seen else set()
+        todo = []
+        duplicates = []
+        chunk_keys = set()
+        for span, (message_hash, dedup_key) in zip(spans, fingerprints):
+            if message_hash in known:
+                continue
+            record = {"root_name": root_name, "source": mbox_file, "content_hash": message_hash, "dedup_key": dedup_key,
+                      "source_id": source_id, "chunk": chunk_number, "byte_offset": span[0], "length": span[1]}
+            if dedup_key in chunk_keys or dedup_key in seen_before:
+                duplicates.append(dict(record, status="duplicate"))
+                continue
+            chunk_keys.add(dedup_key)
+            if seen_messages is not None:
+                seen_messages.add(dedup_key)
+            todo.append((span, record))
+
+        # Reading, parsing and recording overlap: a reader thread feeds the workers
+        # and this thread, the only one that touches the catalog, records results
+        batches = message_batches(mbox_file, [span for span, _ in todo], keywords)
+        read_clock = StageClock()
+
+        def timed_read_batch(work_item):
+            with read_clock.stage("read", len(work_item[1]), sum(length for _, length in work_item[1])):
+                return read_batch(work_item)
+
+        if profile:
+            results = stats.profile(mbox_file, lambda: [process_batch(timed_read_batch(batch)) for batch in batches])
+        else:
+            results = run_pipeline(batches, timed_read_batch, process_batch, pool=pool,
+                                   depth=depth or pipeline_depth)
+
+        # Initialize progress bar
+        with tqdm(total=total_messages, initial=total_messages - len(todo) - len(duplicates),
+                  desc=f"Processing {os.path.basename(mbox_file)}", unit="email") as pbar:
+            position = 0
+            failed = 0
+            for batch_results, batch_stages, worker_peak_rss in results:
+                stats.add_stages(batch_stages, mbox_file)
+                stats.note_worker_rss(worker_peak_rss)
+                batch_todo = todo[position:position + len(batch_results)]
+                position += len(batch_results)
+
+                records = []
+                dirty = set()
+                for (_, record), result in zip(batch_todo, batch_results):
+                    record, result = complete_record(record, result, output_dir)
+                    if result["status"] == "skip":
+                        stats.count_drop(result["reason"], mbox_file)
+                    elif result["status"] in ("row", "attachments"):
+                        dirty |= record_outputs(record)
+                    else:
+                        stats.count_drop("failed" if result["stage"] != "check_row" else "illegal_characters", mbox_file)
+                        failure_journal.add(record, result)
+                        failed += 1
+                    records.append(record)
+
+                with stats.stage("record", mbox_file, len(records)):
+                    catalog.record_messages(records)
+                    catalog.mark_dirty(dirty)
+                pbar.update(len(batch_results))
+            stats.add_stages(read_clock.totals, mbox_file)
+            failure_journal.flush()
+
+            # Duplicates are recorded after the kept copies, so they can be linked to them
+            if duplicates:
+                found_again = catalog.record_messages(duplicates)
+                catalog.mark_dirty({output_file for output_file, _ in found_again} |
+                                   ({door_emails_file} if any(is_door for _, is_door in found_again) else set()))
+                print(f"Skipped {len(duplicates)} messages already kept from another mailbox or chunk.")
+                stats.count_drop("duplicate", mbox_file, len(duplicates))
+                pbar.update(len(duplicates))
+
+        # The chunk's rows are added to the full-text index in one statement
+        with stats.stage("index", mbox_file):
+            catalog.index_new_rows()
+
+        stats.finish_chunk(mbox_file)
+        if failed:
+            print(f"WARNING: {failed} messages in {mbox_file} failed. See {failure_journal.journal_path}.")
         print(f"SUCCESS: Processed and grouped emails from {mbox_file}")
+        return True
 
     except Exception as e:
         print(f"ERROR: Failed to process {mbox_file}: {e}")
+        return False
+
+
+def find_mbox_sources(root_dir):
+    """
+    Finds every mbox in a root directory, on disk or inside Takeout zip archives.
+
+    Args:
+        root_dir (str): Directory of one exported mailbox.
+
+    Returns:
+        list[dict]: One source per mbox with its catalog "path", "chunk_dir",
+        "fingerprint" and a "split" function that cuts it into chunks.
+    """
+    sources = []
+    zip_files = []
+    for root, _, files in os.walk(root_dir):
+        if "chunks" in root:  # Ignore chunks directory
+            continue
+        for file in files:
+            if file.endswith('.mbox'):
+                mbox_file = os.path.join(root, file)
+                sources.append({
+                    "path": mbox_file,
+                    "chunk_dir": os.path.join(root, "chunks"),
+                    "fingerprint": source_fingerprint(mbox_file),
+                    "split": lambda chunk_dir, mbox_file=mbox_file: split_mbox_by_size(mbox_file, chunk_dir, chunk_size_gb),
+                })
+            elif file.lower().endswith('.zip'):
+                zip_files.append(os.path.join(root, file))
+
+    # Mbox files inside (multi-part) Takeout archives are streamed straight out of the zip
+    for export, part_paths in sorted(group_archive_parts(zip_files).items()):
+        for member, pieces in sorted(find_mbox_members(part_paths).items()):
+            member_name = os.path.splitext(os.path.basename(member))[0]
+            sources.append({
+                "path": f"{export}.zip::{member}",
+                "chunk_dir": os.path.join(os.path.dirname(export), "chunks", os.path.basename(export), member_name),
+                "fingerprint": member_fingerprint(pieces),
+                "split": lambda chunk_dir, pieces=pieces, member=member: _split_zip_member(pieces, member, chunk_dir),
+            })
+    return sources
+
+
+def _split_zip_member(pieces, member, chunk_dir):
+    with MemberStream(pieces) as stream:
+        return split_mbox_stream(stream, chunk_dir, chunk_size_gb, desc=f"Reading {os.path.basename(member)}",
+                                 total_size=member_size(pieces))
+
+
+def find_and_convert_mbox_files(start_dir, workers=1, root_names=None, report_path=None, profile_chunk=None,
+                                rebuild=False):
+    """
+    Recursively find and convert all mbox files in each root directory.
 
+    Mbox files inside Takeout .zip archives are read straight from the archive.
+    Sources, chunks and messages that the processing catalog already has are
+    skipped, so rerunning on an unchanged corpus only checks file fingerprints.
+    Root directories processed with other row settings are processed again (see
+    `apply_setting_changes`).
 
-def find_and_convert_mbox_files(start_dir):
-    """Recursively find and convert all mbox files in each root directory."""
+    Args:
+        start_dir (str): Directory containing one sub-directory per exported mailbox.
+        workers (int): Number of worker processes. 1 converts in this process.
+        root_names (list[str]): Only convert these root directories (e.g. the mailboxes
+            that have just finished downloading). All of them by default.
+        report_path (str): Where to write the JSON run report. Defaults to run_report_file.
+        profile_chunk (str): Chunk to run under cProfile, as "N" (chunk N of every
+            mailbox) or "root:N" (chunk N of the mailboxes in one root directory).
+        rebuild (bool): Process the sources of these root directories again, even if the
+            catalog has them and the settings are unchanged.
+    """
     print(f"Scanning directory: {start_dir}")
-    root_dirs = [os.path.join(start_dir, d) for d in os.listdir(start_dir) if os.path.isdir(os.path.join(start_dir, d))]
+    root_dirs = [os.path.join(start_dir, d) for d in os.listdir(start_dir) if os.path.isdir(os.path.join(start_dir, d))
+                 and (root_names is None or d in root_names)]
 
     if not root_dirs:
         print("No root directories found.")
         return
 
-    workbooks = {}  # Dictionary to track open workbooks
+    catalog = ProcessingCatalog(catalog_db)
+    apply_setting_changes(catalog, [os.path.basename(root_dir) for root_dir in root_dirs], rebuild)
+    restore_missing_outputs(catalog)
+
+    pool = None
+    depth = max(pipeline_depth, 2 * workers)  # Enough batches in flight to keep every worker busy
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=configure_worker,
+                                    initargs=({name: globals()[name] for name in WORKER_SETTINGS},))
+    stats = RunStats()
+    failure_journal = FailureJournal(failure_journal_file)
+    # Deduplication keys of every message seen so far, across all root directories. Filled
+    # from the catalog once a source needs processing, so an unchanged rerun never reads them
+    seen_messages = None
 
-    for root_dir in root_dirs:
-        root_name = os.path.basename(root_dir)  # Use root directory name for file naming
-        print(f"Processing root directory: {root_name}")
+    try:
+        for root_dir in root_dirs:
+            root_name = os.path.basename(root_dir)  # Use root directory name for file naming
+            print(f"Processing root directory: {root_name}")
+
+            for source in find_mbox_sources(root_dir):
+                mbox_file, chunk_dir, fingerprint = source["path"], source["chunk_dir"], source["fingerprint"]
+                if catalog.source_is_complete(mbox_file, fingerprint):
+                    print(f"{mbox_file} is unchanged since it was processed. Skipping.")
+                    continue
+                source_id = catalog.begin_source(mbox_file, root_name, fingerprint)
+                if seen_messages is None:
+                    with stats.stage("seed_dedup") as timed:
+                        seen_messages = SeenSet(dedup_capacity)
+                        for dedup_key in catalog.dedup_keys():
+                            seen_messages.add(dedup_key)
+                        timed.messages = seen_messages.count
+
+                # Check if chunks exist and match their offset index
+                chunks = validate_chunks(chunk_dir, fingerprint[0]) if os.path.exists(chunk_dir) else None
+                if chunks is not None:
+                    print(f"Valid chunks already exist for {mbox_file}. Skipping chunk creation.")
+                else:
+                    print(f"Re-chunking {mbox_file} into {chunk_dir}.")
+                    with stats.stage("split", size=fingerprint[0]):
+                        chunks = source["split"](chunk_dir)
+
+                # Process each chunk
+                complete = True
+                for chunk_number, chunk in enumerate(chunks):
+                    if catalog.chunk_is_complete(source_id, chunk_number):
+                        print(f"Chunk already processed: {chunk}")
+                        continue
+                    print(f"Processing chunk: {chunk}")
+                    profile = profile_chunk in (str(chunk_number), f"{root_name}:{chunk_number}")
+                    if mbox_to_excel_stream_grouped(chunk, root_name, keyword_matcher, catalog, failure_journal,
+                                                    pool, source_id, chunk_number, seen_messages, stats, profile,
+                                                    depth):
+                        catalog.complete_chunk(source_id, chunk_number)
+                    else:
+                        complete = False
+                if complete:
+                    catalog.complete_source(source_id)
+
+            # Monthly workbooks are complete once the root directory is done
+            export_outputs(catalog, root_name=root_name, stats=stats)
+
+        # The emails_about_doors workbook collects rows from every root directory, and files of
+        # earlier root directories may list a mailbox that a later one found their messages in
+        export_outputs(catalog, stats=stats)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        catalog.close()
+        failure_journal.flush()
+        report_path = report_path or run_report_file
+        try:
+            stats.write_report(report_path)
+            print(f"Run report written to {report_path}")
+        except OSError as e:
+            print(f"WARNING: Could not write the run report {report_path}: {e}")
 
-        for root, _, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith('.mbox') and "chunks" not in root:  # Ignore chunks directory
-                    mbox_file = os.path.join(root, file)
+    print("Processing complete.")
 
-                    # Chunk directory
-                    chunk_dir = os.path.join(root, "chunks")
 
-                    # Determine expected chunk count
-                    total_size = os.path.getsize(mbox_file)
-                    expected_chunk_count = (total_size // (chunk_size_gb * 1024 * 1024 * 1024)) + 1
+def replay_failures(journal_path=None):
+    """
+    Processes the messages of the failure journal again, without reprocessing their chunks.
 
-                    # Check if chunks exist and are valid
-                    if os.path.exists(chunk_dir) and validate_chunks(chunk_dir, expected_chunk_count):
-                        print(f"Valid chunks already exist for {mbox_file}. Skipping chunk creation.")
-                        chunks = [os.path.join(chunk_dir, f"chunk_{i}.mbox") for i in range(expected_chunk_count)]
-                    else:
-                        print(f"Re-chunking {mbox_file} into {chunk_dir}.")
-                        chunks = split_mbox_by_size(mbox_file, chunk_dir, chunk_size_gb)
+    Each journaled message is read straight from its byte offset in its source
+    file. Messages that now convert (or are now filtered) replace their failed
+    record in the catalog, and the outputs they belong to are exported again.
+    Messages that still fail, or whose source file has changed, stay in the journal.
 
-                    # Process each chunk
-                    for chunk in chunks:
-                        print(f"Processing chunk: {chunk}")
-                        mbox_to_excel_stream_grouped(chunk, root_name, keywords, workbooks, failed_items_csv)
+    Args:
+        journal_path (str): The failure journal. Defaults to failure_journal_file.
+    """
+    journal_path = journal_path or failure_journal_file
+    entries = read_journal(journal_path)
+    if not entries:
+        print(f"No failed messages to replay in {journal_path}.")
+        return
 
-        # Clear workbooks except for the emails_about_doors workbook
-        clear_workbooks(workbooks, preserve_file=door_emails_file)
+    # A message journaled again by a resumed run is replayed once
+    unique = {}
+    for entry in entries:
+        unique.setdefault((entry["root_name"], entry["content_hash"]), entry)
+    sources = {}
+    for entry in unique.values():
+        sources.setdefault(entry["source"], []).append(entry)
+
+    catalog = ProcessingCatalog(catalog_db)
+    remaining = []
+    resolved = []
+    dirty = set()
+    try:
+        for source, source_entries in sources.items():
+            if not source or not os.path.exists(source):
+                print(f"WARNING: {source} no longer exists. Keeping its {len(source_entries)} failed messages in the journal.")
+                remaining.extend(source_entries)
+                continue
+            with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for entry in tqdm(source_entries, desc=f"Replaying {os.path.basename(source)}", unit="email"):
+                    raw = mm[entry["offset"]:entry["offset"] + entry["length"]]
+                    if content_hash(raw) != entry["content_hash"]:
+                        print(f"WARNING: The message at byte {entry['offset']} of {source} has changed. Keeping it in the journal.")
+                        remaining.append(entry)
+                        continue
+                    record = {"root_name": entry["root_name"], "source": source, "content_hash": entry["content_hash"],
+                              "source_id": entry["source_id"], "chunk": entry["chunk"],
+                              "byte_offset": entry["offset"], "length": entry["length"]}
+                    record, result = complete_record(record, process_message(raw, keyword_matcher), os.path.dirname(source))
+                    if result["status"] == "failed":
+                        remaining.append(journal_entry(record, result))
+                        continue
+                    resolved.append(record)
+                    if result["status"] in ("row", "attachments"):
+                        dirty |= record_outputs(record)
 
-    print("Processing complete.")
+        updated = catalog.resolve_failures(resolved)
+        catalog.mark_dirty(dirty)
+        write_journal(journal_path, remaining)
+        print(f"Replayed {len(unique)} failed messages: {updated} resolved, {len(remaining)} still failing or unavailable.")
+        export_outputs(catalog)
+    finally:
+        catalog.close()
 
 
 if __name__ == '__main__':
-    if os.path.exists(current_directory):
-        # Initialize the failed items CSV with a header
-        with open(failed_items_csv, mode='w', newline='', encoding='utf-8') as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow(["From", "Subject", "Date", "Body"])
+    parser = argparse.ArgumentParser(description="Convert Google Takeout mbox files to monthly Excel workbooks.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (0 = one per CPU core). Default: 1")
+    parser.add_argument("--format", choices=sorted(SINKS), default=output_format,
+                        help=f"Output file format. Default: {output_format}")
+    parser.add_argument("--max-rows", type=int, default=max_rows_per_file,
+                        help=f"Rows per output file before it is split into numbered shards. Default: {max_rows_per_file}")
+    parser.add_argument("--max-bytes", type=int, default=max_bytes_per_file,
+                        help="Characters of text per output file before it is split into numbered shards. Default: no cap")
+    parser.add_argument("--timezone", default=date_timezone,
+                        help="Convert dates to this timezone, e.g. UTC, +02:00 or America/Chicago. "
+                             "Default: keep each sender's own timezone")
+    parser.add_argument("--report", default=run_report_file,
+                        help=f"Where to write the JSON run report. Default: {run_report_file}")
+    parser.add_argument("--replay-failures", nargs="?", const=failure_journal_file, metavar="JOURNAL",
+                        help=f"Only process the messages in the failure journal again. Default journal: {failure_journal_file}")
+    parser.add_argument("--profile-chunk", metavar="[ROOT:]N",
+                        help="Process chunk N (of every mailbox, or of root directory ROOT) in this process under cProfile "
+                             "and add its hottest functions to the run report")
+    parser.add_argument("--attachments", action="store_true", default=list_attachments,
+                        help="Also write an attachment manifest (file name, type, size, SHA-256) next to each monthly output")
+    parser.add_argument("--extract-attachments", metavar="DIR", default=attachments_dir,
+                        help="Save each distinct attachment once into DIR, named by its SHA-256 (implies --attachments)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Process every mailbox again instead of only what the processing catalog does not have yet")
+    args = parser.parse_args()
 
-        find_and_convert_mbox_files(current_directory)
+    try:
+        get_sink(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    output_format = args.format
+    max_rows_per_file = args.max_rows
+    max_bytes_per_file = args.max_bytes
+    list_attachments = args.attachments or args.extract_attachments is not None
+    attachments_dir = os.path.abspath(args.extract_attachments) if args.extract_attachments else None
+    try:
+        set_date_timezone(args.timezone)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.replay_failures:
+        replay_failures(args.replay_failures)
+    elif os.path.exists(current_directory):
+        find_and_convert_mbox_files(current_directory, workers=args.workers or os.cpu_count(),
+                                    report_path=args.report, profile_chunk=args.profile_chunk, rebuild=args.rebuild)
     else:
         print(f"Error: Directory {current_directory} does not exist.")
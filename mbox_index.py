@@ -0,0 +1,141 @@
+import csv
+import mmap
+import os
+
+
+# Byte offset index for mbox files. Every message starts on a line beginning with "From ".
+FROM_SEPARATOR = b"From "
+INDEX_FILE_NAME = "index.csv"
+INDEX_HEADER = ["chunk", "start", "length"]
+
+
+def scan_message_starts(buf, end=None):
+    """
+    Finds the byte offset of every "From " separator line in an mbox buffer.
+
+    The scan uses bulk `find` calls, so it runs at memory speed on an mmap
+    instead of looping over the file one line at a time.
+
+    Args:
+        buf (mmap.mmap | bytes): The mbox data.
+        end (int): Offset to stop scanning at. Defaults to the end of the buffer.
+
+    Returns:
+        list[int]: Offsets of the first byte of each message.
+    """
+    if end is None:
+        end = len(buf)
+
+    starts = []
+    if buf[:len(FROM_SEPARATOR)] == FROM_SEPARATOR:
+        starts.append(0)
+
+    needle = b"\n" + FROM_SEPARATOR
+    pos = buf.find(needle, 0, end)
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = buf.find(needle, pos + 1, end)
+    return starts
+
+
+def message_spans(starts, end):
+    """
+    Turns a list of message start offsets into (start, length) pairs.
+
+    Args:
+        starts (list[int]): Offsets returned by `scan_message_starts`.
+        end (int): Offset of the end of the data (usually the file size).
+
+    Returns:
+        list[tuple[int, int]]: One (start, length) pair per message.
+    """
+    stops = starts[1:] + [end]
+    return [(start, stop - start) for start, stop in zip(starts, stops)]
+
+
+def index_path(chunk_dir):
+    """Return the path of the offset index stored alongside a set of chunks."""
+    return os.path.join(chunk_dir, INDEX_FILE_NAME)
+
+
+def chunk_path(chunk_dir, chunk_index):
+    """Return the path of a numbered chunk file."""
+    return os.path.join(chunk_dir, f"chunk_{chunk_index}.mbox")
+
+
+def write_index(chunk_dir, rows):
+    """
+    Writes the offset index for a set of chunks.
+
+    Args:
+        chunk_dir (str): Directory containing the chunk files.
+        rows (iterable): (chunk, start, length) tuples. `start` is relative to the chunk file.
+    """
+    with open(index_path(chunk_dir), mode='w', newline='', encoding='utf-8') as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(INDEX_HEADER)
+        csv_writer.writerows(rows)
+
+
+def read_index(chunk_dir):
+    """
+    Reads the offset index for a set of chunks.
+
+    Args:
+        chunk_dir (str): Directory containing the chunk files.
+
+    Returns:
+        dict: Maps chunk number to a list of (start, length) pairs, or None if there is no index.
+    """
+    path = index_path(chunk_dir)
+    if not os.path.exists(path):
+        return None
+
+    index = {}
+    with open(path, mode='r', newline='', encoding='utf-8') as f:
+        csv_reader = csv.reader(f)
+        if next(csv_reader, None) != INDEX_HEADER:
+            return None
+        for chunk, start, length in csv_reader:
+            index.setdefault(int(chunk), []).append((int(start), int(length)))
+    return index
+
+
+def chunk_sizes(index):
+    """
+    Works out the expected size of every chunk file from its index.
+
+    Args:
+        index (dict): Index returned by `read_index`.
+
+    Returns:
+        dict: Maps chunk number to the expected file size in bytes.
+    """
+    return {chunk: spans[-1][0] + spans[-1][1] for chunk, spans in index.items() if spans}
+
+
+def chunk_spans(chunk_file):
+    """
+    Returns the (start, length) spans of the messages in one chunk file.
+
+    The spans come from the chunk directory's offset index when it covers the
+    chunk, otherwise the chunk is scanned for "From " separators.
+
+    Args:
+        chunk_file (str): Path to a chunk (or any mbox) file.
+
+    Returns:
+        list[tuple[int, int]]: One (start, length) pair per message.
+    """
+    name = os.path.basename(chunk_file)
+    if name.startswith("chunk_") and name.endswith(".mbox"):
+        index = read_index(os.path.dirname(chunk_file))
+        chunk_number = name[len("chunk_"):-len(".mbox")]
+        if index is not None and chunk_number.isdigit() and int(chunk_number) in index:
+            return index[int(chunk_number)]
+
+    size = os.path.getsize(chunk_file)
+    if size == 0:
+        return []
+    with open(chunk_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return message_spans(scan_message_starts(mm), size)
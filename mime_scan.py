@@ -0,0 +1,305 @@
+import re
+from email.parser import BytesHeaderParser
+
+
+# Lazy MIME scanning: headers are parsed on their own and the body is only
+# searched for part boundaries. A part's payload is decoded only when asked for.
+
+_header_parser = BytesHeaderParser()
+
+# Lines that can belong to a header block, as in email.feedparser: a header, a continuation
+# line or a Unix "From " line. Any other line starts the body, even without a blank line first
+_HEADER_LINE_RE = re.compile(rb"From |[\041-\071\073-\176]*:|[\t ]")
+_BODY_LINE_RE = re.compile(rb"\n(?!From |[\041-\071\073-\176]*:|[\t ]|\Z)")
+
+
+def _body_line(data, start, end):
+    # Start of the first line in data[start:end] that can't be a header, or None
+    if start < end and not _HEADER_LINE_RE.match(data, start, end):
+        return start
+    match = _BODY_LINE_RE.search(data, start, end)
+    return match.start() + 1 if match is not None else None
+
+
+def split_raw_message(raw):
+    """
+    Splits the raw bytes of an mbox message into its header block and body.
+
+    The leading "From " line is dropped. Nothing is decoded.
+
+    Args:
+        raw (bytes | memoryview): The message bytes as stored in the mbox file.
+
+    Returns:
+        tuple[bytes, bytes]: (headers, body)
+    """
+    raw = bytes(raw)
+    if raw.startswith(b"From "):
+        newline = raw.find(b"\n")
+        raw = raw[newline + 1:] if newline != -1 else b""
+    for blank_line in (b"\n", b"\r\n"):
+        if raw.startswith(blank_line):  # No headers at all
+            return b"", raw[len(blank_line):]
+
+    end = raw.find(b"\n\n")
+    crlf_end = raw.find(b"\r\n\r\n")
+    if crlf_end != -1 and (end == -1 or crlf_end < end):
+        header_end, body_start = crlf_end, crlf_end + 4
+    elif end == -1:
+        header_end = body_start = len(raw)
+    else:
+        header_end, body_start = end, end + 2
+    body_line = _body_line(raw, 0, header_end)
+    if body_line is not None:
+        return raw[:max(0, body_line - 1)], raw[body_line:]
+    return raw[:header_end], raw[body_start:]
+
+
+def part_span(body, start=0, end=None):
+    """
+    Finds the header block and body of one MIME part within a larger buffer (a part may have no headers).
+
+    The headers end at the first blank line, or at the first line that can't be a header.
+
+    Returns:
+        tuple[int, int]: End of the header block and start of the body, as offsets into `body`.
+    """
+    end = len(body) if end is None else end
+    if body.startswith(b"\n", start, end):
+        return start, start + 1
+    header_end = body.find(b"\n\n", start, end)
+    body_line = _body_line(body, start, header_end if header_end != -1 else end)
+    if body_line is not None:
+        return max(start, body_line - 1), body_line
+    if header_end == -1:
+        return end, end
+    return header_end, header_end + 2
+
+
+def split_part(segment):
+    """Split one MIME part into its header block and body (a part may have no headers)."""
+    header_end, body_start = part_span(segment)
+    return segment[:header_end], segment[body_start:]
+
+
+def parse_headers(header_block):
+    """
+    Parses a header block on its own.
+
+    Returns:
+        email.message.Message: A message with the headers and an empty payload.
+    """
+    return _header_parser.parsebytes(header_block + b"\n\n")
+
+
+def _lines_starting_with(body, prefix, start, end):
+    if body.startswith(prefix, start, end):
+        yield start
+    position = body.find(b"\n" + prefix, start, end)
+    while position != -1:
+        yield position + 1
+        position = body.find(b"\n" + prefix, position + 1, end)
+
+
+def multipart_spans(body, boundary, start=0, end=None):
+    """
+    Finds the parts of a multipart body by scanning for its boundary lines.
+
+    Follows the email package's rules: a boundary line is the delimiter at the
+    start of a line followed only by "--" (closing) and/or blanks, the preamble
+    and epilogue are dropped and the line break before each boundary belongs to
+    the boundary. Nothing is copied; the parts are returned as offsets.
+
+    Args:
+        body (bytes): Buffer holding the multipart body (newlines already normalised to \\n).
+        boundary (str): The boundary parameter of the Content-Type header.
+        start (int): Offset of the multipart body in `body`.
+        end (int): End of the multipart body in `body`. Defaults to the end of the buffer.
+
+    Returns:
+        list[tuple[int, int]]: (start, end) of each raw part (headers and body), or None
+        if the boundary never appears or the closing delimiter comes before any part.
+    """
+    end = len(body) if end is None else end
+    return _scan_multipart(body, boundary, start, end)[0]
+
+
+def _scan_multipart(body, boundary, start, end):
+    # (spans, end): the parts of a multipart body, or None if it has none, and where the body
+    # ends. A closing delimiter before any part leaves only the preamble, as in the email package
+    separator = b"--" + boundary.encode("ascii", "surrogateescape")
+    spans = []
+    part_start = None
+    for position in _lines_starting_with(body, separator, start, end):
+        line_end = body.find(b"\n", position, end)
+        if line_end == -1:
+            line_end = end
+        rest = body[position + len(separator):line_end].rstrip(b" \t")
+        if rest not in (b"", b"--"):
+            continue
+        if part_start is not None:
+            spans.append((part_start, max(part_start, position - 1)))
+        if rest == b"--":  # Closing delimiter
+            if part_start is None:
+                return None, position
+            return spans, end
+        part_start = line_end + 1
+
+    if part_start is None:
+        return None, end
+    # Without a closing delimiter the last part runs to the end. At the end of the message,
+    # the line break that ends it is dropped, as the email package does
+    part_end = end - 1 if end == len(body) and body.endswith(b"\n", part_start, end) else end
+    spans.append((min(part_start, part_end), part_end))
+    return spans, end
+
+
+def split_multipart(body, boundary):
+    """
+    Splits a multipart body into its raw parts (see `multipart_spans`).
+
+    Returns:
+        list[bytes]: The raw parts (headers and body), or None if the boundary never appears.
+    """
+    spans = multipart_spans(body, boundary)
+    return [body[start:end] for start, end in spans] if spans is not None else None
+
+
+def _message_part_spans(headers, body, start, end):
+    # (spans, end) as in _scan_multipart, with no spans for a body that is not multipart
+    if headers.get_content_maintype() != "multipart":
+        return None, end
+    boundary = headers.get_boundary()
+    spans, body_end = _scan_multipart(body, boundary, start, end) if boundary else (None, end)
+    if spans is None and body_end == end and body.startswith(b"\n", end):
+        # The email package keeps the newline before the next boundary in the text of a
+        # multipart that has no parts (it only takes it off the payload of other parts)
+        body_end += 1
+    return spans, body_end
+
+
+def message_parts(headers, body):
+    """Return the raw parts of a multipart message, or None if its body is not split into parts."""
+    spans, _ = _message_part_spans(headers, body, 0, len(body))
+    return [body[start:end] for start, end in spans] if spans is not None else None
+
+
+def _split_part_span(body, start, end):
+    # (header_end, body_start, end) of a part or nested message. Headers that run up to
+    # the next boundary are ended by the newline before it, which leaves no body
+    header_end, body_start = part_span(body, start, end)
+    if header_end == body_start == end and body.startswith(b"\n", end):
+        return header_end, end + 1, end + 1
+    return header_end, body_start, end
+
+
+def _walk_subpart_spans(headers, body, spans):
+    for part_start, part_end in spans:
+        header_end, body_start, part_end = _split_part_span(body, part_start, part_end)
+        part_headers = parse_headers(body[part_start:header_end])
+        if headers.get_content_type() == "multipart/digest" and "content-type" not in part_headers:
+            part_headers.set_default_type("message/rfc822")
+        yield from walk_part_spans(part_headers, body, body_start, part_end)
+
+
+def _header_block_spans(body, start, end):
+    # message/delivery-status: blocks of headers, each ended by a blank line. As in the email
+    # package, the newline just past the part (the one before a boundary) can end a block too
+    stop = end + 1 if body.startswith(b"\n", end) else end
+    position = start
+    while True:
+        if body.startswith(b"\n", position, stop):
+            block_end = position
+        else:
+            blank_line = body.find(b"\n\n", position, stop)
+            block_end = blank_line + 1 if blank_line != -1 else stop
+        yield position, min(block_end, end)
+        position = block_end + 1
+        if position >= stop:
+            return
+
+
+def walk_part_spans(headers, body, start=0, end=None):
+    """
+    Yields (headers, start, end) for a message and all of its parts, depth first.
+
+    Like `walk_parts`, but each part's body is given as offsets into `body`, so
+    large parts such as attachments are never copied. As in the email package,
+    the body of any message/* part is a message of its own, and each header
+    block of a message/delivery-status part is a part without a body.
+
+    Args:
+        headers (email.message.Message): Headers of the message, from `parse_headers`.
+        body (bytes): Raw body of the message.
+        start (int): Offset of the message body in `body`.
+        end (int): End of the message body in `body`. Defaults to the end of the buffer.
+    """
+    end = len(body) if end is None else end
+    spans, end = _message_part_spans(headers, body, start, end)
+    yield headers, start, end
+
+    if spans is not None:
+        yield from _walk_subpart_spans(headers, body, spans)
+    elif headers.get_content_type() == "message/delivery-status":
+        for block_start, block_end in _header_block_spans(body, start, end):
+            yield parse_headers(body[block_start:block_end]), block_end, block_end
+    elif headers.get_content_maintype() == "message":
+        header_end, body_start, end = _split_part_span(body, start, end)
+        yield from walk_part_spans(parse_headers(body[start:header_end]), body, body_start, end)
+
+
+def walk_parts(headers, body):
+    """
+    Yields (headers, body) for a message and all of its parts, depth first.
+
+    This visits parts in the same order as `email.message.Message.walk`, but only
+    part headers are parsed; attachment payloads are skipped over, not decoded.
+
+    Args:
+        headers (email.message.Message): Headers of the message, from `parse_headers`.
+        body (bytes): Raw body of the message.
+    """
+    for part_headers, start, end in walk_part_spans(headers, body):
+        yield part_headers, body[start:end]
+
+
+def decode_payload(headers, body):
+    """
+    Decodes one part's body according to its Content-Transfer-Encoding.
+
+    Returns:
+        bytes: The decoded payload, exactly as `get_payload(decode=True)` would return it.
+    """
+    headers.set_payload(body.decode("ascii", "surrogateescape"))
+    return headers.get_payload(decode=True)
+
+
+def find_text_body(headers, body):
+    """
+    Returns the decoded bytes of a message's plain text body.
+
+    For multipart (and message/*) messages this is the first text/plain part
+    that is not an attachment; only that part is decoded. Otherwise it is the
+    whole body.
+
+    Args:
+        headers (email.message.Message): Headers of the message, from `parse_headers`.
+        body (bytes): Raw body of the message.
+
+    Returns:
+        bytes: The decoded body, or None if there is no plain text part.
+    """
+    spans, end = _message_part_spans(headers, body, 0, len(body))
+    if spans is not None:
+        parts = _walk_subpart_spans(headers, body, spans)
+    elif headers.get_content_maintype() == "message":
+        parts = walk_part_spans(headers, body)
+    else:
+        return decode_payload(headers, body[:end])
+
+    for part_headers, start, end in parts:
+        content_disposition = str(part_headers.get("Content-Disposition", ""))
+        # Only process plain text parts, skip attachments
+        if part_headers.get_content_type() == "text/plain" and "attachment" not in content_disposition:
+            return decode_payload(part_headers, body[start:end])
+    return None
@@ -0,0 +1,118 @@
+import queue
+import threading
+
+
+# Marks the end of a stage's output
+_DONE = object()
+# Seconds a blocked stage waits before checking whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class _StageError:
+    """Carries an exception raised in a stage thread to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Ready:
+    """A result computed on the worker thread, with the same `get` as a pool AsyncResult."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def _put(stage_queue, item, stop):
+    # Blocks while the queue is full (backpressure), but gives up once the pipeline is stopped
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(stage_queue, stop):
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(items, read, process, pool=None, depth=4):
+    """
+    Runs read -> process -> consume as three overlapping stages joined by bounded queues.
+
+    A reader thread calls `read` on each item. The results are handed to `process`,
+    either in a worker pool or on a worker thread. The caller consumes the
+    processed results in item order from this generator, so it is the single
+    writer and anything it owns (such as an SQLite connection) stays on its thread.
+
+    Each queue holds at most `depth` items. A stage that gets ahead of the next one
+    blocks, so the memory in flight is bounded by the queue depths, not by the
+    number of items. With a pool, about `depth` + 2 items are processed at once,
+    so `depth` should be at least the number of pool processes. If any stage
+    raises, the pipeline stops and the exception is raised to the caller. If the
+    caller stops early, the stages are stopped too.
+
+    Args:
+        items (iterable): Work items, e.g. batches of messages.
+        read (callable): Reader stage: item -> data (runs on the reader thread).
+        process (callable): Worker stage: data -> result. Must be picklable if a pool is used.
+        pool (multiprocessing.pool.Pool): Optional worker pool for `process`.
+        depth (int): Capacity of each queue between stages.
+
+    Yields:
+        The result of `process` for each item, in item order.
+    """
+    stop = threading.Event()
+    read_queue = queue.Queue(maxsize=depth)
+    result_queue = queue.Queue(maxsize=depth)
+
+    def reader():
+        try:
+            for item in items:
+                if not _put(read_queue, read(item), stop):
+                    return
+        except BaseException as e:
+            _put(read_queue, _StageError(e), stop)
+            return
+        _put(read_queue, _DONE, stop)
+
+    def worker():
+        while True:
+            data = _get(read_queue, stop)
+            if data is _DONE or isinstance(data, _StageError):
+                _put(result_queue, data, stop)
+                return
+            try:
+                result = pool.apply_async(process, (data,)) if pool is not None else _Ready(process(data))
+            except BaseException as e:
+                _put(result_queue, _StageError(e), stop)
+                return
+            if not _put(result_queue, result, stop):
+                return
+
+    threads = [threading.Thread(target=reader, name="pipeline-reader", daemon=True),
+               threading.Thread(target=worker, name="pipeline-worker", daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            result = result_queue.get()
+            if result is _DONE:
+                break
+            if isinstance(result, _StageError):
+                raise result.error
+            yield result.get()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -6,4 +6,5 @@ set delay=7200
 echo Delaying for %delay% seconds...
 timeout /T %delay% /NOBREAK
 
-python get_exported_data.py
+@REM Download the exports and convert each mailbox as soon as its archives have landed
+python get_exported_data.py --convert
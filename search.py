@@ -0,0 +1,88 @@
+import argparse
+import sqlite3
+import time
+import mbox_convert
+from catalog import ProcessingCatalog
+from sinks import ShardedOutput, sink_for_path
+
+
+# Named searches for --saved, as `ProcessingCatalog.search` filters. "doors" selects the
+# emails of the doors workbook by the keyword flag stored when they were converted, so it
+# matches the converter's word-boundary and plural rules exactly (FTS5 does no stemming)
+SAVED_QUERIES = {
+    "doors": {"door_only": True},
+}
+
+
+def search_catalog(catalog, query, output_file=None, show=20, **filters):
+    """
+    Runs one query against the catalog, prints the first matches and optionally exports all of them.
+
+    Args:
+        catalog (ProcessingCatalog): The processing catalog built by mbox_convert.py.
+        query (str): Full-text query (see `ProcessingCatalog.search`). None matches every row.
+        output_file (str): Path of a file to write the matches to. Its extension picks
+            the format (.xlsx, .csv.gz or .parquet). Large exports roll over to numbered
+            shards at mbox_convert's row and size caps.
+        show (int): Number of matches to print.
+        **filters: since, until, sender, mailbox, limit and door_only, passed to `ProcessingCatalog.search`.
+
+    Returns:
+        int: The number of matching emails.
+    """
+    start_time = time.perf_counter()
+    writer = None
+    if output_file:
+        writer = ShardedOutput(output_file, sink_for_path(output_file), max_rows=mbox_convert.max_rows_per_file,
+                               max_bytes=mbox_convert.max_bytes_per_file)
+    count = 0
+    for row in catalog.search(query, **filters):
+        if count < show:
+            email_from, subject, date = row[:3]
+            print(f"{date}  {(email_from or '')[:40]:<40}  {(subject or '')[:70]}")
+        if writer is not None:
+            writer.append(row)
+        count += 1
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    if count > show:
+        print(f"... and {count - show} more")
+    print(f"Found {count} emails in {elapsed_ms:.0f} ms.")
+
+    if writer is not None:
+        shards = writer.save()
+        print(f"Saved {writer.row_count} emails to {', '.join(shards)}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search the converted emails. Queries use SQLite FTS5 syntax: words, \"quoted phrases\", "
+                    "AND / OR / NOT, parentheses, prefixes (delay*) and column filters (subject:hinge).")
+    parser.add_argument("query", nargs="?", help="Full-text query, e.g. 'hinge* AND (delay OR late)'")
+    parser.add_argument("--saved", choices=sorted(SAVED_QUERIES),
+                        help="Run a saved search (combined with the query and filters, if any)")
+    parser.add_argument("--since", help="Earliest date or date prefix, e.g. 2024-03 (inclusive)")
+    parser.add_argument("--until", help="Latest date or date prefix, e.g. 2024-06 (inclusive)")
+    parser.add_argument("--sender", help="Only emails whose From address contains this text")
+    parser.add_argument("--mailbox", help="Only emails found in this root directory")
+    parser.add_argument("--limit", type=int, help="Stop after this many matches")
+    parser.add_argument("--output", help="Write the matching emails to this file (.xlsx, .csv.gz or .parquet)")
+    parser.add_argument("--show", type=int, default=20, help="Number of matches to print (default: 20)")
+    parser.add_argument("--catalog", default=mbox_convert.catalog_db,
+                        help=f"Processing catalog to search (default: {mbox_convert.catalog_db})")
+    args = parser.parse_args()
+
+    query = args.query
+    saved = SAVED_QUERIES[args.saved] if args.saved else {}
+    if not query and not saved and not (args.since or args.until or args.sender or args.mailbox):
+        parser.error("give a query, --saved or at least one filter")
+
+    catalog = ProcessingCatalog(args.catalog)
+    try:
+        catalog.index_new_rows()  # Rows of a conversion that was interrupted before it indexed them
+        search_catalog(catalog, query, output_file=args.output, show=args.show, since=args.since,
+                       until=args.until, sender=args.sender, mailbox=args.mailbox, limit=args.limit, **saved)
+    except (sqlite3.OperationalError, ValueError) as e:
+        print(f"ERROR: Invalid query {query!r}: {e}")
+    finally:
+        catalog.close()
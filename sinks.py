@@ -0,0 +1,370 @@
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import os
+from urllib.parse import quote
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only the Parquet sink needs it
+    pa = pq = None
+
+
+# Columns of every output file
+OUTPUT_HEADER = ["From", "Subject", "Date", "Body", "Mailboxes"]
+
+# Shared spreadsheet styles
+HEADER_STYLE = "email_header"
+CELL_STYLE = "email_cell"
+TOP_LEFT = Alignment(horizontal="left", vertical="top")
+ROW_HEIGHT_POINTS = 0.22 * 72  # Approximate row height in points
+
+EXCEL_MAX_ROWS = 1_048_576  # Rows in one Excel sheet, header included
+MANIFEST_SUFFIX = ".manifest.json"
+
+PARQUET_ROW_GROUP_ROWS = 10000  # Rows buffered before a Parquet row group is written
+PARQUET_COMPRESSION = "zstd"
+
+
+class OutputSink:
+    """
+    Base class for the writers that turn catalog rows into output files.
+
+    A sink is opened for one output file, receives (From, Subject, Date, Body,
+    Mailboxes) rows through `append` and finishes the file in `save`. Rows are
+    streamed, so memory stays flat however many rows an output has.
+
+    Args:
+        file_path (str): Path of the file to write, with the sink's extension.
+        header (list[str]): Column names, for outputs other than the email rows
+            (such as attachment manifests). Defaults to OUTPUT_HEADER.
+    """
+
+    extension = ""
+    header = OUTPUT_HEADER
+    max_rows = None  # Most rows the format can hold in one file
+    dataset = False  # Monthly outputs are written into one partitioned dataset directory (see `dataset_path`)
+
+    def __init__(self, file_path, header=None):
+        self.file_path = file_path
+        self.row_count = 0
+        if header is not None:
+            self.header = header
+
+    def append(self, row):
+        """Write one row."""
+        raise NotImplementedError
+
+    def save(self):
+        """Finish the file. Can only be called once."""
+        raise NotImplementedError
+
+
+class XlsxSink(OutputSink):
+    """
+    A write-only Excel workbook that streams rows to disk as they are appended.
+
+    Styles are shared named styles, so alignment and row height are not set cell
+    by cell, and the file is only written out once, when `save` is called.
+    """
+
+    extension = ".xlsx"
+    max_rows = EXCEL_MAX_ROWS - 1  # One row is the header
+
+    def __init__(self, file_path, header=None):
+        super().__init__(file_path, header)
+        self.workbook = Workbook(write_only=True)
+        self.workbook.add_named_style(NamedStyle(name=HEADER_STYLE, font=Font(bold=True), alignment=TOP_LEFT))
+        self.workbook.add_named_style(NamedStyle(name=CELL_STYLE, alignment=TOP_LEFT))
+        self.sheet = self.workbook.create_sheet("Emails")
+        # Every row is 0.22 inches tall, set once for the sheet instead of per row
+        self.sheet.sheet_format.defaultRowHeight = ROW_HEIGHT_POINTS
+        self.sheet.sheet_format.customHeight = True
+        self.sheet.append([self._cell(value, HEADER_STYLE) for value in self.header])
+
+    def _cell(self, value, style):
+        cell = WriteOnlyCell(self.sheet, value=value)
+        cell.style = style
+        return cell
+
+    def append(self, row):
+        self.sheet.append([self._cell(value, CELL_STYLE) for value in row])
+        self.row_count += 1
+
+    def save(self):
+        self.workbook.save(self.file_path)
+
+
+class CsvGzSink(OutputSink):
+    """Writes rows to a gzip-compressed UTF-8 CSV file with a header line."""
+
+    extension = ".csv.gz"
+
+    def __init__(self, file_path, header=None):
+        super().__init__(file_path, header)
+        self.file = gzip.open(file_path, 'wt', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.header)
+
+    def append(self, row):
+        self.writer.writerow(row)
+        self.row_count += 1
+
+    def save(self):
+        self.file.close()
+
+
+class ParquetSink(OutputSink):
+    """
+    Writes rows to a compressed Parquet file, one row group per PARQUET_ROW_GROUP_ROWS rows.
+
+    Every monthly output holds one root directory and one month, so the converter
+    writes them into one dataset directory partitioned by root name and
+    year-month, which pyarrow.dataset reads as a whole. Requires pyarrow.
+    """
+
+    extension = ".parquet"
+    dataset = True
+
+    def __init__(self, file_path, header=None):
+        super().__init__(file_path, header)
+        self.schema = pa.schema([(name, pa.string()) for name in self.header])
+        self.writer = pq.ParquetWriter(file_path, self.schema, compression=PARQUET_COMPRESSION)
+        self.rows = []
+
+    def _write_row_group(self):
+        columns = list(zip(*self.rows)) if self.rows else [[] for _ in self.header]
+        self.writer.write_table(pa.Table.from_arrays(
+            [pa.array([value if value is None or isinstance(value, str) else str(value) for value in column],
+                      type=pa.string()) for column in columns], schema=self.schema))
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(tuple(row))
+        self.row_count += 1
+        if len(self.rows) >= PARQUET_ROW_GROUP_ROWS:
+            self._write_row_group()
+
+    def save(self):
+        if self.rows or not self.row_count:
+            self._write_row_group()
+        self.writer.close()
+
+
+SINKS = {
+    "xlsx": XlsxSink,
+    "csv.gz": CsvGzSink,
+    "parquet": ParquetSink,
+}
+
+
+def get_sink(name):
+    """
+    Looks up an output sink by format name.
+
+    Args:
+        name (str): One of the keys of SINKS.
+
+    Returns:
+        type: The OutputSink subclass.
+
+    Raises:
+        ValueError: If the format is unknown or its optional dependency is missing.
+    """
+    if name not in SINKS:
+        raise ValueError(f"Unknown output format {name!r}, expected one of {', '.join(SINKS)}")
+    if name == "parquet" and pq is None:
+        raise ValueError("The parquet output format requires pyarrow (pip install pyarrow)")
+    return SINKS[name]
+
+
+def sink_for_path(file_path):
+    """Return the sink matching a file's extension (the xlsx sink when none matches)."""
+    for name, sink in SINKS.items():
+        if file_path.lower().endswith(sink.extension):
+            return get_sink(name)
+    return XlsxSink
+
+
+def output_path(file_path, sink):
+    """
+    Returns the path an output file is written to by a sink.
+
+    The catalog names outputs with an .xlsx extension; other sinks swap it for theirs.
+    """
+    if file_path.endswith(sink.extension):
+        return file_path
+    return os.path.splitext(file_path)[0] + sink.extension
+
+
+def dataset_path(dataset_dir, partitions, file_path, sink):
+    """
+    Returns where an output file goes in a Hive-partitioned dataset directory.
+
+    Partition values are URL-encoded, as pyarrow expects. The file name keeps
+    the output's name and adds a short hash of the directory it is named in, so
+    outputs of the same partition from different mailboxes don't overwrite each other.
+
+    Args:
+        dataset_dir (str): Root of the dataset.
+        partitions (list[tuple[str, str]]): (column, value) pairs, outermost first,
+            e.g. [("root_name", "bob"), ("year_month", "2024-03")].
+        file_path (str): Path of the output, as named in the catalog.
+        sink (type): OutputSink subclass that writes the file.
+
+    Returns:
+        str: e.g. dataset_dir/root_name=bob/year_month=2024-03/bob_2024-03-1a2b3c4d.parquet
+    """
+    directory = os.path.join(dataset_dir, *(f"{column}={quote(str(value), safe='')}" for column, value in partitions))
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    digest = hashlib.blake2b(os.path.dirname(os.path.abspath(file_path)).encode(), digest_size=4).hexdigest()
+    return os.path.join(directory, f"{stem}-{digest}{sink.extension}")
+
+
+def manifest_path(file_path):
+    """Return the path of the shard manifest of an output file."""
+    return os.path.splitext(file_path)[0] + MANIFEST_SUFFIX
+
+
+def read_manifest(file_path):
+    """Return the shard manifest of an output file, or None if it has none."""
+    try:
+        with open(manifest_path(file_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def shard_row_cap(sink, max_rows=None):
+    """Return the rows per shard for a sink: the requested cap, within the format's own limit."""
+    caps = [cap for cap in (max_rows, sink.max_rows) if cap]
+    return min(caps) if caps else None
+
+
+def output_is_current(file_path, sink, max_rows=None, max_bytes=None):
+    """
+    Checks whether every file of an output exists in a sink's format, sharded at the given caps.
+
+    Outputs exported before shards existed have no manifest; for those only the
+    single file is checked. Shards are listed relative to the output's directory.
+    """
+    manifest = read_manifest(file_path)
+    if manifest is None:
+        return os.path.exists(output_path(file_path, sink))
+    directory = os.path.dirname(file_path)
+    return (manifest.get("format") == sink.extension.lstrip(".")
+            and manifest.get("max_rows") == shard_row_cap(sink, max_rows)
+            and manifest.get("max_bytes") == max_bytes
+            and all(os.path.exists(os.path.join(directory, shard["file"])) for shard in manifest["shards"]))
+
+
+class ShardedOutput:
+    """
+    Writes one logical output, rolling over to a new numbered shard at a row or size cap.
+
+    An output that fits in one shard keeps its plain name (alice_2024-03.xlsx);
+    a larger one becomes alice_2024-03_part001.xlsx, alice_2024-03_part002.xlsx, ...
+    Shards are written under temporary names and renamed in `save`, which also
+    writes a manifest (alice_2024-03.manifest.json) listing the shards and removes
+    shards of the same format left over from an earlier export of the same output.
+    Files in other formats are left alone, so switching --format keeps them.
+
+    Args:
+        file_path (str): Path of the logical output, as named in the catalog.
+        sink (type): OutputSink subclass to write the shards with.
+        max_rows (int): Most rows per shard. The format's own limit (Excel's sheet
+            size) always applies.
+        max_bytes (int): Most text per shard, counted as the characters of the row
+            values before compression. None for no size cap.
+        header (list[str]): Column names, if not OUTPUT_HEADER.
+        path (str): Where to write the output (e.g. its `dataset_path`), if not next to
+            `file_path`. The manifest stays next to `file_path`.
+    """
+
+    def __init__(self, file_path, sink, max_rows=None, max_bytes=None, header=None, path=None):
+        self.logical_path = file_path
+        self.header = header
+        self.file_path = path or output_path(file_path, sink)
+        self.sink = sink
+        self.max_rows = shard_row_cap(sink, max_rows)
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.writer = None
+        self.shard_bytes = 0
+        self.row_count = 0
+
+    def _shard_path(self, number):
+        return f"{self.file_path[:-len(self.sink.extension)]}_part{number:03d}{self.sink.extension}"
+
+    def _finish_shard(self):
+        if self.writer is not None:
+            self.writer.save()
+            self.shards.append((self.writer, self.shard_bytes))
+            self.writer = None
+
+    def _start_shard(self):
+        self._finish_shard()
+        if not self.shards and os.path.dirname(self.file_path):
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)  # A new dataset partition
+        self.writer = self.sink(self._shard_path(len(self.shards) + 1) + ".partial", self.header)
+        self.shard_bytes = 0
+
+    def append(self, row):
+        """Write one row, starting a new shard first if the current one is full."""
+        row_bytes = sum(len(value) for value in row if isinstance(value, str))
+        if (self.writer is None
+                or (self.max_rows and self.writer.row_count >= self.max_rows)
+                or (self.max_bytes and self.writer.row_count and self.shard_bytes + row_bytes > self.max_bytes)):
+            self._start_shard()
+        self.writer.append(row)
+        self.shard_bytes += row_bytes
+        self.row_count += 1
+
+    def save(self):
+        """
+        Finishes the last shard, moves the shards into place and writes the manifest.
+
+        Returns:
+            list[str]: Paths of the shards, in order.
+        """
+        if self.writer is None and not self.shards:
+            self._start_shard()  # An output without rows still gets its (empty) file
+        self._finish_shard()
+
+        if len(self.shards) == 1:
+            paths = [self.file_path]
+        else:
+            paths = [self._shard_path(number) for number in range(1, len(self.shards) + 1)]
+        for (writer, _), path in zip(self.shards, paths):
+            os.replace(writer.file_path, path)
+
+        # Remove shards of an earlier export in this format that are not part of this one. The
+        # manifest may describe another format by now, so the shards are found by name instead
+        base = glob.escape(self.file_path[:-len(self.sink.extension)])
+        stale = set(glob.glob(f"{base}_part[0-9][0-9][0-9]{glob.escape(self.sink.extension)}"))
+        if len(paths) > 1:
+            stale.add(self.file_path)  # Written as a single file before it outgrew the cap
+        for path in stale - set(paths):
+            if os.path.exists(path):
+                os.remove(path)
+
+        manifest = {
+            "output": os.path.basename(self.logical_path),
+            "format": self.sink.extension.lstrip("."),
+            "rows": self.row_count,
+            "max_rows": self.max_rows,
+            "max_bytes": self.max_bytes,
+            "shards": [{"file": os.path.relpath(path, os.path.dirname(os.path.abspath(self.logical_path))),
+                        "rows": writer.row_count, "text_bytes": shard_bytes}
+                       for (writer, shard_bytes), path in zip(self.shards, paths)],
+        }
+        with open(manifest_path(self.logical_path) + ".partial", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path(self.logical_path) + ".partial", manifest_path(self.logical_path))
+        return paths
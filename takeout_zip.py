@@ -0,0 +1,130 @@
+import os
+import re
+import zipfile
+import zlib
+
+
+# Takeout splits big exports into numbered archives: takeout-20241203T172855Z-001.zip, -002.zip, ...
+ARCHIVE_PART_RE = re.compile(r"^(?P<prefix>.+?)-(?P<part>\d{3})\.zip$", re.IGNORECASE)
+
+
+def group_archive_parts(zip_paths):
+    """
+    Groups the parts of multi-part Takeout exports.
+
+    Args:
+        zip_paths (list[str]): Paths of .zip files.
+
+    Returns:
+        dict: Export name -> list of part paths in part order. A zip that is not
+        numbered is its own single-part export.
+    """
+    exports = {}
+    for path in zip_paths:
+        directory, name = os.path.split(path)
+        match = ARCHIVE_PART_RE.match(name)
+        if match:
+            key, part = os.path.join(directory, match.group("prefix")), int(match.group("part"))
+        else:
+            key, part = os.path.splitext(path)[0], 0
+        exports.setdefault(key, []).append((part, path))
+    return {key: [path for _, path in sorted(parts)] for key, parts in exports.items()}
+
+
+def find_mbox_members(part_paths):
+    """
+    Lists the mbox files stored in the parts of one Takeout export.
+
+    Only the zip central directories are read; zip64 archives and members over
+    4 GB are handled by `zipfile`. A member stored in more than one part is
+    treated as one mbox split across those parts, in part order.
+
+    Args:
+        part_paths (list[str]): Paths of the archive parts, in part order.
+
+    Returns:
+        dict: Member name -> list of (part path, ZipInfo) pieces.
+    """
+    members = {}
+    for part_path in part_paths:
+        try:
+            with zipfile.ZipFile(part_path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(".mbox"):
+                        members.setdefault(info.filename, []).append((part_path, info))
+        except zipfile.BadZipFile as e:
+            print(f"ERROR: Could not read {part_path}: {e}")
+    return members
+
+
+def member_size(pieces):
+    """Return the uncompressed size of an mbox member (all pieces)."""
+    return sum(info.file_size for _, info in pieces)
+
+
+def member_fingerprint(pieces):
+    """
+    Fingerprints an mbox member from the zip central directory, without reading it.
+
+    Returns:
+        tuple: (size, mtime, hash) in the same form as `catalog.source_fingerprint`.
+        The mtime is the newest archive part's and the hash combines the CRC-32
+        and size of every piece.
+    """
+    mtime = max(os.path.getmtime(part_path) for part_path, _ in pieces)
+    crc = ":".join(f"{info.CRC:08x}-{info.file_size}" for _, info in pieces)
+    return member_size(pieces), mtime, f"zip:{zlib.crc32(crc.encode()):08x}:{crc}"
+
+
+class MemberStream:
+    """
+    Read-only stream over an mbox member, decompressing it as it is read.
+
+    Pieces stored in several archive parts are read back to back, so callers see
+    a single mbox. Nothing is extracted to disk.
+
+    Args:
+        pieces (list): (part path, ZipInfo) pairs as returned by `find_mbox_members`.
+    """
+
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+        self._archive = None
+        self._member = None
+
+    def _open_next(self):
+        self.close()
+        if not self.pieces:
+            return False
+        part_path, info = self.pieces.pop(0)
+        self._archive = zipfile.ZipFile(part_path)
+        self._member = self._archive.open(info)
+        return True
+
+    def read(self, size=-1):
+        """Read up to `size` bytes (all remaining bytes if `size` is negative)."""
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(1024 * 1024), b""))
+        while True:
+            if self._member is not None:
+                data = self._member.read(size)
+                if data:
+                    return data
+            if not self._open_next():
+                return b""
+
+    def close(self):
+        """Close the member and archive currently being read."""
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.pieces = []
@@ -0,0 +1,95 @@
+"""
+Equivalence tests: DateBucketer against the parsedate_to_datetime conversion it replaced.
+
+Without a timezone, every Date value must come out exactly as
+`parsedate_to_datetime(value).strftime("%Y-%m-%d %H:%M:%S")` did, and as "Unknown"
+where that raised. With a timezone, the same moment is converted to it, dates
+without a zone being taken as UTC.
+"""
+import random
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import pytest
+
+from date_buckets import UNKNOWN_DATE, DateBucketer, resolve_timezone
+
+FUZZ_VALUES = 5000
+FUZZ_SEED = 2024
+TIMEZONES = [None, "UTC", "America/Chicago", "+02:00"]
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+ZONES = ["+0000", "-0500", "+0530", "+1400", "-1200", "+0000 (UTC)", "-0700 (PDT)", "GMT", "UT", "Z", "EST", "EDT",
+         "CST", "pdt", "MSK", "CEST", "-0000", "+2400", "", "(no zone)"]
+
+
+def reference_date(value, tz=None):
+    """The date the converter wrote before DateBucketer, converted to tz when one is given."""
+    try:
+        moment = parsedate_to_datetime(value)
+        if tz is not None:
+            moment = (moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)).astimezone(tz)
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return UNKNOWN_DATE
+
+
+def _random_case(rng, word):
+    return rng.choice([word, word.upper(), word.lower()])
+
+
+def _random_date(rng):
+    if rng.random() < 0.05:
+        return rng.choice(["", "garbage", "Tue, 3 Dec", "3 Dec 2024", "Tue, 32 Dec 2024 10:00:00 +0000",
+                           "Tue, 3 Foo 2024 10:00:00 +0000", "2024-12-03 10:00:00", "Tue,  3 Dec 2024 10:00 -0000",
+                           "Tue, 3 Dec 2024 25:00:00 +0000", "Tue, 3 Dec 2024 10:61:00 +0000"])
+    parts = []
+    if rng.random() < 0.7:
+        parts.append(_random_case(rng, rng.choice(WEEKDAYS)) + rng.choice([",", ", ", " "]))
+    day = rng.randint(1, 31)
+    parts.append(rng.choice([str(day), f"{day:02d}"]))
+    parts.append(" " + _random_case(rng, rng.choice(MONTH_NAMES)))
+    year = rng.randint(1969, 2037)
+    parts.append(" " + rng.choice([str(year), f"{year % 100:02d}"]))
+    time = f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+    if rng.random() < 0.8:
+        time += f":{rng.randint(0, 59):02d}"
+    parts.append(" " + time)
+    zone = rng.choice(ZONES)
+    if zone:
+        parts.append(" " + zone)
+    return rng.choice(["", " "]) + "".join(parts) + rng.choice(["", " ", "\t"])
+
+
+def _fuzzed_dates():
+    rng = random.Random(FUZZ_SEED)
+    return [_random_date(rng) for _ in range(FUZZ_VALUES)]
+
+
+@pytest.mark.parametrize("tz", TIMEZONES)
+def test_fuzzed_dates_match_parsedate_to_datetime(tz):
+    bucketer = DateBucketer(tz)
+    zone = resolve_timezone(tz)
+    for value in _fuzzed_dates():
+        expected = reference_date(value.strip(), zone)
+        month = expected[:7] if expected != UNKNOWN_DATE else UNKNOWN_DATE
+        assert bucketer.bucket(value) == (expected, month), value
+
+
+@pytest.mark.parametrize("value", ["Tue, 3 Dec 2024 10:00:00 +0000", "29 Feb 2024 23:59 -0800", "29 Feb 2023 10:00 +0000",
+                                   "Sat, 31 Dec 99 23:30:00 EST", "Mon, 1 Jan 2024 00:00:00 +0000 (UTC)"])
+@pytest.mark.parametrize("tz", TIMEZONES)
+def test_cached_values_match_parsedate_to_datetime(value, tz):
+    bucketer = DateBucketer(tz)
+    first = bucketer.format_date(value)
+    assert bucketer.format_date(value) == first
+    assert (first or UNKNOWN_DATE) == reference_date(value, resolve_timezone(tz))
+
+
+def test_received_header_and_from_line_fall_back_in_order():
+    bucketer = DateBucketer()
+    received = ["from a by b; garbage", "from c by d; Tue, 3 Dec 2024 10:00:00 +0100"]
+    assert bucketer.bucket("garbage", received) == ("2024-12-03 10:00:00", "2024-12")
+    assert bucketer.bucket(None, None, "From 1@xxx Mon Jan 03 09:00:00 +0000 2022") == ("2022-01-03 09:00:00", "2022-01")
+    assert bucketer.bucket("", ["no date"], "From nobody") == (UNKNOWN_DATE, UNKNOWN_DATE)
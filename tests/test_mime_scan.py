@@ -0,0 +1,216 @@
+"""
+Equivalence tests: the lazy MIME scanner against the email package it replaced.
+
+Every message is parsed both ways and must yield the same parts, in the same
+order, with the same decoded payloads and the same plain text body.
+"""
+import base64
+import email
+import random
+from email.mime.application import MIMEApplication
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from benchmarks.synthetic_mbox import generate_mbox
+from mbox_index import message_spans, scan_message_starts
+from mime_scan import (decode_payload, find_text_body, message_parts, parse_headers, split_raw_message, walk_part_spans,
+                       walk_parts)
+
+FUZZ_MESSAGES = 2000
+FUZZ_SEED = 2024
+HEADERS = ("From: Bob <bob@example.com>\nSubject: door quote\nDate: Tue, 3 Dec 2024 10:00:00 +0000\n"
+           "Message-ID: <x@example.com>\n")
+
+
+def reference_text_body(message):
+    """The body extraction mbox_convert used before the scanner: walk the parsed message."""
+    if not message.is_multipart():
+        return message.get_payload(decode=True)
+    for part in message.walk():
+        if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition", "")):
+            return part.get_payload(decode=True)
+    return None
+
+
+def reference_parts(message):
+    """(content type, headers, decoded payload) of every part, with no payload for container parts."""
+    return [(part.get_content_type(), part.items(), None if part.is_multipart() else part.get_payload(decode=True))
+            for part in message.walk()]
+
+
+def scanned_parts(headers, body):
+    parts = []
+    for part_headers, start, end in walk_part_spans(headers, body):
+        # Parts that hold other parts: message/* and multiparts whose boundary appears
+        container = (part_headers.get_content_maintype() == "message"
+                     or message_parts(part_headers, body[start:end]) is not None)
+        parts.append((part_headers.get_content_type(), part_headers.items(),
+                      None if container else decode_payload(part_headers, body[start:end])))
+    return parts
+
+
+def assert_equivalent(raw):
+    header_block, body = split_raw_message(raw.replace(b"\r\n", b"\n"))
+    message = email.message_from_bytes(header_block + b"\n\n" + body)
+    headers = parse_headers(header_block)
+
+    assert find_text_body(headers, body) == reference_text_body(message)
+    assert [(part_headers.get_content_type(), part_body) for part_headers, part_body in walk_parts(headers, body)] == \
+           [(part_headers.get_content_type(), body[start:end]) for part_headers, start, end in walk_part_spans(headers, body)]
+    assert scanned_parts(headers, body) == reference_parts(message)
+
+
+def _mime(message):
+    for name, value in (("From", "Bob <bob@example.com>"), ("Subject", "door quote"),
+                        ("Date", "Tue, 3 Dec 2024 10:00:00 +0000")):
+        if name not in message:
+            message[name] = value
+    return b"From bob@example.com Tue Dec  3 10:00:00 2024\n" + message.as_bytes()
+
+
+def _crafted_messages():
+    messages = []
+    mixed = MIMEMultipart()
+    mixed.attach(MIMEApplication(bytes(range(256)) * 10, Name="a.bin"))
+    mixed.attach(MIMEText("hello door\n> quoted\nbye"))
+    messages.append(_mime(mixed))
+
+    attached_text = MIMEText("attached text")
+    attached_text.add_header("Content-Disposition", "attachment", filename="x.txt")
+    mixed = MIMEMultipart()
+    mixed.attach(attached_text)
+    mixed.attach(MIMEText("real body", "plain", "utf-8"))
+    messages.append(_mime(mixed))
+
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText("<b>x</b>", "html"))
+    alternative.attach(MIMEText("café nested", "plain", "latin-1"))
+    mixed = MIMEMultipart()
+    mixed.attach(alternative)
+    messages.append(_mime(mixed))
+
+    forwarded = MIMEText("forwarded body")
+    forwarded["Subject"] = "fw"
+    mixed = MIMEMultipart()
+    mixed.attach(MIMEApplication(b"zz"))
+    mixed.attach(MIMEMessage(forwarded))
+    messages.append(_mime(mixed))
+
+    mixed = MIMEMultipart()
+    mixed.attach(MIMEText("only html", "html"))
+    messages.append(_mime(mixed))
+    messages.append(_mime(MIMEText("quoted printable =C3=A9 long line " * 5, "plain", "utf-8")))
+
+    raw_messages = [
+        HEADERS + "Content-Type: text/plain\nContent-Transfer-Encoding: quoted-printable\n\nsoft=\nbreak caf=C3=A9\n",
+        HEADERS + "Content-Type: multipart/mixed\n\nno boundary body\n",
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\nnever appears\n',
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\npreamble\n--B\nContent-Type: text/plain\n\nunterminated\nline2\n',
+        (HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\n--B\n\nno headers part\n--B--  \nepilogue\n').replace("\n", "\r\n"),
+        HEADERS + 'Content-Type: multipart/digest; boundary="D"\n\n--D\n\nSubject: in\n\ndigest body\n--D--\n',
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\n--B\nContent-Type: text/plain\n\n\n--B--\n',
+        HEADERS + "Content-Transfer-Encoding: base64\n\n" + base64.b64encode(b"b64 body door").decode() + "\n",
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\n--B-not\n--Bx\n--B\n\nbody after look-alikes\n--B--\n',
+        HEADERS + 'Content-Type: multipart/report; boundary="R"\n\n--R\nContent-Type: text/html\n\n<p>bounced</p>\n'
+                  '--R\nContent-Type: message/delivery-status\n\nReporting-MTA: dns; mx.example.com\n\n'
+                  'Final-Recipient: rfc822; a@example.com\nStatus: 5.1.1\n\n--R--\n',
+        HEADERS + "Content-Type: message/rfc822\n\nSubject: forwarded\n\nforwarded as the whole message\n",
+        HEADERS + "Content-Type: message/global\n\nSubject: inner\nContent-Type: text/plain\n\nglobal body\n",
+        HEADERS + "Content-Type: text/plain\nnot a header, so the body starts here\n\nmore body\n",
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\nonly a preamble\n--B--\n--B\n\nafter the close\n',
+        HEADERS + 'Content-Type: multipart/mixed; boundary="B"\n\n--B\nContent-Type: message/rfc822\n\n'
+                  'headerless forwarded text\n--B\nContent-Type: multipart/mixed; boundary="C"\n--B--\n',
+    ]
+    messages.extend(b"From x\n" + message.encode() for message in raw_messages)
+    messages.append(b"From x\n" + (HEADERS + "Content-Type: text/plain; charset=latin-1\n\n").encode() +
+                    "8bit café".encode("latin-1"))
+    return messages
+
+
+def _random_part(rng, depth):
+    kind = rng.choice(["text", "html", "attachment", "attached_text", "multipart", "message", "headerless",
+                       "delivery_status"] if depth < 3 else ["text", "html", "attachment", "headerless"])
+    if kind == "multipart":
+        boundary = rng.choice(["B", "==b%d==" % depth, "x-y_z%d" % rng.randrange(100), "sep.%d" % depth])
+        subtype = rng.choice(["mixed", "alternative", "related", "digest"])
+        parts = [_random_part(rng, depth + 1) for _ in range(rng.randrange(0, 4))]
+        lines = [f'Content-Type: multipart/{subtype}; boundary="{boundary}"', ""]
+        if rng.random() < 0.3:
+            lines.append("preamble text")
+        for part in parts:
+            lines.append(f"--{boundary}" + rng.choice(["", "", "  ", "\t"]))
+            lines.append(part)
+        if rng.random() < 0.8:
+            lines.append(f"--{boundary}--" + rng.choice(["", " "]))
+            if rng.random() < 0.3:
+                lines.append("epilogue text")
+        return "\n".join(lines)
+    if kind == "message":
+        return f"Content-Type: message/{rng.choice(['rfc822', 'global'])}\n\nSubject: inner\n" + _random_part(rng, depth + 1)
+    if kind == "delivery_status":
+        blocks = ["Reporting-MTA: dns; mx.example.com", "Final-Recipient: rfc822; a@example.com\nStatus: 5.1.1", ""]
+        return "Content-Type: message/delivery-status\n\n" + "\n\n".join(rng.sample(blocks, rng.randrange(1, 4)))
+    if kind == "headerless":
+        return "\nheaderless part text"
+    encoding = rng.choice(["7bit", "quoted-printable", "base64"])
+    content = rng.choice(["door hinge", "café line", "line one\nline two", "", "--B inside text"])
+    if encoding == "base64":
+        payload = base64.b64encode(content.encode()).decode()
+    elif encoding == "quoted-printable":
+        payload = content.replace("é", "=C3=A9") + rng.choice(["", "=\nsoft"])
+    else:
+        payload = content
+    content_type = {"text": "text/plain", "attached_text": "text/plain", "html": "text/html",
+                    "attachment": "application/octet-stream"}[kind]
+    headers = [f"Content-Type: {content_type}; charset=utf-8", f"Content-Transfer-Encoding: {encoding}"]
+    if kind in ("attachment", "attached_text"):
+        headers.append('Content-Disposition: attachment; filename="f.bin"')
+    return "\n".join(headers) + "\n\n" + payload
+
+
+def _fuzzed_messages():
+    rng = random.Random(FUZZ_SEED)
+    messages = []
+    for _ in range(FUZZ_MESSAGES):
+        raw = ("From x\n" + HEADERS + _random_part(rng, 0) + "\n").encode()
+        messages.append(raw.replace(b"\n", b"\r\n") if rng.random() < 0.1 else raw)
+    return messages
+
+
+@pytest.mark.parametrize("raw", _crafted_messages())
+def test_crafted_messages_match_email_package(raw):
+    assert_equivalent(raw)
+
+
+def test_fuzzed_structures_match_email_package():
+    for raw in _fuzzed_messages():
+        assert_equivalent(raw)
+
+
+def test_synthetic_mailbox_matches_email_package(tmp_path):
+    mbox_file = str(tmp_path / "synthetic.mbox")
+    generate_mbox(mbox_file, messages=300)
+    with open(mbox_file, 'rb') as f:
+        data = f.read()
+    for start, length in message_spans(scan_message_starts(data), len(data)):
+        assert_equivalent(data[start:start + length])
+
+
+def test_walk_part_spans_offsets_are_within_the_message_body():
+    body = b'--B\nContent-Type: text/plain\n\nfirst\n--B\nContent-Type: text/html\n\n<p>second</p>\n--B--\n'
+    headers = parse_headers(b'Content-Type: multipart/alternative; boundary="B"')
+    spans = [(part_headers.get_content_type(), body[start:end])
+             for part_headers, start, end in walk_part_spans(headers, body)]
+    assert spans == [("multipart/alternative", body), ("text/plain", b"first"), ("text/html", b"<p>second</p>")]
+
+
+def test_walk_part_spans_respects_start_and_end():
+    inner = b'--B\nContent-Type: text/plain\n\nonly this\n--B--\n'
+    buffer = b"x" * 10 + inner + b"y" * 10
+    headers = parse_headers(b'Content-Type: multipart/mixed; boundary="B"')
+    spans = list(walk_part_spans(headers, buffer, 10, 10 + len(inner)))
+    assert [(part_headers.get_content_type(), buffer[start:end]) for part_headers, start, end in spans] == \
+           [("multipart/mixed", inner), ("text/plain", b"only this")]